@@ -4,23 +4,55 @@ import gradio as gr
 import pandas as pd
 from datetime import date, datetime, timedelta
 import re # Retaining re
+import json
+import threading
+import time
 
 from auth_utils import (
     is_valid_email, # Though not directly used by app.py event handlers, useful if UI logic needs it
     signup_user,
     login_user,
     logout_user,
+    refresh_user_session,
     get_user_role
 )
 from db_utils import (
     get_supabase_client,
     get_supabase_init_error,
+    get_supabase_admin_client,
+    get_supabase_auth_client,
     fetch_equipments,
     process_rental_request,
+    validate_rental_request,
+    fetch_booked_units,
+    commit_rental_batch,
+    fetch_schedule_inputs,
+    commit_schedule_plan,
     fetch_all_equipments_admin, # Renamed in db_utils
     add_equipment_admin,       # Renamed in db_utils
     update_equipment_admin,     # Renamed in db_utils
-    fetch_all_rental_details
+    fetch_all_rental_details,
+    fetch_newly_overdue_rentals,
+    mark_rentals_overdue,
+    refresh_available_quantities,
+    count_overdue_rentals,
+    get_event_log
+)
+from bulk_provisioning import provision_users
+from batch_scheduler import parse_plan_text, allocate_plan
+from overdue_scanner import OverdueScanner, ConsoleReminderSender, FileReminderSender
+from rental_journal import RentalJournal, STATUS_PENDING
+from snapshot_store import (
+    make_snapshot_ref,
+    resolve_snapshot_ref
+)
+from handler_profiler import get_handler_profiler, profiled
+from backend_calls import backend_read
+from session_store import (
+    create_session_store,
+    SharedCache,
+    serialize_user_session,
+    deserialize_user_session
 )
 # Load dotenv here if ADMIN_EMAIL is the only thing needed from .env in app.py
 # If db_utils already loads it, it might not be necessary here unless for other env vars.
@@ -30,13 +62,115 @@ load_dotenv() # Ensure ADMIN_EMAIL is loaded
 
 ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL")
 supabase_client = get_supabase_client()
+supabase_auth_client = get_supabase_auth_client()
 supabase_init_error = get_supabase_init_error()
 departments = ["물리과", "화학과", "IT과", "공과대학", "공용"] # Departments for dropdowns
 
+# Per-session state (login, selections, snapshot references) lives in an external store keyed by
+# Gradio's session hash instead of gr.State, so any worker process can serve any event of a session.
+# SESSION_STORE_URL: "memory://" (default, single process) or "sqlite:///sessions.db" (shared by workers).
+SESSION_STORE_URL = os.environ.get("SESSION_STORE_URL")
+# Fernet key for the stored session tokens (shared by all workers); see session_store.SQLiteSessionStore.
+session_store = create_session_store(SESSION_STORE_URL, encryption_key=os.environ.get("SESSION_ENCRYPTION_KEY"))
+# Worker-local caches of shared data; any worker that changes the data bumps the topic version.
+TOPIC_EQUIPMENTS = "equipments"
+TOPIC_RENTALS = "rentals"
+shared_cache = SharedCache(session_store)
+
+# On-demand handler profiling, toggled from the admin tab. The setting is kept in session_store's
+# settings (not subject to the session TTL) so every worker picks it up (see HandlerProfiler.configure);
+# output goes to PROFILE_OUTPUT_DIR.
+PROFILING_CONFIG_SETTING = "profiling"
+get_handler_profiler().configure(
+    output_dir=os.environ.get("PROFILE_OUTPUT_DIR", "profiles"),
+    config_loader=lambda: session_store.get_setting(PROFILING_CONFIG_SETTING)
+)
+
+# Optional write-behind journal: when RENTAL_JOURNAL_PATH is set, rentals are acknowledged from a local
+# SQLite journal and committed to Supabase in the background instead of waiting on the database.
+RENTAL_JOURNAL_PATH = os.environ.get("RENTAL_JOURNAL_PATH")
+rental_journal = RentalJournal(
+    RENTAL_JOURNAL_PATH, commit_rental_batch, fetch_booked_units,
+    cache_version=lambda: session_store.get_version(TOPIC_RENTALS),
+    on_committed=lambda: shared_cache.invalidate(TOPIC_RENTALS, TOPIC_EQUIPMENTS)
+) if RENTAL_JOURNAL_PATH else None
+
+# Optional overdue scanner: set OVERDUE_SCAN_INTERVAL_MINUTES to flip past-due rentals to 'overdue' periodically.
+# Reminders go to OVERDUE_REMINDER_LOG_PATH (JSON lines) when set, otherwise to the console.
+OVERDUE_SCAN_INTERVAL_MINUTES = os.environ.get("OVERDUE_SCAN_INTERVAL_MINUTES")
+OVERDUE_REMINDER_LOG_PATH = os.environ.get("OVERDUE_REMINDER_LOG_PATH")
+
+def _mark_rentals_overdue_and_invalidate(rental_ids: list) -> int:
+    marked = mark_rentals_overdue(rental_ids)
+    if marked:
+        shared_cache.invalidate(TOPIC_RENTALS, TOPIC_EQUIPMENTS)
+    return marked
+
+overdue_scanner = OverdueScanner(
+    fetch_newly_overdue_rentals, _mark_rentals_overdue_and_invalidate,
+    FileReminderSender(OVERDUE_REMINDER_LOG_PATH) if OVERDUE_REMINDER_LOG_PATH else ConsoleReminderSender(),
+    os.environ.get("OVERDUE_SCANNER_STATE_PATH", "overdue_scanner_state.json")
+) if OVERDUE_SCAN_INTERVAL_MINUTES else None
+
+# --- Session State ---
+# Keys kept per session in session_store: "user_session" (serialized Supabase session),
+# "selected_equipment_ids", "pending_rental_keys", "edit_selection" and the snapshot
+# references "search_ref", "admin_ref", "rentals_ref".
+
+def _session_id(request: gr.Request) -> str:
+    # No shared fallback id: every request without a session hash would read and write one stored
+    # session, including the signed-in user's tokens.
+    if not request or not request.session_hash:
+        raise gr.Error("세션 정보를 확인할 수 없습니다. 페이지를 새로고침한 뒤 다시 시도하세요.")
+    return request.session_hash
+
+def _get_state(request: gr.Request, key: str, default: any = None) -> any:
+    return session_store.get(_session_id(request), key, default)
+
+def _set_state(request: gr.Request, **values) -> None:
+    session_store.set(_session_id(request), **values)
+
+# Sessions are refreshed this long before the access token expires, so the token a handler sends
+# to the database (db_utils.get_user_client) is still valid when the request arrives.
+SESSION_REFRESH_MARGIN_SECONDS = 60
+
+def _get_user_session(request: gr.Request) -> any:
+    sess = deserialize_user_session(_get_state(request, "user_session"))
+    if not sess or not sess.expires_at or sess.expires_at - time.time() >= SESSION_REFRESH_MARGIN_SECONDS:
+        return sess
+    refreshed, msg = refresh_user_session(supabase_auth_client, sess)
+    if refreshed is sess: # Auth backend unreachable; the current token may still be accepted
+        return sess
+    if refreshed is None:
+        print(f"Signing out session {_session_id(request)}: {msg}")
+    data = serialize_user_session(refreshed)
+    _set_state(request, user_session=data)
+    return deserialize_user_session(data)
+
+def _reload_search(view: dict) -> pd.DataFrame:
+    return fetch_equipments(view.get("department"), view.get("query"))[0]
+
+def _reload_admin_equipments(view: dict) -> pd.DataFrame:
+    return fetch_all_equipments_admin()[0]
+
+def handle_session_end(request: gr.Request) -> None:
+    session_store.delete_session(_session_id(request))
+
 # --- Gradio Event Handlers ---
 
 # Search Tab
-def df_select_for_rental(df_state_val: pd.DataFrame, evt: gr.SelectData) -> tuple:
+@profiled
+def handle_search_equipments(dept: str, query: str, request: gr.Request) -> tuple:
+    df, msg = fetch_equipments(dept, query)
+    ref = make_snapshot_ref("search", df, department=dept, query=query)
+    _set_state(request, search_ref=ref)
+    return resolve_snapshot_ref(ref), msg
+
+@profiled
+def df_select_for_rental(evt: gr.SelectData, request: gr.Request) -> tuple:
+    df_state_val = resolve_snapshot_ref(_get_state(request, "search_ref"), _reload_search)
+    sel_ids = []
+    result = ("선택된 장비 없음.", gr.update(interactive=False))
     if evt.selected and df_state_val is not None and not df_state_val.empty:
         row_idx = evt.index[0]
         if 0 <= row_idx < len(df_state_val):
@@ -44,26 +178,33 @@ def df_select_for_rental(df_state_val: pd.DataFrame, evt: gr.SelectData) -> tupl
             sel_name = df_state_val.iloc[row_idx]['장비명 (Name)']
             avail_qty = int(df_state_val.iloc[row_idx]['대여 가능 수량 (Available)'])
             if avail_qty > 0:
-                return f"선택: {sel_name} (ID: {sel_id}, 잔여: {avail_qty})", [sel_id], gr.update(interactive=True)
+                sel_ids = [sel_id]
+                result = (f"선택: {sel_name} (ID: {sel_id}, 잔여: {avail_qty})", gr.update(interactive=True))
             else:
-                return f"{sel_name} (ID: {sel_id}) 대여 불가 (잔여:0).", [], gr.update(interactive=False)
-    return "선택된 장비 없음.", [], gr.update(interactive=False)
+                result = (f"{sel_name} (ID: {sel_id}) 대여 불가 (잔여:0).", gr.update(interactive=False))
+    elif df_state_val is None and _get_state(request, "search_ref"):
+        result = ("조회 결과가 변경되었습니다. 다시 조회해 주세요.", gr.update(interactive=False))
+    _set_state(request, selected_equipment_ids=sel_ids)
+    return result + (update_rental_selected_display(sel_ids),)
 
-def handle_request_rental_navigation(sel_ids: list, user_sess: any, current_tabs: gr.Tabs) -> gr.Tabs:
-    if user_sess and sel_ids:
+def handle_request_rental_navigation(request: gr.Request) -> gr.Tabs:
+    if _get_user_session(request) and _get_state(request, "selected_equipment_ids"):
         return gr.Tabs(selected="rental_tab")
     else:
         gr.Warning("로그인 및 장비 선택 필요")
-        return current_tabs
+        return gr.update()
 
 # Rental Tab
+def _load_equipment_detail(equipment_id: str) -> dict:
+    return backend_read("rental.equipment_detail", supabase_client.table("equipments").select("id, name, department, available_quantity").eq("id", equipment_id).single()).data
+
 def update_rental_selected_display(sel_ids: list) -> str:
     if sel_ids and supabase_client:
         try:
             # Ensure sel_ids[0] is used, as it's a list of one item
-            response = supabase_client.table("equipments").select("id, name, department, available_quantity").eq("id", sel_ids[0]).single().execute()
-            if response.data:
-                return f"ID: {response.data['id']}\n이름: {response.data['name']}\n부서: {response.data['department']}\n대여 가능: {response.data['available_quantity']}"
+            data = shared_cache.get_or_load(TOPIC_EQUIPMENTS, ("detail", sel_ids[0]), lambda: _load_equipment_detail(sel_ids[0]), cache_if=bool)
+            if data:
+                return f"ID: {data['id']}\n이름: {data['name']}\n부서: {data['department']}\n대여 가능: {data['available_quantity']}"
             else:
                 return "선택된 장비 정보를 찾을 수 없습니다."
         except Exception as e:
@@ -71,75 +212,286 @@ def update_rental_selected_display(sel_ids: list) -> str:
             return "장비 정보 조회 중 오류 발생."
     return "장비 선택 필요"
 
+@profiled
+def handle_rental_submission(start_date_str: str, end_date_str: str, borrower: str, purpose: str, request: gr.Request) -> tuple:
+    sel_ids = _get_state(request, "selected_equipment_ids", [])
+    user_sess = _get_user_session(request)
+    pending_keys = _get_state(request, "pending_rental_keys", [])
+    if not rental_journal:
+        msg, out_ids = process_rental_request(sel_ids, start_date_str, end_date_str, borrower, purpose, user_sess)
+        if "성공" in msg:
+            shared_cache.invalidate(TOPIC_RENTALS, TOPIC_EQUIPMENTS)
+        _set_state(request, selected_equipment_ids=out_ids)
+        return msg, gr.Timer(active=False), update_rental_selected_display(out_ids)
+    validation_error, rental_data = validate_rental_request(sel_ids, start_date_str, end_date_str, borrower, purpose, user_sess)
+    if validation_error:
+        return validation_error, gr.Timer(active=bool(pending_keys)), gr.update()
+    key, msg = rental_journal.submit(rental_data)
+    if key is None:
+        return msg, gr.Timer(active=bool(pending_keys)), gr.update()
+    if key not in pending_keys:
+        pending_keys.append(key)
+    _set_state(request, selected_equipment_ids=[], pending_rental_keys=pending_keys)
+    return msg, gr.Timer(active=True), update_rental_selected_display([])
+
+def poll_rental_outcomes(request: gr.Request) -> tuple:
+    pending_keys = _get_state(request, "pending_rental_keys", [])
+    if not rental_journal or not pending_keys:
+        return gr.update(), gr.Timer(active=False)
+    still_pending, final_messages = [], []
+    for key in pending_keys:
+        status, message = rental_journal.get_outcome(key)
+        if status == STATUS_PENDING:
+            still_pending.append(key)
+        else:
+            final_messages.append(message)
+            if "성공" in message:
+                gr.Info(message)
+            else:
+                gr.Warning(message)
+    if final_messages:
+        _set_state(request, pending_rental_keys=still_pending)
+    status_text = "\n".join(final_messages) if final_messages else gr.update()
+    return status_text, gr.Timer(active=bool(still_pending))
+
+# Semester Schedule Tab
+SCHEDULE_RESULT_COLUMNS = ['상태', '요청 번호', '대상', '배정 장비', '수량', '시작일', '종료일', '비고']
+
+def _solve_schedule_plan(plan_text: str) -> tuple:
+    plan, errors = parse_plan_text(plan_text, departments)
+    if errors:
+        return None, "오류: " + "\n".join(errors)
+    if not plan:
+        return None, "오류: 예약 계획을 한 줄 이상 입력해야 합니다."
+    all_dates = [d for req in plan for date_range in req['ranges'] for d in date_range]
+    if min(all_dates) < date.today():
+        return None, "오류: 대여 시작일은 오늘 또는 그 이후여야 합니다."
+    try:
+        equipments, booked = fetch_schedule_inputs(min(all_dates).isoformat(), max(all_dates).isoformat())
+    except Exception as e:
+        print(f"Error loading schedule inputs: {e}")
+        return None, f"장비/대여 현황 조회 중 오류 발생: {str(e)}"
+    return allocate_plan(plan, equipments, booked), ""
+
+def _schedule_result_df(result: dict) -> pd.DataFrame:
+    rows = []
+    for row in result['accepted']:
+        rows.append(["배정", row['request_index'] + 1, row['target'], row['equipment_id'], row['units'], row['start_date'], row['end_date'], "대체 장비" if row['substitute'] else ""])
+    for row in result['rejected']:
+        rows.append(["실패", row['request_index'] + 1, row['target'], "", row['quantity'], row['start_date'], row['end_date'], row['reason']])
+    return pd.DataFrame(rows, columns=SCHEDULE_RESULT_COLUMNS)
+
+@profiled
+def handle_preview_schedule(plan_text: str) -> tuple:
+    result, error = _solve_schedule_plan(plan_text)
+    if error:
+        return pd.DataFrame(columns=SCHEDULE_RESULT_COLUMNS), error
+    substitutes = sum(1 for row in result['accepted'] if row['substitute'])
+    return _schedule_result_df(result), f"배정 {len(result['accepted'])}건 (대체 장비 {substitutes}건), 배정 실패 {len(result['rejected'])}건. 확정하려면 '일괄 예약 확정'을 누르세요."
+
+@profiled
+def handle_commit_schedule(plan_text: str, borrower: str, purpose: str, request: gr.Request) -> tuple:
+    user_sess = _get_user_session(request)
+    if not user_sess:
+        return gr.update(), "오류: 로그인이 필요합니다."
+    # Re-solve against fresh availability so the committed plan reflects rentals made since the preview.
+    result, error = _solve_schedule_plan(plan_text)
+    if error:
+        return pd.DataFrame(columns=SCHEDULE_RESULT_COLUMNS), error
+    msg, inserted = commit_schedule_plan(result['accepted'], borrower, purpose, user_sess)
+    if inserted:
+        shared_cache.invalidate(TOPIC_RENTALS, TOPIC_EQUIPMENTS)
+        gr.Info(msg)
+        if result['rejected']:
+            msg += f" 배정 실패 {len(result['rejected'])}건은 저장되지 않았습니다."
+    else:
+        gr.Error(msg)
+    return _schedule_result_df(result), msg
+
 # Admin Tab
 def handle_fetch_all_equip_admin(user_sess: any) -> tuple[pd.DataFrame, str]:
     if get_user_role(user_sess, ADMIN_EMAIL) != 'admin':
         return pd.DataFrame(columns=['ID', '장비명', '부서', '총량', '가용량']), "관리자 권한이 필요합니다."
     return fetch_all_equipments_admin()
 
-def admin_df_select_for_edit(df_admin_data: pd.DataFrame, evt: gr.SelectData) -> tuple:
+def _refresh_admin_equip_list(user_sess: any, request: gr.Request) -> tuple:
+    df, msg = handle_fetch_all_equip_admin(user_sess)
+    ref = make_snapshot_ref("admin_equipments", df)
+    _set_state(request, admin_ref=ref)
+    return resolve_snapshot_ref(ref), msg
+
+@profiled
+def handle_refresh_admin_equip_list(request: gr.Request) -> tuple:
+    return _refresh_admin_equip_list(_get_user_session(request), request)
+
+@profiled
+def admin_df_select_for_edit(evt: gr.SelectData, request: gr.Request) -> tuple:
+    df_admin_data = resolve_snapshot_ref(_get_state(request, "admin_ref"), _reload_admin_equipments)
     if evt.selected and df_admin_data is not None and not df_admin_data.empty:
         row_idx = evt.index[0]
         if 0 <= row_idx < len(df_admin_data):
-            sel_row = df_admin_data.iloc[row_idx].to_dict()
+            sel_row = {k: (v.item() if hasattr(v, "item") else v) for k, v in df_admin_data.iloc[row_idx].to_dict().items()}
+            _set_state(request, edit_selection=sel_row)
             gr.Info(f"{sel_row['장비명']} (ID: {sel_row['ID']}) 선택됨. 수정 탭에서 정보 확인.")
-            return sel_row, sel_row['ID'], sel_row['장비명'], sel_row['부서'], str(sel_row['총량']), gr.Tabs(selected="admin_add_edit_tab")
-    return None, None, None, None, None, gr.Tabs() # Return empty Tabs to avoid error, or current state
+            return sel_row['ID'], sel_row['장비명'], sel_row['부서'], str(sel_row['총량']), gr.Tabs(selected="admin_add_edit_tab")
+    _set_state(request, edit_selection=None)
+    return None, None, None, None, gr.Tabs() # Return empty Tabs to avoid error, or current state
 
-def add_equip_refresh_list(eq_id: str, name: str, dept: str, qty_str: str, sess: any, current_admin_df: pd.DataFrame) -> tuple:
+# On failure the admin table is left untouched (gr.update()) so it is not re-serialized.
+@profiled
+def add_equip_refresh_list(eq_id: str, name: str, dept: str, qty_str: str, request: gr.Request) -> tuple:
+    sess = _get_user_session(request)
     if get_user_role(sess, ADMIN_EMAIL) != 'admin':
-        return "관리자 권한 필요.", eq_id, name, dept, qty_str, current_admin_df
-    feedback, out_id, out_name, out_dept, out_qty = add_equipment_admin(eq_id, name, dept, qty_str)
+        return "관리자 권한 필요.", eq_id, name, dept, qty_str, gr.update()
+    feedback, out_id, out_name, out_dept, out_qty = add_equipment_admin(eq_id, name, dept, qty_str, user_session=sess)
     if "성공" in feedback:
+        shared_cache.invalidate(TOPIC_EQUIPMENTS)
         gr.Info(feedback)
-        df_new, msg = handle_fetch_all_equip_admin(sess)
+        df_new, msg = _refresh_admin_equip_list(sess, request)
         return feedback, out_id, out_name, out_dept, out_qty, df_new
     else:
         gr.Error(feedback)
-        return feedback, out_id, out_name, out_dept, out_qty, current_admin_df
+        return feedback, out_id, out_name, out_dept, out_qty, gr.update()
 
-def update_equip_refresh_list(sel_state: dict, new_id: str, name: str, dept: str, new_qty_str: str, sess: any, current_admin_df: pd.DataFrame) -> tuple:
+@profiled
+def update_equip_refresh_list(new_id: str, name: str, dept: str, new_qty_str: str, request: gr.Request) -> tuple:
+    sess = _get_user_session(request)
     if get_user_role(sess, ADMIN_EMAIL) != 'admin':
-        return "관리자 권한 필요.", sel_state, new_id, name, dept, new_qty_str, current_admin_df
-    feedback, out_sel_state, out_id, out_name, out_dept, out_qty = update_equipment_admin(sel_state, new_id, name, dept, new_qty_str)
+        return "관리자 권한 필요.", new_id, name, dept, new_qty_str, gr.update()
+    sel_state = _get_state(request, "edit_selection")
+    feedback, out_sel_state, out_id, out_name, out_dept, out_qty = update_equipment_admin(sel_state, new_id, name, dept, new_qty_str, user_session=sess)
+    _set_state(request, edit_selection=out_sel_state)
     if "성공" in feedback:
+        shared_cache.invalidate(TOPIC_EQUIPMENTS)
         gr.Info(feedback)
-        df_new, msg = handle_fetch_all_equip_admin(sess)
-        return feedback, out_sel_state, out_id, out_name, out_dept, out_qty, df_new
+        df_new, msg = _refresh_admin_equip_list(sess, request)
+        return feedback, out_id, out_name, out_dept, out_qty, df_new
     else:
         gr.Error(feedback)
-        return feedback, out_sel_state, out_id, out_name, out_dept, out_qty, current_admin_df
+        return feedback, out_id, out_name, out_dept, out_qty, gr.update()
+
+PROVISIONING_REPORT_COLUMNS = ['행 (Row)', '이메일 (Email)', '결과 (Status)', '메시지 (Message)', '시도 횟수 (Attempts)']
+
+def handle_bulk_provisioning(csv_file_path: str, request: gr.Request) -> tuple:
+    empty_df = pd.DataFrame(columns=PROVISIONING_REPORT_COLUMNS)
+    if get_user_role(_get_user_session(request), ADMIN_EMAIL) != 'admin':
+        return empty_df, "관리자 권한 필요."
+    if not csv_file_path:
+        return empty_df, "CSV 파일을 업로드하세요."
+    admin_client = get_supabase_admin_client()
+    if not admin_client:
+        return empty_df, "SUPABASE_SERVICE_ROLE_KEY 환경 변수가 설정되지 않아 사용자 일괄 등록을 할 수 없습니다."
+    try:
+        with open(csv_file_path, "r", encoding="utf-8-sig") as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return empty_df, f"CSV 파일을 읽을 수 없습니다: {str(e)}"
+    report, stats = provision_users(admin_client, content)
+    df = pd.DataFrame([[r['row'], r['email'], r['status'], r['message'], r['attempts']] for r in report], columns=PROVISIONING_REPORT_COLUMNS)
+    summary = (f"전체 {stats['total']}건: 생성 {stats['created']}, 초대 {stats['invited']}, 기존 사용자 {stats['exists']}, "
+               f"형식 오류 {stats['invalid']}, 중복 {stats['duplicate']}, 실패 {stats['failed']} "
+               f"({stats['elapsed_seconds']}초, {stats['rows_per_second']}건/초)")
+    gr.Info(summary)
+    return df, summary
+
+PROFILING_SUMMARY_COLUMNS = ['핸들러 (Handler)', '샘플 수 (Count)', '전체 (ms)', '네트워크 대기 (ms)', 'DataFrame 생성 (ms)', '직렬화 (ms)', '기타 (ms)']
+
+def _profiling_summary_df() -> pd.DataFrame:
+    rows = [[r['handler'], r['count'], r['wall_ms'], r['network_ms'], r['dataframe_ms'], r['serialization_ms'], r['other_ms']]
+            for r in get_handler_profiler().summary()]
+    return pd.DataFrame(rows, columns=PROFILING_SUMMARY_COLUMNS)
+
+def handle_profiling_settings(enabled: bool, sample_rate: float, request: gr.Request) -> tuple:
+    if get_user_role(_get_user_session(request), ADMIN_EMAIL) != 'admin':
+        return "관리자 권한 필요.", gr.update()
+    config = {"enabled": bool(enabled), "sample_rate": float(sample_rate)}
+    session_store.set_setting(PROFILING_CONFIG_SETTING, config)
+    profiler = get_handler_profiler()
+    profiler.set_enabled(config["enabled"], config["sample_rate"]) # Other workers follow within a few seconds
+    if not config["enabled"]:
+        return "프로파일링이 꺼졌습니다.", _profiling_summary_df()
+    return f"프로파일링 켜짐: 핸들러 호출의 {config['sample_rate']:.0%}를 샘플링합니다. 결과 파일: {os.path.abspath(profiler.output_dir)}", _profiling_summary_df()
 
-def clear_admin_form_fields_action() -> tuple:
-    return None, "", "", "공용", "", "입력 필드가 초기화되었습니다."
+def handle_profiling_summary(request: gr.Request) -> tuple:
+    if get_user_role(_get_user_session(request), ADMIN_EMAIL) != 'admin':
+        return "관리자 권한 필요.", gr.update()
+    df = _profiling_summary_df()
+    return (f"이 워커에서 샘플링된 핸들러 {len(df)}개의 평균 시간입니다." if not df.empty else "아직 샘플링된 호출이 없습니다."), df
+
+HISTORY_ON_LOAN_COLUMNS = ['대여 ID', '장비 ID', '장비명', '대여자', '시작일', '종료일', '상태']
+HISTORY_EVENT_COLUMNS = ['순번 (Seq)', '시각', '이벤트', '작업자', '내용']
+
+def handle_history_on_loan(day_str: str, request: gr.Request) -> tuple:
+    empty_df = pd.DataFrame(columns=HISTORY_ON_LOAN_COLUMNS)
+    if get_user_role(_get_user_session(request), ADMIN_EMAIL) != 'admin':
+        return empty_df, "관리자 권한 필요."
+    event_log = get_event_log()
+    if not event_log:
+        return empty_df, "이벤트 로그가 비활성화되어 있습니다 (EVENT_LOG_ENABLED, SUPABASE_SERVICE_ROLE_KEY 필요)."
+    try:
+        day = datetime.strptime((day_str or "").strip(), "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        return empty_df, "날짜 형식 오류 (YYYY-MM-DD)."
+    try:
+        rows = event_log.on_loan_at(day)
+    except Exception as e:
+        return empty_df, f"이력 조회 오류: {str(e)}"
+    df = pd.DataFrame([[r['rental_id'], r['equipment_id'], r['equipment_name'], r['borrower_name'], r['start_date'], r['end_date'], r['status']] for r in rows], columns=HISTORY_ON_LOAN_COLUMNS)
+    return df, f"{day} 기준 대여 중이던 항목 {len(df)}건."
+
+def handle_history_equipment(eq_id: str, request: gr.Request) -> tuple:
+    empty_df = pd.DataFrame(columns=HISTORY_EVENT_COLUMNS)
+    if get_user_role(_get_user_session(request), ADMIN_EMAIL) != 'admin':
+        return empty_df, "관리자 권한 필요."
+    event_log = get_event_log()
+    if not event_log:
+        return empty_df, "이벤트 로그가 비활성화되어 있습니다 (EVENT_LOG_ENABLED, SUPABASE_SERVICE_ROLE_KEY 필요)."
+    if not eq_id or not eq_id.strip():
+        return empty_df, "장비 ID를 입력하세요."
+    try:
+        events = event_log.equipment_history(eq_id.strip().upper())
+    except Exception as e:
+        return empty_df, f"이력 조회 오류: {str(e)}"
+    df = pd.DataFrame([[e['seq'], e['occurred_at'], e['event_type'], e['actor'], json.dumps(e['payload'], ensure_ascii=False)] for e in events], columns=HISTORY_EVENT_COLUMNS)
+    return df, f"장비 '{eq_id.strip().upper()}' 변경 이력 {len(df)}건 (최신순)."
+
+def clear_admin_form_fields_action(request: gr.Request) -> tuple:
+    _set_state(request, edit_selection=None)
+    return "", "", "공용", "", "입력 필드가 초기화되었습니다."
 
 # Auth Tab
 def handle_signup_action(email: str, pw: str, conf_pw: str) -> str:
-    return signup_user(supabase_client, email, pw, conf_pw)
+    return signup_user(supabase_auth_client, email, pw, conf_pw)
 
-def handle_login_ui_updates(email: str, pw: str, current_admin_df: pd.DataFrame) -> tuple:
-    sess_data, msg = login_user(supabase_client, email, pw)
+@profiled
+def handle_login_ui_updates(email: str, pw: str, request: gr.Request) -> tuple:
+    sess_data, msg = login_user(supabase_auth_client, email, pw)
     role = get_user_role(sess_data, ADMIN_EMAIL)
     if sess_data:
+        _set_state(request, user_session=serialize_user_session(sess_data))
         gr.Info(f"환영합니다, {sess_data.user.email}! (역할: {role})")
-        df_admin_equip_val = current_admin_df
+        df_admin_equip_val = gr.update()
         msg_admin_equip_val = ""
         if role == 'admin':
-            df_admin_equip_val, msg_admin_equip_val = handle_fetch_all_equip_admin(sess_data)
-        return msg, sess_data, gr.update(visible=False), gr.update(True), gr.update(visible=False), gr.update(visible=True if role == 'admin' else False), gr.Tabs(selected="management_tab" if role == 'admin' else "search_tab"), df_admin_equip_val, msg_admin_equip_val
+            df_admin_equip_val, msg_admin_equip_val = _refresh_admin_equip_list(sess_data, request)
+        return msg, gr.update(visible=False), gr.update(True), gr.update(visible=False), gr.update(visible=True if role == 'admin' else False), gr.Tabs(selected="management_tab" if role == 'admin' else "search_tab"), df_admin_equip_val, msg_admin_equip_val, update_user_display(sess_data)
     else:
         gr.Error(msg)
-        return msg, None, gr.update(visible=True), gr.update(visible=False), gr.update(visible=True), gr.update(visible=False), gr.update(), current_admin_df, ""
+        _set_state(request, user_session=None)
+        return msg, gr.update(visible=True), gr.update(visible=False), gr.update(visible=True), gr.update(visible=False), gr.update(), gr.update(), "", update_user_display(None)
 
-def universal_logout_ui_updates(curr_sess: any) -> tuple:
-    logout_msg, new_sess, sel_eq_cleared = logout_user(supabase_client, curr_sess)
+def universal_logout_ui_updates(request: gr.Request) -> tuple:
+    curr_sess = _get_user_session(request)
+    logout_msg, new_sess, sel_eq_cleared = logout_user(supabase_auth_client, curr_sess)
     gr.Info(logout_msg)
+    _set_state(request, user_session=serialize_user_session(new_sess), selected_equipment_ids=sel_eq_cleared, admin_ref=None, edit_selection=None)
     empty_admin_df = pd.DataFrame(columns=['ID', '장비명', '부서', '총량', '가용량'])
-    # Returns: msg, new_session, auth_forms_visible, user_info_visible, auth_tab_visible, admin_tab_visible, main_tab_selected,
-    #          cleared_rental_selection, new_admin_df, cleared_admin_edit_state, admin_fields..., admin_status
-    return (logout_msg, new_sess, gr.update(visible=True), gr.update(visible=False),
+    # Returns: msg, auth_forms_visible, user_info_visible, auth_tab_visible, admin_tab_visible, main_tab_selected,
+    #          new_admin_df, admin_fields..., admin_status, user_display, rental_selection_display
+    return (logout_msg, gr.update(visible=True), gr.update(visible=False),
             gr.update(visible=True), gr.update(visible=False), gr.Tabs(selected="search_tab"),
-            sel_eq_cleared, empty_admin_df, None, "", "", "공용", "", "로그아웃됨.")
+            empty_admin_df, "", "", "공용", "", "로그아웃됨.",
+            update_user_display(new_sess), update_rental_selected_display(sel_eq_cleared))
 
 def update_user_display(s: any) -> str:
     if s and hasattr(s, 'user') and s.user:
@@ -159,43 +511,42 @@ def update_user_display(s: any) -> str:
     return "로그인되지 않음."
 
 # Handler for fetching and displaying all rental details
-def handle_fetch_all_rentals_ui():
+@profiled
+def handle_fetch_all_rentals_ui(request: gr.Request):
     # No user_session needed if visible to all, and db_utils function doesn't require it.
     # supabase_client is global in app.py
     if not supabase_client: # Check if client is available
          init_err = get_supabase_init_error() or "Supabase client not initialized."
-         return pd.DataFrame(columns=["대여자 (Borrower)", "장비명 (Equipment Name)", "수량 (Quantity)", "대여 시작일 (Start Date)", "반납 기한 (End Date)", "상태 (Status)"]), f"오류: {init_err}"
+         return pd.DataFrame(columns=["대여자 (Borrower)", "장비명 (Equipment Name)", "수량 (Quantity)", "대여 시작일 (Start Date)", "반납 기한 (End Date)", "상태 (Status)"]), f"오류: {init_err}", ""
 
     df, message = fetch_all_rental_details() # From db_utils
     if "오류" in message or "Error" in message: # A bit generic, but works for now
         gr.Error(message)
     else:
         gr.Info(message)
-    return df, message
+    ref = make_snapshot_ref("rentals", df)
+    _set_state(request, rentals_ref=ref)
+    return resolve_snapshot_ref(ref), message, handle_overdue_count_ui()
+
+def handle_overdue_count_ui() -> str:
+    count, message = shared_cache.get_or_load(TOPIC_RENTALS, "overdue_count", count_overdue_rentals, cache_if=lambda result: result[0] is not None)
+    if count is None:
+        return message
+    return f"연체 중인 대여: {count}건" if count else "연체 중인 대여가 없습니다."
 
 # --- Main Gradio Application ---
-if __name__ == "__main__":
+def build_demo() -> gr.Blocks:
     if not supabase_client: # Use the client obtained from db_utils
         print(f"Gradio app launch failed: {supabase_init_error}")
         fallback_demo = gr.Blocks(title="오류")
-        with fallback_demo: 
+        with fallback_demo:
             gr.Markdown(f"Supabase 연결 실패: {supabase_init_error}") # Show specific error
-            fallback_demo.launch()
-            # exit() # Keep or remove exit based on desired behavior
-        # If using exit(), make sure it's appropriate for the execution environment.
-        # For now, allow Gradio to handle the launch failure message.
-    else:
-        print("Initializing Gradio app with refactored logic...")
+        return fallback_demo
+    print("Initializing Gradio app with refactored logic...")
     demo = gr.Blocks(title="장비 대여 및 관리 앱", theme=gr.themes.Soft())
 
     with demo:
-        user_session_var = gr.State(None)
-        selected_equipment_to_rent_var = gr.State([]) # Stores list of selected equipment IDs for rental
-        current_search_df_state = gr.State(pd.DataFrame(columns=['ID', '장비명 (Name)', '부서 (Department)', '총 수량 (Total)', '대여 가능 수량 (Available)']))
-        admin_all_equipments_df_state = gr.State(pd.DataFrame(columns=['ID', '장비명', '부서', '총량', '가용량'])) # For admin view
-        selected_equipment_for_edit_state = gr.State(None) # Stores dict of row data for editing
-        all_rentals_df_state = gr.State(pd.DataFrame(columns=["대여자 (Borrower)", "장비명 (Equipment Name)", "수량 (Quantity)", "대여 시작일 (Start Date)", "반납 기한 (End Date)", "상태 (Status)"]))
-
+        # Session state is kept in session_store (see _get_state), not in gr.State.
         gr.Markdown("# 🇰🇷 장비 대여 및 관리 시스템 🇰🇷")
         if not ADMIN_EMAIL: gr.Warning("ADMIN_EMAIL 환경 변수가 설정되지 않았습니다. 관리자 기능이 제한될 수 있습니다.")
 
@@ -211,7 +562,7 @@ if __name__ == "__main__":
                 gr.Markdown("---") # Separator
                 gr.Markdown("## 🗓️ 전체 대여 현황")
                 show_all_rentals_button = gr.Button("🔄 전체 대여 현황 보기/새로고침", variant="secondary")
-                all_rentals_status_output = gr.Textbox(label="대여 현황 조회 상태", interactive=False, lines=1)
+                with gr.Row(): all_rentals_status_output = gr.Textbox(label="대여 현황 조회 상태", interactive=False, lines=1); overdue_count_output = gr.Textbox(label="연체 현황", interactive=False, lines=1)
                 all_rentals_df_display = gr.DataFrame(
                     label="전체 대여 현황 목록",
                     headers=["대여자 (Borrower)", "장비명 (Equipment Name)", "수량 (Quantity)", "대여 시작일 (Start Date)", "반납 기한 (End Date)", "상태 (Status)"],
@@ -226,6 +577,16 @@ if __name__ == "__main__":
                 with gr.Row(): rental_start_date_input = gr.Textbox(label="대여 시작일 (YYYY-MM-DD)", placeholder=date.today().isoformat(), value=date.today().isoformat()); rental_end_date_input = gr.Textbox(label="대여 종료일 (YYYY-MM-DD)", placeholder=(date.today() + timedelta(days=7)).isoformat(), value=(date.today() + timedelta(days=7)).isoformat())
                 rental_borrower_name_input = gr.Textbox(label="대여자 이름", placeholder="예: 홍길동"); rental_purpose_input = gr.Textbox(label="사용 목적", lines=2, placeholder="예: OO실험 강의용")
                 confirm_rental_button = gr.Button("📲 대여 신청 확정 및 제출", variant="primary"); rental_status_output = gr.Textbox(label="대여 신청 상태", interactive=False, lines=2)
+                rental_outcome_timer = gr.Timer(2.0, active=False)
+
+            with gr.TabItem("🗓️ 학기 일괄 예약", id="schedule_tab"):
+                gr.Markdown("## 학기 실험 일괄 예약")
+                gr.Markdown("한 줄에 하나씩 `장비 ID 또는 부서, 수량, 우선순위, 기간...` 형식으로 입력합니다. 기간은 `YYYY-MM-DD~YYYY-MM-DD` (하루면 날짜 하나)이며 공백으로 구분합니다. 장비가 부족하면 같은 부서의 장비로 대체 배정됩니다.")
+                schedule_plan_input = gr.Textbox(label="예약 계획", lines=8, placeholder="EQP-001, 2, 1, 2025-03-04 2025-03-11 2025-03-18\n물리과, 3, 0, 2025-03-05~2025-03-06")
+                with gr.Row(): schedule_borrower_name_input = gr.Textbox(label="대여자 이름", placeholder="예: 홍길동"); schedule_purpose_input = gr.Textbox(label="사용 목적", placeholder="예: 1학기 물리 실험")
+                with gr.Row(): schedule_preview_button = gr.Button("🔍 배정 미리보기", variant="secondary"); schedule_commit_button = gr.Button("📲 일괄 예약 확정", variant="primary")
+                schedule_status_output = gr.Textbox(label="일괄 예약 상태", interactive=False, lines=3)
+                schedule_result_df = gr.DataFrame(label="배정 결과", headers=SCHEDULE_RESULT_COLUMNS, value=pd.DataFrame(columns=SCHEDULE_RESULT_COLUMNS), interactive=False, row_count=(10, "dynamic"), col_count=(len(SCHEDULE_RESULT_COLUMNS), "fixed"))
 
             auth_tab_item_obj = gr.TabItem("🔑 사용자 인증", id="auth_tab")
             with auth_tab_item_obj:
@@ -251,45 +612,113 @@ if __name__ == "__main__":
                         admin_edit_dept_dropdown = gr.Dropdown(label="부서 (필수)", choices=departments, value="공용")
                         admin_edit_qty_input = gr.Textbox(label="총 수량 (필수, 숫자)", placeholder="예: 5")
                         with gr.Row(): admin_add_button = gr.Button("➕ 새 장비 추가", variant="primary"); admin_update_button = gr.Button("💾 선택 장비 정보 수정", variant="secondary"); admin_clear_fields_button = gr.Button("✨ 입력 초기화")
+                    with gr.TabItem("👥 사용자 일괄 등록", id="admin_bulk_users_tab"):
+                        gr.Markdown("### CSV로 사용자 일괄 등록\n`email` 열(필수)과 `password` 열(선택)이 있는 CSV를 업로드합니다. 비밀번호가 없는 행은 초대 이메일이 발송됩니다.")
+                        admin_bulk_users_file = gr.File(label="사용자 CSV 파일", file_types=[".csv"], type="filepath")
+                        admin_bulk_users_button = gr.Button("👥 일괄 등록 실행", variant="primary")
+                        admin_bulk_users_status_output = gr.Textbox(label="일괄 등록 결과 요약", interactive=False, lines=2)
+                        admin_bulk_users_report_df = gr.DataFrame(label="행별 결과", headers=PROVISIONING_REPORT_COLUMNS, value=pd.DataFrame(columns=PROVISIONING_REPORT_COLUMNS), interactive=False, row_count=(10, "dynamic"), col_count=(len(PROVISIONING_REPORT_COLUMNS), "fixed"))
+                    with gr.TabItem("📈 성능 프로파일링", id="admin_profiling_tab"):
+                        gr.Markdown("### 이벤트 핸들러 프로파일링\n켜져 있는 동안 핸들러 호출의 일부를 샘플링해 네트워크 대기, DataFrame 생성, 직렬화 시간을 나누어 기록하고 핸들러별 flamegraph용 collapsed-stack 파일을 저장합니다.")
+                        with gr.Row(): admin_profiling_enabled_checkbox = gr.Checkbox(label="프로파일링 사용", value=False); admin_profiling_rate_slider = gr.Slider(label="샘플링 비율", minimum=0.01, maximum=1.0, step=0.01, value=0.1)
+                        with gr.Row(): admin_profiling_apply_button = gr.Button("💾 설정 적용", variant="primary"); admin_profiling_refresh_button = gr.Button("🔄 요약 새로고침")
+                        admin_profiling_status_output = gr.Textbox(label="프로파일링 상태", interactive=False, lines=2)
+                        admin_profiling_summary_df = gr.DataFrame(label="핸들러별 평균 시간", headers=PROFILING_SUMMARY_COLUMNS, value=pd.DataFrame(columns=PROFILING_SUMMARY_COLUMNS), interactive=False, row_count=(5, "dynamic"), col_count=(len(PROFILING_SUMMARY_COLUMNS), "fixed"))
+                    with gr.TabItem("🕘 이력 조회", id="admin_history_tab"):
+                        gr.Markdown("### 장비/대여 변경 이력\n이벤트 로그를 재생해 특정 날짜에 대여 중이던 장비와 장비별 변경 이력(작업자, 시각)을 조회합니다.")
+                        with gr.Row(): admin_history_date_input = gr.Textbox(label="조회 날짜 (YYYY-MM-DD)", value=date.today().isoformat()); admin_history_on_loan_button = gr.Button("📅 해당 날짜 대여 현황")
+                        admin_history_on_loan_df = gr.DataFrame(label="대여 중이던 항목", headers=HISTORY_ON_LOAN_COLUMNS, value=pd.DataFrame(columns=HISTORY_ON_LOAN_COLUMNS), interactive=False, row_count=(5, "dynamic"), col_count=(len(HISTORY_ON_LOAN_COLUMNS), "fixed"))
+                        with gr.Row(): admin_history_eq_id_input = gr.Textbox(label="장비 ID", placeholder="예: EQP-XYZ-001"); admin_history_equipment_button = gr.Button("🔍 장비 변경 이력")
+                        admin_history_events_df = gr.DataFrame(label="변경 이력", headers=HISTORY_EVENT_COLUMNS, value=pd.DataFrame(columns=HISTORY_EVENT_COLUMNS), interactive=False, row_count=(5, "dynamic"), col_count=(len(HISTORY_EVENT_COLUMNS), "fixed"))
+                        admin_history_status_output = gr.Textbox(label="조회 상태", interactive=False)
                 gr.Markdown("---"); logout_button_admin_tab = gr.Button("🔒 관리자 로그아웃"); logout_status_admin_tab_output = gr.Textbox(label="로그아웃 상태", interactive=False)
 
             # --- Search Tab Event Handlers ---
-            # Simple passthrough to update current_search_df_state, can remain lambda or be extracted if more logic added later.
-            search_results_df.change(lambda x: x, inputs=[search_results_df], outputs=[current_search_df_state])
-            search_button.click(fetch_equipments, inputs=[search_dept_dropdown, search_term_input], outputs=[search_results_df, search_status_output])
-            search_results_df.select(df_select_for_rental, inputs=[current_search_df_state], outputs=[selected_items_display, selected_equipment_to_rent_var, request_rental_button])
-            request_rental_button.click(handle_request_rental_navigation, inputs=[selected_equipment_to_rent_var, user_session_var, main_tabs], outputs=[main_tabs])
+            search_button.click(handle_search_equipments, inputs=[search_dept_dropdown, search_term_input], outputs=[search_results_df, search_status_output])
+            search_results_df.select(df_select_for_rental, inputs=None, outputs=[selected_items_display, request_rental_button, rental_selected_display])
+            request_rental_button.click(handle_request_rental_navigation, inputs=None, outputs=[main_tabs])
 
             show_all_rentals_button.click(
                 handle_fetch_all_rentals_ui,
                 inputs=None,
-                outputs=[all_rentals_df_state, all_rentals_status_output]
-            )
-            all_rentals_df_state.change(
-                lambda x: x,
-                inputs=[all_rentals_df_state],
-                outputs=[all_rentals_df_display]
+                outputs=[all_rentals_df_display, all_rentals_status_output, overdue_count_output]
             )
+            demo.load(handle_overdue_count_ui, inputs=None, outputs=[overdue_count_output])
+            demo.unload(handle_session_end)
 
             # --- Rental Tab Event Handlers ---
-            selected_equipment_to_rent_var.change(update_rental_selected_display, inputs=[selected_equipment_to_rent_var], outputs=[rental_selected_display])
-            confirm_rental_button.click(process_rental_request, inputs=[selected_equipment_to_rent_var, rental_start_date_input, rental_end_date_input, rental_borrower_name_input, rental_purpose_input, user_session_var], outputs=[rental_status_output, selected_equipment_to_rent_var])
+            confirm_rental_button.click(handle_rental_submission, inputs=[rental_start_date_input, rental_end_date_input, rental_borrower_name_input, rental_purpose_input], outputs=[rental_status_output, rental_outcome_timer, rental_selected_display])
+            rental_outcome_timer.tick(poll_rental_outcomes, inputs=None, outputs=[rental_status_output, rental_outcome_timer])
+
+            # --- Semester Schedule Tab Event Handlers ---
+            schedule_preview_button.click(handle_preview_schedule, inputs=[schedule_plan_input], outputs=[schedule_result_df, schedule_status_output])
+            schedule_commit_button.click(handle_commit_schedule, inputs=[schedule_plan_input, schedule_borrower_name_input, schedule_purpose_input], outputs=[schedule_result_df, schedule_status_output], concurrency_limit=1)
 
             # --- Admin Tab Event Handlers ---
-            admin_refresh_equip_list_button.click(handle_fetch_all_equip_admin, inputs=[user_session_var], outputs=[admin_all_equipments_df_state, admin_status_output])
-            # Simple passthrough, can remain lambda
-            admin_all_equipments_df_state.change(lambda df_data: df_data, inputs=[admin_all_equipments_df_state], outputs=[admin_equipments_df_display])
-            admin_equipments_df_display.select(admin_df_select_for_edit, inputs=[admin_all_equipments_df_state], outputs=[selected_equipment_for_edit_state, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_sub_tabs])
-            admin_add_button.click(add_equip_refresh_list, inputs=[admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, user_session_var, admin_all_equipments_df_state], outputs=[admin_status_output, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_all_equipments_df_state])
-            admin_update_button.click(update_equip_refresh_list, inputs=[selected_equipment_for_edit_state, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, user_session_var, admin_all_equipments_df_state], outputs=[admin_status_output, selected_equipment_for_edit_state, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_all_equipments_df_state])
-            admin_clear_fields_button.click(clear_admin_form_fields_action, outputs=[selected_equipment_for_edit_state, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_status_output])
+            admin_refresh_equip_list_button.click(handle_refresh_admin_equip_list, inputs=None, outputs=[admin_equipments_df_display, admin_status_output])
+            admin_equipments_df_display.select(admin_df_select_for_edit, inputs=None, outputs=[admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_sub_tabs])
+            admin_add_button.click(add_equip_refresh_list, inputs=[admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input], outputs=[admin_status_output, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_equipments_df_display])
+            admin_update_button.click(update_equip_refresh_list, inputs=[admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input], outputs=[admin_status_output, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_equipments_df_display])
+            admin_bulk_users_button.click(handle_bulk_provisioning, inputs=[admin_bulk_users_file], outputs=[admin_bulk_users_report_df, admin_bulk_users_status_output], concurrency_limit=1) # Already fans out on its own thread pool
+            admin_profiling_apply_button.click(handle_profiling_settings, inputs=[admin_profiling_enabled_checkbox, admin_profiling_rate_slider], outputs=[admin_profiling_status_output, admin_profiling_summary_df])
+            admin_profiling_refresh_button.click(handle_profiling_summary, inputs=None, outputs=[admin_profiling_status_output, admin_profiling_summary_df])
+            admin_history_on_loan_button.click(handle_history_on_loan, inputs=[admin_history_date_input], outputs=[admin_history_on_loan_df, admin_history_status_output])
+            admin_history_equipment_button.click(handle_history_equipment, inputs=[admin_history_eq_id_input], outputs=[admin_history_events_df, admin_history_status_output])
+            admin_clear_fields_button.click(clear_admin_form_fields_action, outputs=[admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_status_output])
 
             # --- Auth Event Handlers ---
             signup_button.click(handle_signup_action, inputs=[signup_email_input, signup_password_input, signup_confirm_password_input], outputs=[signup_status_output])
-            login_button.click(handle_login_ui_updates, inputs=[login_email_input, login_password_input, admin_all_equipments_df_state], outputs=[login_status_output, user_session_var, auth_forms_group, user_info_group, auth_tab_item_obj, admin_management_tab_item_obj, main_tabs, admin_all_equipments_df_state, admin_status_output])
-            logout_button_auth_tab.click(universal_logout_ui_updates, inputs=[user_session_var], outputs=[logout_status_auth_tab_output, user_session_var, auth_forms_group, user_info_group, auth_tab_item_obj, admin_management_tab_item_obj, main_tabs, selected_equipment_to_rent_var, admin_all_equipments_df_state, selected_equipment_for_edit_state, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_status_output])
-            logout_button_admin_tab.click(universal_logout_ui_updates, inputs=[user_session_var], outputs=[logout_status_admin_tab_output, user_session_var, auth_forms_group, user_info_group, auth_tab_item_obj, admin_management_tab_item_obj, main_tabs, selected_equipment_to_rent_var, admin_all_equipments_df_state, selected_equipment_for_edit_state, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_status_output])
-            user_session_var.change(update_user_display, inputs=[user_session_var], outputs=[current_user_display])
+            login_button.click(handle_login_ui_updates, inputs=[login_email_input, login_password_input], outputs=[login_status_output, auth_forms_group, user_info_group, auth_tab_item_obj, admin_management_tab_item_obj, main_tabs, admin_equipments_df_display, admin_status_output, current_user_display])
+            logout_button_auth_tab.click(universal_logout_ui_updates, inputs=None, outputs=[logout_status_auth_tab_output, auth_forms_group, user_info_group, auth_tab_item_obj, admin_management_tab_item_obj, main_tabs, admin_equipments_df_display, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_status_output, current_user_display, rental_selected_display])
+            logout_button_admin_tab.click(universal_logout_ui_updates, inputs=None, outputs=[logout_status_admin_tab_output, auth_forms_group, user_info_group, auth_tab_item_obj, admin_management_tab_item_obj, main_tabs, admin_equipments_df_display, admin_edit_id_input, admin_edit_name_input, admin_edit_dept_dropdown, admin_edit_qty_input, admin_status_output, current_user_display, rental_selected_display])
 
-        demo.launch(debug=True, share=False)
-        print("Gradio app launched with full Admin Management Tab.")
+    return demo
+
+# available_quantity counts the rentals covering today (migrations/0006_rental_capacity.sql); rentals that
+# start or end with the date change are only reflected after a refresh.
+AVAILABILITY_REFRESH_INTERVAL_SECONDS = 3600
+
+def _run_availability_refresh() -> None:
+    while True:
+        try:
+            if refresh_available_quantities():
+                shared_cache.invalidate(TOPIC_EQUIPMENTS)
+        except Exception as e:
+            print(f"Available quantity refresh failed: {e}")
+        time.sleep(AVAILABILITY_REFRESH_INTERVAL_SECONDS)
+
+# Event log snapshots are taken here rather than after writes, so no request waits on a full replay.
+EVENT_SNAPSHOT_INTERVAL_SECONDS = 300
+
+def _run_event_snapshots(event_log) -> None:
+    while True:
+        try:
+            seq = event_log.snapshot_if_due()
+            if seq:
+                print(f"Event log snapshot taken at seq {seq}.")
+        except Exception as e:
+            print(f"Event log snapshot failed: {e}")
+        time.sleep(EVENT_SNAPSHOT_INTERVAL_SECONDS)
+
+def start_background_services() -> None:
+    """
+    Runs the journal committer, the overdue scanner, the hourly available_quantity refresh and the
+    event log snapshots. With several workers only one process should call this.
+    """
+    threading.Thread(target=_run_availability_refresh, name="availability-refresh", daemon=True).start()
+    if get_event_log():
+        threading.Thread(target=_run_event_snapshots, args=(get_event_log(),), name="event-snapshots", daemon=True).start()
+    if rental_journal:
+        rental_journal.start()
+        print(f"Rental journal enabled at {RENTAL_JOURNAL_PATH} ({rental_journal.pending_count()} pending).")
+    if overdue_scanner:
+        overdue_scanner.start(float(OVERDUE_SCAN_INTERVAL_MINUTES) * 60)
+        print(f"Overdue scanner enabled (every {OVERDUE_SCAN_INTERVAL_MINUTES} min).")
+
+# Development server (single process, debug). For production use serve.py.
+if __name__ == "__main__":
+    demo = build_demo()
+    if supabase_client:
+        start_background_services()
+    demo.launch(debug=True, share=False)
+    print("Gradio app launched with full Admin Management Tab.")
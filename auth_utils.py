@@ -1,9 +1,13 @@
 import re
 from supabase import Client # For type hinting Session, User
 from typing import Optional, Tuple, Any # For type hinting
+from backend_calls import call_backend, AuthenticationError, BackendUnavailable, UniqueViolation
 
 # ADMIN_EMAIL will be passed as an argument where needed
 
+# Compiled once at import; is_valid_email is called per row during bulk provisioning.
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)*\.[a-zA-Z]{2,}$")
+
 def is_valid_email(email: str) -> bool:
     """
     Validates an email address using a regex pattern.
@@ -11,8 +15,7 @@ def is_valid_email(email: str) -> bool:
     """
     if not email:
         return False
-    pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)*\.[a-zA-Z]{2,}$"
-    return re.match(pattern, email) is not None
+    return EMAIL_PATTERN.match(email) is not None
 
 def signup_user(supabase: Client, email: str, password: str, confirm_password: str) -> str:
     if not supabase: return "Supabase client not initialized."
@@ -21,7 +24,7 @@ def signup_user(supabase: Client, email: str, password: str, confirm_password: s
     if password != confirm_password: return "Passwords do not match."
     if len(password) < 6: return "Password must be at least 6 characters long."
     try:
-        res = supabase.auth.sign_up({"email": email, "password": password})
+        res = call_backend("auth.sign_up", lambda: supabase.auth.sign_up({"email": email, "password": password}))
         # Correctly check for user and session attributes based on Supabase response structure
         if hasattr(res, 'user') and res.user and hasattr(res.user, 'aud') and res.user.aud == 'authenticated':
             # Check if session is None, which might indicate email confirmation is needed
@@ -33,16 +36,17 @@ def signup_user(supabase: Client, email: str, password: str, confirm_password: s
         else:
             # Attempt to sign in to check if user is already confirmed
             try:
-                sign_in_res = supabase.auth.sign_in_with_password({"email": email, "password": password})
+                sign_in_res = call_backend("auth.sign_in", lambda: supabase.auth.sign_in_with_password({"email": email, "password": password}))
                 if hasattr(sign_in_res, 'user') and sign_in_res.user:
                     return "This email is already registered and confirmed. Please log in."
             except Exception: # Catch sign-in errors if user exists but password is wrong, etc.
                 pass # Don't obscure original signup issue
             return "Signup failed. The email might already be in use or an issue occurred."
+    except UniqueViolation:
+        return "User already registered. Please log in or check your email for confirmation."
+    except BackendUnavailable as e:
+        return e.message
     except Exception as e:
-        # Check for specific error messages from Supabase
-        if "User already registered" in str(e) or (hasattr(e, 'message') and "User already exists" in str(e.message)):
-            return "User already registered. Please log in or check your email for confirmation."
         return f"An unexpected error occurred during signup: {str(e)}"
 
 def login_user(supabase: Client, email: str, password: str) -> Tuple[Optional[Any], str]: # Return type uses Any for session
@@ -50,7 +54,7 @@ def login_user(supabase: Client, email: str, password: str) -> Tuple[Optional[An
     if not is_valid_email(email): return None, "Invalid email format."
     if not password: return None, "Password cannot be empty."
     try:
-        res = supabase.auth.sign_in_with_password({"email": email, "password": password})
+        res = call_backend("auth.sign_in", lambda: supabase.auth.sign_in_with_password({"email": email, "password": password}))
         if hasattr(res, 'user') and res.user and hasattr(res, 'session') and res.session:
             print(f"User {res.user.email} logged in.")
             return res.session, f"Login successful! Welcome {res.user.email}."
@@ -58,14 +62,40 @@ def login_user(supabase: Client, email: str, password: str) -> Tuple[Optional[An
             return None, f"Login failed: {res.error.message}"
         else:
             return None, "Login failed. Check credentials or confirm email."
+    except AuthenticationError as e:
+        return None, f"Login failed: {e.message}"
+    except BackendUnavailable as e:
+        return None, e.message
     except Exception as e:
         return None, f"An unexpected error during login: {str(e)}"
 
+def refresh_user_session(supabase: Client, session: Any) -> Tuple[Optional[Any], str]:
+    """
+    Exchanges the session's refresh token for a new session. Returns (new_session, message); a rejected
+    refresh token returns (None, message), and outages return the given session unchanged.
+    """
+    if not supabase: return session, "Supabase client not initialized."
+    refresh_token = getattr(session, 'refresh_token', None)
+    if not refresh_token: return None, "Session expired. Please log in again."
+    try:
+        res = call_backend("auth.refresh_session", lambda: supabase.auth.refresh_session(refresh_token))
+        if hasattr(res, 'session') and res.session:
+            return res.session, "Session refreshed."
+        return None, "Session expired. Please log in again."
+    except AuthenticationError as e:
+        return None, f"Session expired: {e.message}"
+    except Exception as e:
+        print(f"Session refresh failed, keeping the current session: {e}")
+        return session, f"Session refresh failed: {str(e)}"
+
 def logout_user(supabase: Client, session_state: Optional[Any]) -> Tuple[str, Optional[Any], list]: # Return type uses Any for session
     if not supabase: return "Supabase client not initialized.", session_state, []
     if session_state and hasattr(session_state, 'user') and session_state.user:
         try:
-            supabase.auth.sign_out()
+            # Revokes this session only; the client itself holds no session (see db_utils.get_supabase_auth_client).
+            access_token = getattr(session_state, 'access_token', None)
+            if access_token:
+                call_backend("auth.sign_out", lambda: supabase.auth.admin.sign_out(access_token, "local"))
             print("User logged out from Supabase.")
             return "Logout successful.", None, []
         except Exception as e:
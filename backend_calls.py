@@ -0,0 +1,292 @@
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Optional, TypeVar
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase_auth.errors import (
+    AuthApiError,
+    AuthError as SupabaseAuthError,
+    AuthInvalidCredentialsError,
+    AuthInvalidJwtError,
+    AuthRetryableError,
+    AuthUnknownError
+)
+
+# Shared wrapper for every Supabase call made by db_utils, auth_utils and event_log.
+# Each call runs under a per-operation deadline, so a slow backend costs a handler at most that
+# deadline instead of the client's default timeout. Idempotent reads are retried with jittered
+# exponential backoff inside the deadline; writes are never retried. A circuit breaker (per
+# process) opens after consecutive failed calls (a call counts once, after its retries) and fails calls fast with
+# BackendUnavailable until a trial call succeeds. Backend exceptions are mapped to the typed
+# errors below, which callers match with isinstance instead of inspecting message text.
+
+DEFAULT_READ_DEADLINE = float(os.environ.get("BACKEND_READ_DEADLINE_SECONDS", "5"))
+DEFAULT_WRITE_DEADLINE = float(os.environ.get("BACKEND_WRITE_DEADLINE_SECONDS", "10"))
+# httpx timeout for the Supabase clients: bounds how long a call abandoned at its deadline keeps a pool thread.
+CLIENT_TIMEOUT = float(os.environ.get("BACKEND_CLIENT_TIMEOUT_SECONDS", "30"))
+DEFAULT_MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.2 # seconds, doubled per attempt; the actual delay is drawn from [0, base * 2**attempt]
+RETRY_MAX_DELAY = 2.0
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BACKEND_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BACKEND_BREAKER_RESET_SECONDS", "30"))
+CALL_POOL_SIZE = 32
+
+class BackendError(Exception):
+    """A failed backend call. message is shown to users; code/status are the backend's SQLSTATE/PostgREST code and HTTP status."""
+    transient = False # Counts toward the circuit breaker; idempotent calls are retried
+
+    def __init__(self, message: str, code: Optional[str] = None, status: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+
+class BackendTransientError(BackendError):
+    """Network failures, 5xx/429 responses, serialization failures: the same call may succeed later."""
+    transient = True
+
+class BackendTimeout(BackendTransientError):
+    pass
+
+class BackendUnavailable(BackendError):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"서버(Supabase) 응답이 불안정하여 요청을 잠시 중단했습니다. 약 {max(1, round(retry_after))}초 후 다시 시도해주세요.")
+        self.retry_after = retry_after
+
+class AuthenticationError(BackendError):
+    """Invalid/expired JWT or wrong credentials."""
+
+class PermissionDenied(BackendError):
+    """Row-level security policy or missing privilege."""
+
+class NotFound(BackendError):
+    """.single() matched no row, or HTTP 404."""
+
+class ConstraintViolation(BackendError):
+    """A database constraint rejected the write. constraint is its name when the backend reports it."""
+
+    def __init__(self, message: str, code: Optional[str] = None, status: Optional[int] = None, constraint: Optional[str] = None):
+        super().__init__(message, code, status)
+        self.constraint = constraint
+
+class UniqueViolation(ConstraintViolation):
+    """Duplicate key, or an auth account that is already registered."""
+
+class CheckViolation(ConstraintViolation):
+    pass
+
+class ExclusionViolation(ConstraintViolation):
+    """E.g. rentals_no_overlap (migrations/0003_rental_overlap_exclusion.sql)."""
+
+_CONSTRAINT_ERRORS = {"23505": UniqueViolation, "23514": CheckViolation, "23P01": ExclusionViolation, "23503": ConstraintViolation, "23502": ConstraintViolation}
+_AUTH_CODES = {"PGRST301", "PGRST302", "PGRST303"} # JWT invalid / missing / expired
+_AUTH_ALREADY_EXISTS_CODES = {"user_already_exists", "email_exists"}
+_AUTH_INVALID_CODES = {"invalid_credentials", "bad_jwt", "session_expired", "session_not_found", "no_authorization",
+                       "refresh_token_not_found", "refresh_token_already_used"}
+_CONSTRAINT_NAME = re.compile(r'constraint "([^"]+)"')
+
+def _error_for_status(status: int, message: str, code: Optional[str]) -> BackendError:
+    if status == 401:
+        return AuthenticationError(message, code, status)
+    if status == 403:
+        return PermissionDenied(message, code, status)
+    if status == 404:
+        return NotFound(message, code, status)
+    if status in (408, 429) or status >= 500:
+        return BackendTransientError(message, code, status)
+    return BackendError(message, code, status)
+
+def _classify_api_error(error: APIError) -> BackendError:
+    code = str(error.code) if error.code is not None else None
+    message = error.message or str(error)
+    if code in _CONSTRAINT_ERRORS:
+        match = _CONSTRAINT_NAME.search(f"{error.message or ''} {error.details or ''}")
+        return _CONSTRAINT_ERRORS[code](message, code, constraint=match.group(1) if match else None)
+    if code == "42501":
+        return PermissionDenied(message, code)
+    if code in _AUTH_CODES:
+        return AuthenticationError(message, code)
+    if code == "PGRST116":
+        return NotFound(message, code)
+    if code == "57014": # statement_timeout
+        return BackendTimeout(message, code)
+    if code and (code.startswith("08") or code.startswith("53") or code in ("40001", "40P01")):
+        return BackendTransientError(message, code) # connection, resources, serialization/deadlock
+    if code and code.isdigit() and len(code) == 3: # Non-JSON response: PostgREST puts the HTTP status in code
+        return _error_for_status(int(code), message, code)
+    return BackendError(message, code)
+
+def classify_error(error: BaseException) -> Optional[BackendError]:
+    """Maps an exception raised by a Supabase client call to a BackendError. None means it is not a backend failure."""
+    if isinstance(error, BackendError):
+        return error
+    if isinstance(error, APIError):
+        return _classify_api_error(error)
+    if isinstance(error, AuthUnknownError) and isinstance(getattr(error, "original_error", None), Exception):
+        return classify_error(error.original_error) or BackendError(str(error))
+    if isinstance(error, AuthRetryableError):
+        return BackendTransientError(error.message, status=error.status)
+    if isinstance(error, (AuthInvalidCredentialsError, AuthInvalidJwtError)):
+        return AuthenticationError(error.message, error.code)
+    if isinstance(error, AuthApiError):
+        if error.code in _AUTH_ALREADY_EXISTS_CODES:
+            return UniqueViolation(error.message, error.code, error.status)
+        if error.code in _AUTH_INVALID_CODES:
+            return AuthenticationError(error.message, error.code, error.status)
+        return _error_for_status(error.status, error.message, error.code)
+    if isinstance(error, SupabaseAuthError): # e.g. AuthWeakPasswordError
+        status = getattr(error, "status", None)
+        return _error_for_status(status, error.message, error.code) if status else BackendError(error.message, error.code)
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return BackendTimeout(f"서버 응답 시간 초과: {error}")
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return BackendTransientError(f"서버 연결 오류: {error}")
+    if isinstance(error, httpx.HTTPStatusError):
+        return _error_for_status(error.response.status_code, str(error), None)
+    return None
+
+class CircuitBreaker:
+    """
+    Closed: calls pass. After failure_threshold consecutive transient failures it opens and rejects
+    calls for reset_timeout seconds, then lets one trial call through (half-open): success closes
+    it, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._clock() - self._opened_at >= self.reset_timeout else "open"
+
+    def before_call(self) -> None:
+        """Raises BackendUnavailable while open (or while another trial call is in flight)."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = self._clock() - self._opened_at
+            if waited < self.reset_timeout:
+                raise BackendUnavailable(self.reset_timeout - waited)
+            if self._trial_running:
+                raise BackendUnavailable(1)
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    print(f"Backend circuit breaker opened after {self._failures} consecutive failures.")
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+T = TypeVar("T")
+
+class BackendCaller:
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker] = None,
+        read_deadline: float = DEFAULT_READ_DEADLINE,
+        write_deadline: float = DEFAULT_WRITE_DEADLINE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_base_delay: float = RETRY_BASE_DELAY,
+        retry_max_delay: float = RETRY_MAX_DELAY,
+        pool_size: int = CALL_POOL_SIZE,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.read_deadline = read_deadline
+        self.write_deadline = write_deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._sleep = sleep
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="backend-call")
+
+    def call(self, operation: str, fn: Callable[[], T], idempotent: bool = False, deadline: Optional[float] = None) -> T:
+        """
+        Runs fn() (one backend request) and returns its result. deadline (seconds) covers all attempts;
+        it defaults to the read deadline for idempotent calls and the write deadline otherwise.
+        Raises a BackendError subclass on backend failures; other exceptions propagate unchanged.
+        """
+        budget = deadline if deadline is not None else (self.read_deadline if idempotent else self.write_deadline)
+        deadline_at = time.monotonic() + budget
+        attempt = 0
+        self.breaker.before_call()
+        while True:
+            try:
+                result = self._run(operation, fn, deadline_at - time.monotonic(), budget, idempotent)
+            except Exception as e:
+                error = classify_error(e)
+                if error is None or not error.transient:
+                    self.breaker.record_success() # The backend answered; the request itself was at fault
+                    if error is None:
+                        raise
+                    raise error from (None if error is e else e)
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+                # A half-open trial is not retried, and retries stop once other calls have opened the breaker.
+                if (not idempotent or attempt >= self.max_retries or time.monotonic() + delay >= deadline_at
+                        or self.breaker.state != "closed"):
+                    self.breaker.record_failure() # One failure per logical call, after its retries
+                    raise error from (None if error is e else e)
+                print(f"Backend call {operation} failed ({error.message}); retry {attempt + 1} in {delay:.2f}s.")
+                self._sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _run(self, operation: str, fn: Callable[[], T], remaining: float, budget: float, idempotent: bool) -> T:
+        if remaining <= 0:
+            raise BackendTimeout(f"서버 응답 시간 초과 ({operation}, {budget:.0f}초).")
+        future = self._pool.submit(fn)
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            future.cancel() # Only helps if it never started; otherwise it runs until the client timeout
+            if idempotent:
+                raise BackendTimeout(f"서버 응답 시간 초과 ({operation}, {budget:.0f}초).")
+            raise BackendTimeout(f"서버 응답 시간 초과 ({operation}, {budget:.0f}초): 요청이 처리되었는지 확인할 수 없습니다. 새로고침 후 확인해주세요.")
+
+_backend_caller = BackendCaller()
+
+def get_backend_caller() -> BackendCaller:
+    return _backend_caller
+
+def call_backend(operation: str, fn: Callable[[], T], idempotent: bool = False, deadline: Optional[float] = None) -> T:
+    return _backend_caller.call(operation, fn, idempotent=idempotent, deadline=deadline)
+
+def _without_client_retry(query: Any) -> Any:
+    # postgrest >= 2.x retries GETs on 503/520 itself with fixed sleeps that ignore the deadline
+    return query.retry(False) if hasattr(query, "retry") else query
+
+def backend_read(operation: str, query: Any, deadline: Optional[float] = None) -> Any:
+    """Executes a PostgREST query builder as an idempotent read (retried on transient failures)."""
+    return call_backend(operation, _without_client_retry(query).execute, idempotent=True, deadline=deadline)
+
+def backend_write(operation: str, query: Any, deadline: Optional[float] = None) -> Any:
+    """Executes a PostgREST insert/update/upsert once."""
+    return call_backend(operation, _without_client_retry(query).execute, idempotent=False, deadline=deadline)
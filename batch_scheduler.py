@@ -0,0 +1,190 @@
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Batch allocation for semester-long lab schedules.
+# A plan is a list of requests (equipment ID or department + quantity + date ranges + priority).
+# Every (request, date range) pair is allocated greedily over an in-memory index of booked units:
+# higher priority first, then earliest start, then shortest range. Each item is all-or-nothing;
+# when the requested equipment is full the remaining units come from the same department.
+#
+# Capacity model (shared with db_utils, rental_journal and the database): an equipment has
+# 'quantity' units, every active rental holds one unit for its whole date range, and a rental
+# fits only if some unit is free for the whole range. The lowest free unit is taken, like
+# pick_rental_unit in migrations/0006_rental_capacity.sql.
+
+Booking = Tuple[Any, Any, int] # (start, end, unit_no); dates or ISO strings, consistently
+
+def _parse_date(value: Any) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+def free_unit_numbers(capacity: int, bookings: Iterable[Booking], start: Any, end: Any) -> List[int]:
+    """Units 1..capacity with no booking overlapping [start, end] (inclusive), lowest first."""
+    busy = {unit_no for b_start, b_end, unit_no in bookings if b_start <= end and b_end >= start}
+    return [unit_no for unit_no in range(1, capacity + 1) if unit_no not in busy]
+
+class AvailabilityIndex:
+    """
+    Booked units per equipment, built from existing active (confirmed/overdue) rentals.
+    Every day keeps a bitmask of busy units (bit n-1 = unit n), so a lookup is one pass over the days.
+    """
+
+    def __init__(self, equipments: Iterable[Dict[str, Any]], booked_rentals: Iterable[Dict[str, Any]] = ()):
+        self.equipments: Dict[str, Dict[str, Any]] = {}
+        self.by_department: Dict[str, List[str]] = {}
+        self._capacity: Dict[str, int] = {}
+        self._busy: Dict[str, Dict[int, int]] = {}
+        for eq in equipments:
+            self.equipments[eq['id']] = eq
+            self.by_department.setdefault(eq.get('department'), []).append(eq['id'])
+            self._capacity[eq['id']] = int(eq.get('quantity') or 0)
+            self._busy[eq['id']] = {}
+        for eq_ids in self.by_department.values():
+            eq_ids.sort(key=lambda eq_id: (-self._capacity[eq_id], eq_id))
+        for rental in booked_rentals:
+            eq_id = rental['equipment_id']
+            if eq_id not in self._busy:
+                continue
+            start, end = _parse_date(rental['start_date']), _parse_date(rental['end_date'])
+            if rental.get('unit_no'):
+                self._book(eq_id, int(rental['unit_no']), start, end)
+            else:
+                self.reserve(eq_id, start, end, 1)
+
+    def capacity(self, eq_id: str) -> int:
+        return self._capacity[eq_id]
+
+    def _busy_mask(self, eq_id: str, start: date, end: date) -> int:
+        busy_by_day = self._busy[eq_id]
+        if not busy_by_day:
+            return 0
+        mask = 0
+        for day in range(start.toordinal(), end.toordinal() + 1):
+            mask |= busy_by_day.get(day, 0)
+        return mask
+
+    def free_unit_numbers(self, eq_id: str, start: date, end: date) -> List[int]:
+        mask = self._busy_mask(eq_id, start, end)
+        return [unit_no for unit_no in range(1, self._capacity[eq_id] + 1) if not mask >> (unit_no - 1) & 1]
+
+    def free_units(self, eq_id: str, start: date, end: date) -> int:
+        capacity = self._capacity[eq_id]
+        return capacity - bin(self._busy_mask(eq_id, start, end) & ((1 << capacity) - 1)).count("1")
+
+    def reserve(self, eq_id: str, start: date, end: date, units: int) -> List[int]:
+        """Books the lowest free units for [start, end] and returns their numbers."""
+        unit_nos = self.free_unit_numbers(eq_id, start, end)[:units]
+        for unit_no in unit_nos:
+            self._book(eq_id, unit_no, start, end)
+        return unit_nos
+
+    def _book(self, eq_id: str, unit_no: int, start: date, end: date) -> None:
+        busy_by_day = self._busy[eq_id]
+        bit = 1 << (unit_no - 1)
+        for day in range(start.toordinal(), end.toordinal() + 1):
+            busy_by_day[day] = busy_by_day.get(day, 0) | bit
+
+def allocate_plan(
+    plan_requests: List[Dict[str, Any]],
+    equipments: List[Dict[str, Any]],
+    booked_rentals: List[Dict[str, Any]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    plan_requests: [{"equipment_id" or "department", "quantity", "ranges": [(start, end), ...], "priority"}]
+    Returns {"accepted": [...], "rejected": [...]}. Accepted rows carry equipment_id, start_date, end_date,
+    units, unit_nos (the units booked) and substitute (True when the unit came from another item of the same department).
+    """
+    index = AvailabilityIndex(equipments, booked_rentals)
+    items = []
+    for req_idx, req in enumerate(plan_requests):
+        for start_raw, end_raw in req.get('ranges', []):
+            start, end = _parse_date(start_raw), _parse_date(end_raw)
+            items.append((-int(req.get('priority', 0)), start, (end - start).days, req_idx, start, end))
+    items.sort()
+
+    accepted: List[Dict[str, Any]] = []
+    rejected: List[Dict[str, Any]] = []
+    for _, _, _, req_idx, start, end in items:
+        req = plan_requests[req_idx]
+        quantity = int(req.get('quantity', 1))
+        target = req.get('equipment_id') or req.get('department')
+        base = {"request_index": req_idx, "target": target, "start_date": start.isoformat(), "end_date": end.isoformat()}
+        if end < start:
+            rejected.append(dict(base, quantity=quantity, reason="종료일이 시작일보다 빠릅니다."))
+            continue
+
+        primary: Optional[str] = req.get('equipment_id')
+        if primary and primary not in index.equipments:
+            rejected.append(dict(base, quantity=quantity, reason=f"장비 ID '{primary}'를 찾을 수 없습니다."))
+            continue
+        picks: List[Tuple[str, int]] = []
+        remaining = quantity
+        if primary:
+            units = min(remaining, index.free_units(primary, start, end))
+            if units > 0:
+                picks.append((primary, units))
+                remaining -= units
+        if remaining > 0:
+            # Only look at the department when the requested item is short. First fit over items ordered
+            # by capacity (largest first) keeps the number of split bookings low and stops early.
+            department = index.equipments[primary].get('department') if primary else req.get('department')
+            for eq_id in index.by_department.get(department, []):
+                if remaining <= 0:
+                    break
+                if eq_id == primary:
+                    continue
+                units = min(remaining, index.free_units(eq_id, start, end))
+                if units > 0:
+                    picks.append((eq_id, units))
+                    remaining -= units
+        if remaining > 0:
+            rejected.append(dict(base, quantity=quantity, reason=f"해당 기간에 대여 가능한 수량이 부족합니다. (부족: {remaining})"))
+            continue
+        for eq_id, units in picks:
+            unit_nos = index.reserve(eq_id, start, end, units)
+            accepted.append(dict(base, equipment_id=eq_id, units=units, unit_nos=unit_nos, substitute=bool(primary) and eq_id != primary))
+
+    accepted.sort(key=lambda row: (row['start_date'], row['request_index'], row['equipment_id']))
+    return {"accepted": accepted, "rejected": rejected}
+
+def parse_plan_text(text: str, departments: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Parses one request per line: "<장비 ID 또는 부서>, <수량>, <우선순위>, <시작~종료> <시작~종료> ..."
+    Dates are YYYY-MM-DD; a single date means a one-day session. Returns (plan_requests, errors).
+    """
+    requests: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    for line_no, line in enumerate((text or "").splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = [p.strip() for p in line.split(",", 3)]
+        if len(parts) != 4:
+            errors.append(f"{line_no}행: '대상, 수량, 우선순위, 기간' 형식이어야 합니다.")
+            continue
+        target, qty_str, priority_str, ranges_str = parts
+        try:
+            quantity, priority = int(qty_str), int(priority_str)
+        except ValueError:
+            errors.append(f"{line_no}행: 수량과 우선순위는 숫자여야 합니다.")
+            continue
+        if quantity <= 0:
+            errors.append(f"{line_no}행: 수량은 0보다 커야 합니다.")
+            continue
+        ranges = []
+        try:
+            for token in ranges_str.replace(";", " ").split():
+                start_str, _, end_str = token.partition("~")
+                ranges.append((date.fromisoformat(start_str), date.fromisoformat(end_str or start_str)))
+        except ValueError:
+            errors.append(f"{line_no}행: 날짜 형식이 잘못되었습니다. YYYY-MM-DD~YYYY-MM-DD 형식으로 입력해주세요.")
+            continue
+        if not ranges:
+            errors.append(f"{line_no}행: 기간이 없습니다.")
+            continue
+        request: Dict[str, Any] = {"quantity": quantity, "priority": priority, "ranges": ranges}
+        if target in departments:
+            request["department"] = target
+        else:
+            request["equipment_id"] = target.upper()
+        requests.append(request)
+    return requests, errors
@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from batch_scheduler import allocate_plan
+
+# Benchmark for batch_scheduler.allocate_plan with large semester plans.
+# Usage: python bench_batch_scheduler.py --intervals 5000 --equipments 300
+
+DEPARTMENTS = ["물리과", "화학과", "IT과", "공과대학", "공용"]
+
+def make_inputs(n_intervals: int, n_equipments: int, n_booked: int, seed: int):
+    rng = random.Random(seed)
+    semester_start = date.today() + timedelta(days=1)
+    equipments = [
+        {'id': f"EQP-{i:04d}", 'name': f"장비 {i}", 'department': rng.choice(DEPARTMENTS), 'quantity': rng.randint(1, 10)}
+        for i in range(n_equipments)
+    ]
+    booked = []
+    for _ in range(n_booked):
+        start = semester_start + timedelta(days=rng.randint(0, 120))
+        booked.append({'equipment_id': rng.choice(equipments)['id'], 'start_date': start.isoformat(),
+                       'end_date': (start + timedelta(days=rng.randint(0, 6))).isoformat()})
+    plan, remaining = [], n_intervals
+    while remaining > 0:
+        sessions = min(remaining, rng.randint(10, 40))
+        remaining -= sessions
+        first = semester_start + timedelta(days=rng.randint(0, 20))
+        ranges = []
+        for week in range(sessions):
+            start = first + timedelta(days=7 * week % 140)
+            ranges.append((start, start + timedelta(days=rng.randint(0, 1))))
+        target = {'department': rng.choice(DEPARTMENTS)} if rng.random() < 0.3 else {'equipment_id': rng.choice(equipments)['id']}
+        plan.append(dict(target, quantity=rng.randint(1, 4), priority=rng.randint(0, 3), ranges=ranges))
+    return plan, equipments, booked
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batch allocation engine.")
+    parser.add_argument("--intervals", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--equipments", type=int, default=300)
+    parser.add_argument("--booked", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'intervals':>10} {'requests':>9} {'accepted':>9} {'rejected':>9} {'best (s)':>9} {'intervals/s':>12}")
+    for n_intervals in args.intervals:
+        plan, equipments, booked = make_inputs(n_intervals, args.equipments, args.booked, args.seed)
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = allocate_plan(plan, equipments, booked)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        print(f"{n_intervals:>10} {len(plan):>9} {len(result['accepted']):>9} {len(result['rejected']):>9} {best:>9.3f} {n_intervals / best:>12.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import os
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+
+from migrate import apply_migrations
+
+# Benchmark for the queries db_utils issues, before and after the index/constraint migrations.
+# Seeds an EMPTY local Postgres database (never point this at production) with the baseline
+# schema (0001) and realistic volumes, times each query with EXPLAIN ANALYZE, applies the
+# remaining migrations and measures again. Finally checks that two concurrent rentals of the
+# same equipment and period get different units.
+# Usage: python bench_db_queries.py --database-url postgresql://localhost/kshs_bench
+
+DEPARTMENTS = ["물리과", "화학과", "IT과", "공과대학", "공용"]
+BASELINE_VERSION = "0001"
+
+# (label, SQL, params) mirroring db_utils
+def benchmark_queries(today: date):
+    hwm = (today - timedelta(days=30)).isoformat()
+    probe_start, probe_end = (today + timedelta(days=3)).isoformat(), (today + timedelta(days=5)).isoformat()
+    return [
+        ("conflict check (process_rental_request)",
+         "select start_date, end_date from rentals where equipment_id = %s and status in ('confirmed', 'overdue') and start_date <= %s and end_date >= %s",
+         ("EQP-00042", probe_end, probe_start)),
+        ("all rentals by start_date (fetch_all_rental_details)",
+         "select r.borrower_name, r.start_date, r.end_date, r.quantity, r.status, e.name "
+         "from rentals r join equipments e on e.id = r.equipment_id order by r.start_date desc limit 1000",
+         ()),
+        ("equipments by department (fetch_equipments)",
+         "select id, name, department, quantity, available_quantity from equipments where department = %s",
+         ("물리과",)),
+        ("all equipments by id (fetch_all_equipments_admin)",
+         "select id, name, department, quantity, available_quantity from equipments order by id",
+         ()),
+        ("newly overdue (fetch_newly_overdue_rentals)",
+         "select id, equipment_id, end_date from rentals where status = 'confirmed' and end_date > %s and end_date < %s order by end_date, id limit 500",
+         (hwm, today.isoformat())),
+    ]
+
+def seed(conn, n_equipments: int, n_rentals: int, today: date) -> None:
+    """Rentals per equipment are laid out back to back (3-day slots) so the exclusion constraint can be added."""
+    per_equipment = max(1, n_rentals // n_equipments)
+    first_day = today - timedelta(days=3 * per_equipment // 2)
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "insert into equipments (id, name, department, quantity, available_quantity) "
+            "select format('EQP-%%s', lpad(i::text, 5, '0')), format('장비 %%s', i), (%s::text[])[1 + i %% %s], 1 + i %% 5, 1 + i %% 5 "
+            "from generate_series(0, %s - 1) as i",
+            (DEPARTMENTS, len(DEPARTMENTS), n_equipments),
+        )
+        cur.execute(
+            "insert into rentals (equipment_id, start_date, end_date, borrower_name, purpose, status) "
+            "select format('EQP-%%s', lpad((i %% %s)::text, 5, '0')), %s::date + (i / %s) * 3, %s::date + (i / %s) * 3 + 2, "
+            "       '홍길동', '실험', case when i %% 10 = 0 then 'cancelled' else 'confirmed' end "
+            "from generate_series(0, %s - 1) as i",
+            (n_equipments, first_day, n_equipments, first_day, n_equipments, n_rentals),
+        )
+        cur.execute("analyze equipments")
+        cur.execute("analyze rentals")
+
+def measure(conn, today: date, repeat: int):
+    results = []
+    with conn, conn.cursor() as cur:
+        for label, sql, params in benchmark_queries(today):
+            cur.execute("explain (analyze, format json) " + sql, params)
+            plan = cur.fetchone()[0][0]
+            nodes = []
+            def walk(node):
+                name = node["Node Type"]
+                if "Index Name" in node:
+                    name += f" ({node['Index Name']})"
+                nodes.append(name)
+                for child in node.get("Plans", []):
+                    walk(child)
+            walk(plan["Plan"])
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cur.execute(sql, params)
+                cur.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results.append((label, statistics.median(timings), " > ".join(nodes)))
+    return results
+
+def check_concurrent_unit_picks(database_url: str, today: date) -> str:
+    """Inserts the same rental for a 2-unit equipment from two transactions; the second starts before the first commits."""
+    import psycopg2
+    period = (today + timedelta(days=400), today + timedelta(days=402))
+    insert = ("insert into rentals (equipment_id, start_date, end_date, borrower_name, purpose, status) "
+              "values ('EQP-RACE', %s, %s, '홍길동', '실험', 'confirmed') returning unit_no")
+    first, second = psycopg2.connect(database_url), psycopg2.connect(database_url)
+    outcome = {}
+    def insert_second():
+        try:
+            with second, second.cursor() as cur:
+                cur.execute(insert, period)
+                outcome["second"] = f"unit {cur.fetchone()[0]}"
+        except psycopg2.Error as e:
+            outcome["second"] = f"failed ({e.pgcode})"
+    try:
+        with first, first.cursor() as cur:
+            cur.execute("insert into equipments (id, name, department, quantity, available_quantity) values ('EQP-RACE', '동시 대여', '공용', 2, 2)")
+        with first, first.cursor() as cur:
+            cur.execute(insert, period)
+            outcome["first"] = f"unit {cur.fetchone()[0]}"
+            thread = threading.Thread(target=insert_second)
+            thread.start()
+            thread.join(0.5) # Blocked on the first transaction
+        thread.join()
+        with first, first.cursor() as cur:
+            cur.execute("delete from rentals where equipment_id = 'EQP-RACE'")
+            cur.execute("delete from equipments where id = 'EQP-RACE'")
+    finally:
+        first.close()
+        second.close()
+    return f"first {outcome['first']}, second {outcome['second']}"
+
+def print_results(title: str, results) -> None:
+    print(f"\n== {title} ==")
+    for label, median_ms, plan in results:
+        print(f"{median_ms:9.2f} ms  {label}\n             plan: {plan}")
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark db_utils queries before/after migrations on a local Postgres.")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"))
+    parser.add_argument("--equipments", type=int, default=2000)
+    parser.add_argument("--rentals", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("Pass --database-url (or set BENCH_DATABASE_URL) pointing at an empty local database.")
+
+    import psycopg2
+    conn = psycopg2.connect(args.database_url)
+    today = date.today()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("select to_regclass('rentals') is not null")
+            if cur.fetchone()[0]:
+                raise SystemExit("Refusing to run: 'rentals' already exists. Use an empty database.")
+        apply_migrations(conn, target=BASELINE_VERSION)
+        started = time.perf_counter()
+        seed(conn, args.equipments, args.rentals, today)
+        print(f"Seeded {args.equipments} equipments and {args.rentals} rentals in {time.perf_counter() - started:.1f}s")
+        before = measure(conn, today, args.repeat)
+
+        started = time.perf_counter()
+        apply_migrations(conn)
+        with conn, conn.cursor() as cur:
+            cur.execute("analyze rentals")
+            cur.execute("analyze equipments")
+        print(f"Applied remaining migrations in {time.perf_counter() - started:.1f}s")
+        after = measure(conn, today, args.repeat)
+
+        print_results("before (baseline schema only)", before)
+        print_results("after (query indexes + exclusion constraint)", after)
+        print("\n== speedup ==")
+        for (label, before_ms, _), (_, after_ms, _) in zip(before, after):
+            print(f"{before_ms / after_ms if after_ms else float('inf'):8.1f}x  {label}")
+        print(f"\n== concurrent rentals of a 2-unit equipment ==\n{check_concurrent_unit_picks(args.database_url, today)}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import csv
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from supabase import Client
+from auth_utils import is_valid_email
+from backend_calls import call_backend, BackendError, BackendTransientError, UniqueViolation
+
+# Bulk user provisioning for a new cohort.
+# Every row of the uploaded CSV is validated up front (email format + duplicates), then accounts
+# are created through the auth admin API (service role key required) on a bounded thread pool.
+# Each API call goes through backend_calls (deadline, circuit breaker, typed errors) and is retried
+# here on BackendTransientError; an account that already exists comes back as UniqueViolation. Passwords in the CSV create confirmed accounts directly;
+# rows without a password get an invitation email instead.
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5 # seconds, doubled per attempt with jitter
+MIN_PASSWORD_LENGTH = 6 # Same rule as signup_user
+
+# Row statuses in the report
+STATUS_CREATED = "created"
+STATUS_INVITED = "invited"
+STATUS_EXISTS = "exists"
+STATUS_INVALID = "invalid"
+STATUS_DUPLICATE = "duplicate"
+STATUS_FAILED = "failed"
+
+def parse_provisioning_csv(content: str) -> List[Dict[str, Any]]:
+    """
+    Reads rows from CSV text. A header row with an 'email' column (and optional 'password')
+    is used when present; otherwise the first column is the email and the second the password.
+    Returns [{"row": line number, "email": str, "password": Optional[str]}].
+    """
+    rows = [r for r in csv.reader(io.StringIO(content or "")) if any(cell.strip() for cell in r)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    email_col, password_col, start = 0, 1, 0
+    if "email" in header:
+        email_col = header.index("email")
+        password_col = header.index("password") if "password" in header else None
+        start = 1
+    parsed = []
+    for line_no, row in enumerate(rows[start:], start=start + 1):
+        email = row[email_col].strip() if email_col < len(row) else ""
+        password = row[password_col].strip() if password_col is not None and password_col < len(row) else ""
+        parsed.append({"row": line_no, "email": email, "password": password or None})
+    return parsed
+
+def validate_provisioning_rows(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Splits rows into (valid_rows, report_entries_for_rejected_rows). Duplicates are matched case-insensitively."""
+    valid, rejected = [], []
+    seen: Dict[str, int] = {}
+    for row in rows:
+        email = row["email"]
+        if not is_valid_email(email):
+            rejected.append(_report_entry(row, STATUS_INVALID, "Invalid email format."))
+            continue
+        if row["password"] is not None and len(row["password"]) < MIN_PASSWORD_LENGTH:
+            rejected.append(_report_entry(row, STATUS_INVALID, f"Password must be at least {MIN_PASSWORD_LENGTH} characters long."))
+            continue
+        key = email.lower()
+        if key in seen:
+            rejected.append(_report_entry(row, STATUS_DUPLICATE, f"Duplicate of row {seen[key]}."))
+            continue
+        seen[key] = row["row"]
+        valid.append(row)
+    return valid, rejected
+
+def _report_entry(row: Dict[str, Any], status: str, message: str, attempts: int = 0) -> Dict[str, Any]:
+    return {"row": row["row"], "email": row["email"], "status": status, "message": message, "attempts": attempts}
+
+def _provision_one(admin_client: Client, row: Dict[str, Any], max_retries: int) -> Dict[str, Any]:
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            if row["password"]:
+                call_backend("provisioning.create_user", lambda: admin_client.auth.admin.create_user(
+                    {"email": row["email"], "password": row["password"], "email_confirm": True}))
+                return _report_entry(row, STATUS_CREATED, "Account created.", attempts)
+            call_backend("provisioning.invite_user", lambda: admin_client.auth.admin.invite_user_by_email(row["email"]))
+            return _report_entry(row, STATUS_INVITED, "Invitation email sent.", attempts)
+        except UniqueViolation:
+            # Also what a retry sees when the first attempt created the account but its response was lost
+            return _report_entry(row, STATUS_EXISTS, "User already registered.", attempts)
+        except BackendTransientError as e:
+            if attempts > max_retries:
+                return _report_entry(row, STATUS_FAILED, f"Provisioning failed: {e.message}", attempts)
+            time.sleep(RETRY_BASE_DELAY * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5))
+        except BackendError as e:
+            return _report_entry(row, STATUS_FAILED, f"Provisioning failed: {e.message}", attempts)
+        except Exception as e:
+            return _report_entry(row, STATUS_FAILED, f"Provisioning failed: {str(e)}", attempts)
+
+def provision_users(
+    admin_client: Optional[Client],
+    csv_content: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Provisions every valid row of csv_content. Returns (report, stats):
+    report has one entry per CSV row in row order; stats has per-status counts, elapsed seconds
+    and throughput (API-processed rows per second).
+    """
+    started = time.perf_counter()
+    rows = parse_provisioning_csv(csv_content)
+    valid, report = validate_provisioning_rows(rows)
+    if valid and not admin_client:
+        report.extend(_report_entry(row, STATUS_FAILED, "Supabase admin client not initialized.") for row in valid)
+        valid = []
+    if valid:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(valid)))) as pool:
+            report.extend(pool.map(lambda row: _provision_one(admin_client, row, max_retries), valid))
+    report.sort(key=lambda entry: entry["row"])
+
+    elapsed = time.perf_counter() - started
+    stats: Dict[str, Any] = {"total": len(rows), "elapsed_seconds": round(elapsed, 3)}
+    for status in (STATUS_CREATED, STATUS_INVITED, STATUS_EXISTS, STATUS_INVALID, STATUS_DUPLICATE, STATUS_FAILED):
+        stats[status] = sum(1 for entry in report if entry["status"] == status)
+    stats["rows_per_second"] = round(len(valid) / elapsed, 1) if elapsed > 0 and valid else 0.0
+    return report, stats
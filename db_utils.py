@@ -1,9 +1,27 @@
 import os
 import pandas as pd
 from datetime import date, datetime, timedelta
-from supabase import create_client, Client as SupabaseClient
+from supabase import create_client, Client as SupabaseClient, ClientOptions
+from postgrest import SyncPostgrestClient
 from dotenv import load_dotenv
 from typing import Tuple, List, Optional, Dict, Any
+from handler_profiler import profiled
+from batch_scheduler import free_unit_numbers
+from backend_calls import (
+    backend_read,
+    backend_write,
+    CLIENT_TIMEOUT,
+    BackendError,
+    BackendUnavailable,
+    AuthenticationError,
+    PermissionDenied,
+    NotFound,
+    ConstraintViolation,
+    CheckViolation,
+    ExclusionViolation,
+    UniqueViolation
+)
+from event_log import EventLog, SupabaseEventStore
 
 load_dotenv()
 
@@ -17,19 +35,80 @@ try:
         _supabase_init_error = "Supabase URL or Key not found in environment variables. Check .env file."
         print(_supabase_init_error)
     else:
-        _supabase_client = create_client(supabase_url, supabase_key)
+        _supabase_client = create_client(supabase_url, supabase_key, options=ClientOptions(postgrest_client_timeout=CLIENT_TIMEOUT))
         print("Supabase client initialized successfully in db_utils.")
 except Exception as e:
     _supabase_init_error = str(e)
     print(f"Error initializing Supabase client in db_utils: {_supabase_init_error}")
     _supabase_client = None
 
+# Sign-in, sign-up, sign-out and token refresh go through their own client: supabase-py points a
+# client's PostgREST headers at the last session it signed in, which must not be the shared data client.
+_supabase_auth_client: Optional[SupabaseClient] = None
+if _supabase_client:
+    try:
+        _supabase_auth_client = create_client(supabase_url, supabase_key, options=ClientOptions(
+            postgrest_client_timeout=CLIENT_TIMEOUT, auto_refresh_token=False, persist_session=False))
+    except Exception as e:
+        print(f"Error initializing Supabase auth client in db_utils: {e}")
+        _supabase_auth_client = None
+
+# Optional service-role client for auth admin operations (bulk user provisioning) and the rental
+# journal committer, which writes rentals of many users outside any request.
+supabase_service_role_key: Optional[str] = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+_supabase_admin_client: Optional[SupabaseClient] = None
+if supabase_url and supabase_service_role_key:
+    try:
+        _supabase_admin_client = create_client(supabase_url, supabase_service_role_key, options=ClientOptions(postgrest_client_timeout=CLIENT_TIMEOUT))
+    except Exception as e:
+        print(f"Error initializing Supabase admin client in db_utils: {e}")
+        _supabase_admin_client = None
+
+# Rentals that hold an equipment unit (migrations/0003 and 0006).
+ACTIVE_RENTAL_STATUSES = ["confirmed", "overdue"]
+
 def get_supabase_client() -> Optional[SupabaseClient]:
     return _supabase_client
 
+def get_supabase_admin_client() -> Optional[SupabaseClient]:
+    return _supabase_admin_client
+
+def get_supabase_auth_client() -> Optional[SupabaseClient]:
+    return _supabase_auth_client
+
+def get_user_client(user_session: Optional[Any]) -> Optional[Any]:
+    """
+    Client for one request that sends the session's access token, so RLS policies see the signed-in
+    user on whichever worker serves the request. Shares the connection pool of the shared client;
+    without a token it is the shared (anon) client.
+    """
+    client = get_supabase_client()
+    access_token = getattr(user_session, 'access_token', None)
+    if not client or not access_token:
+        return client
+    return SyncPostgrestClient(
+        str(client.rest_url), schema=client.options.schema,
+        headers=dict(client.options.headers, Authorization=f"Bearer {access_token}"),
+        http_client=client.postgrest.session,
+    )
+
 def get_supabase_init_error() -> Optional[str]:
     return _supabase_init_error
 
+# Append-only event log of every equipment/rental write, recorded by database triggers
+# (migrations/0004_event_log.sql). API clients have no access to the log tables, so the history views
+# and snapshots need the service-role client. Set EVENT_LOG_ENABLED=false to turn them off.
+EVENT_LOG_ENABLED = os.environ.get("EVENT_LOG_ENABLED", "true").lower() != "false"
+_event_log: Optional[EventLog] = EventLog(SupabaseEventStore(_supabase_admin_client)) if _supabase_admin_client and EVENT_LOG_ENABLED else None
+
+def get_event_log() -> Optional[EventLog]:
+    return _event_log
+
+def _failure_message(prefix: str, error: Exception) -> str:
+    # While the circuit breaker is open its own message already says what to do.
+    return error.message if isinstance(error, BackendUnavailable) else f"{prefix}: {str(error)}"
+
+@profiled
 def fetch_equipments(department_filter: str, search_query: str) -> Tuple[pd.DataFrame, str]:
     client = get_supabase_client()
     empty_df_cols = ['ID', '장비명 (Name)', '부서 (Department)', '총 수량 (Total)', '대여 가능 수량 (Available)']
@@ -47,7 +126,7 @@ def fetch_equipments(department_filter: str, search_query: str) -> Tuple[pd.Data
                  search_conditions.append(f"id.eq.{search_query.upper()}")
             query = query.or_(",".join(search_conditions))
 
-        response = query.execute()
+        response = backend_read("fetch_equipments", query)
 
         if response.data:
             df = pd.DataFrame(response.data)
@@ -61,69 +140,88 @@ def fetch_equipments(department_filter: str, search_query: str) -> Tuple[pd.Data
             return df, "장비 목록을 성공적으로 불러왔습니다."
         else:
             return empty_df, "조건에 맞는 장비가 없습니다."
+    except AuthenticationError as e:
+        print(f"Error fetching equipments: {e}")
+        return empty_df, f"데이터 조회 중 인증 오류: {e.message}."
     except Exception as e:
-        error_message = str(e)
         print(f"Error fetching equipments: {e}")
-        if "JWT" in error_message or "token" in error_message or "authorization" in error_message.lower():
-            return empty_df, f"데이터 조회 중 인증 오류: {error_message}."
-        return empty_df, f"장비 목록 조회 중 오류 발생: {error_message}"
+        return empty_df, _failure_message("장비 목록 조회 중 오류 발생", e)
 
-def process_rental_request(
+def validate_rental_request(
     selected_equipment_ids: List[str],
     start_date_str: str,
     end_date_str: str,
     borrower_name: str,
     purpose_text: str,
     user_session: Optional[Any]
-) -> Tuple[str, List[str]]:
-    client = get_supabase_client()
-    if not client:
-        return get_supabase_init_error() or "Supabase client not initialized.", selected_equipment_ids
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Checks the rental form input without touching the database.
+    Returns (error_message, None) on failure or (None, rental_data) ready for the 'rentals' table.
+    """
     if not user_session or not hasattr(user_session, 'user') or not user_session.user or not hasattr(user_session.user, 'id'):
-        return "오류: 사용자 세션 또는 ID가 없습니다. 다시 로그인 해주세요.", selected_equipment_ids
+        return "오류: 사용자 세션 또는 ID가 없습니다. 다시 로그인 해주세요.", None
     if not selected_equipment_ids:
-        return "오류: 대여할 장비가 선택되지 않았습니다.", selected_equipment_ids
-
-    user_id = user_session.user.id
-    equipment_id_to_rent = selected_equipment_ids[0]
+        return "오류: 대여할 장비가 선택되지 않았습니다.", None
 
     if not all([start_date_str, end_date_str, borrower_name, purpose_text]):
-        return "오류: 모든 필드(시작일, 종료일, 대여자명, 사용 목적)를 입력해야 합니다.", selected_equipment_ids
+        return "오류: 모든 필드(시작일, 종료일, 대여자명, 사용 목적)를 입력해야 합니다.", None
 
     try:
         start_date_obj = datetime.strptime(start_date_str, "%Y-%m-%d").date()
         end_date_obj = datetime.strptime(end_date_str, "%Y-%m-%d").date()
     except ValueError:
-        return "오류: 날짜 형식이 잘못되었습니다. YYYY-MM-DD 형식으로 입력해주세요.", selected_equipment_ids
+        return "오류: 날짜 형식이 잘못되었습니다. YYYY-MM-DD 형식으로 입력해주세요.", None
 
     if start_date_obj < date.today():
-        return "오류: 대여 시작일은 오늘 또는 그 이후여야 합니다.", selected_equipment_ids
+        return "오류: 대여 시작일은 오늘 또는 그 이후여야 합니다.", None
     if end_date_obj < start_date_obj:
-        return "오류: 대여 종료일은 시작일보다 이후여야 합니다.", selected_equipment_ids
+        return "오류: 대여 종료일은 시작일보다 이후여야 합니다.", None
+
+    rental_data = {
+        "equipment_id": selected_equipment_ids[0], "start_date": start_date_str, "end_date": end_date_str,
+        "borrower_name": borrower_name, "purpose": purpose_text, "user_id": user_session.user.id, "status": "confirmed"
+    }
+    return None, rental_data
+
+@profiled
+def process_rental_request(
+    selected_equipment_ids: List[str],
+    start_date_str: str,
+    end_date_str: str,
+    borrower_name: str,
+    purpose_text: str,
+    user_session: Optional[Any]
+) -> Tuple[str, List[str]]:
+    client = get_user_client(user_session)
+    if not client:
+        return get_supabase_init_error() or "Supabase client not initialized.", selected_equipment_ids
+
+    validation_error, rental_data = validate_rental_request(
+        selected_equipment_ids, start_date_str, end_date_str, borrower_name, purpose_text, user_session
+    )
+    if validation_error:
+        return validation_error, selected_equipment_ids
+    equipment_id_to_rent = rental_data["equipment_id"]
 
     try:
-        eq_response = client.table("equipments").select("name, available_quantity, quantity").eq("id", equipment_id_to_rent).single().execute()
+        eq_response = backend_read("rental.equipment", client.table("equipments").select("name, quantity").eq("id", equipment_id_to_rent).single())
         if not hasattr(eq_response, 'data') or not eq_response.data:
             return f"오류: 장비 ID '{equipment_id_to_rent}' 정보를 찾을 수 없습니다.", selected_equipment_ids
 
         equipment_name = eq_response.data.get('name', equipment_id_to_rent)
-        current_available_quantity = eq_response.data.get('available_quantity')
-
-        if current_available_quantity is None:
-             return f"오류: 장비 '{equipment_name}'의 대여 가능 수량 정보를 가져올 수 없습니다.", selected_equipment_ids
-        if current_available_quantity < 1:
-            return f"오류: 장비 '{equipment_name}'는 현재 대여 가능 수량이 없습니다.", selected_equipment_ids
-
-        conflict_response = client.table("rentals").select("id", count="exact")             .eq("equipment_id", equipment_id_to_rent)             .eq("status", "confirmed")             .lte("start_date", end_date_str)             .gte("end_date", start_date_str)             .execute()
-
-        if conflict_response.count > 0:
+        # Same capacity model as the database (migrations/0006): some unit must be free for the whole period.
+        # This is only a pre-check for a friendly message; the unit trigger and exclusion constraint decide.
+        conflict_response = backend_read("rental.conflicts", client.table("rentals").select("start_date, end_date, unit_no") \
+            .eq("equipment_id", equipment_id_to_rent) \
+            .in_("status", ACTIVE_RENTAL_STATUSES) \
+            .lte("start_date", end_date_str) \
+            .gte("end_date", start_date_str))
+        bookings = [(row['start_date'], row['end_date'], row['unit_no']) for row in (conflict_response.data or [])]
+        if not free_unit_numbers(int(eq_response.data.get('quantity') or 0), bookings, start_date_str, end_date_str):
             return f"오류: 선택한 장비 '{equipment_name}'는 해당 기간 ({start_date_str} ~ {end_date_str})에 이미 대여 중입니다.", selected_equipment_ids
 
-        rental_data = {
-            "equipment_id": equipment_id_to_rent, "start_date": start_date_str, "end_date": end_date_str,
-            "borrower_name": borrower_name, "purpose": purpose_text, "user_id": user_id, "status": "confirmed"
-        }
-        insert_res = client.table("rentals").insert(rental_data).execute()
+        insert_res = backend_write("rental.insert", client.table("rentals").insert(rental_data))
 
         if not (hasattr(insert_res, 'data') and insert_res.data and len(insert_res.data) > 0):
             error_detail = "대여 정보 저장 중 알 수 없는 오류."
@@ -132,23 +230,181 @@ def process_rental_request(
             print(f"Rental insert failed: {error_detail} (Response: {insert_res})")
             return f"대여 정보 저장 실패: {error_detail}", selected_equipment_ids
 
-        new_available_quantity = current_available_quantity - 1
-        update_eq_res = client.table("equipments").update({"available_quantity": new_available_quantity}).eq("id", equipment_id_to_rent).execute()
-
-        if not (hasattr(update_eq_res, 'data') and update_eq_res.data and len(update_eq_res.data) > 0):
-            print(f"Warning: Equip quantity update for {equipment_id_to_rent} failed: {update_eq_res}")
-            return f"성공: '{equipment_name}' 대여 완료. 단, 수량 업데이트 실패. 관리자 확인 필요.", []
-
+        # available_quantity and the event log are kept by database triggers (migrations/0004, 0006).
         return f"성공: 장비 '{equipment_name}' 대여 신청 완료. ({start_date_str} ~ {end_date_str})", []
+    except NotFound:
+        return f"오류: 장비 ID '{equipment_id_to_rent}' 정보를 찾을 수 없습니다.", selected_equipment_ids
+    except PermissionDenied as e:
+        return f"오류: 보안 정책 위반. {e.message}", selected_equipment_ids
+    except ExclusionViolation as e:
+        print(f"Rental rejected by {e.constraint}: {e.message}")
+        return f"오류: 선택한 장비는 해당 기간 ({start_date_str} ~ {end_date_str})에 이미 대여 중입니다.", selected_equipment_ids
     except Exception as e:
         print(f"Error processing rental request: {e}, {type(e)}")
-        err_msg = str(e)
-        if "violates row-level security policy" in err_msg:
-            return f"오류: 보안 정책 위반. {err_msg}", selected_equipment_ids
-        if "check_constraint" in err_msg and "available_quantity" in err_msg:
-            return "오류: DB 제약 조건 위반(수량). 동시 요청일 수 있습니다. 새로고침 후 다시 시도하세요.", selected_equipment_ids
-        return f"대여 처리 중 서버 오류: {err_msg}", selected_equipment_ids
+        return _failure_message("대여 처리 중 서버 오류", e), selected_equipment_ids
+
+def fetch_booked_units(equipment_id: str) -> Tuple[Optional[int], List[Tuple[str, str, int]]]:
+    """
+    Returns (quantity, [(start_date, end_date, unit_no)]) of the active rentals of one equipment ending today
+    or later; quantity is None for an unknown equipment. Raises on backend errors.
+    """
+    client = get_supabase_client()
+    if not client:
+        raise RuntimeError(get_supabase_init_error() or "Supabase client not initialized.")
+    eq_response = backend_read("booked_units.equipment", client.table("equipments").select("quantity").eq("id", equipment_id))
+    if not eq_response.data:
+        return None, []
+    response = backend_read("booked_units", client.table("rentals").select("start_date, end_date, unit_no") \
+        .eq("equipment_id", equipment_id).in_("status", ACTIVE_RENTAL_STATUSES).gte("end_date", date.today().isoformat()))
+    return int(eq_response.data[0].get('quantity') or 0), [(row['start_date'], row['end_date'], row['unit_no']) for row in (response.data or [])]
+
+def commit_rental_batch(rental_rows: List[Dict[str, Any]]) -> Dict[str, Tuple[str, str]]:
+    """
+    Commits journaled rentals (each carrying an 'idempotency_key') through the commit_rental_batch
+    RPC (migrations/0006_rental_capacity.sql): the unit checks, the inserts and the available_quantity
+    updates run in one database transaction, in batch order. Keys already in 'rentals' are reported
+    as committed without being re-inserted, so replaying a batch never double-books.
+    Returns {idempotency_key: (status, message)} with status 'committed' or 'rejected'.
+    Raises on backend/network errors so the caller can retry the whole batch later.
+    Runs outside any request, with the service-role client when configured; the user ids were taken
+    from the signed-in sessions at submission.
+    """
+    client = get_supabase_admin_client() or get_supabase_client()
+    if not client:
+        raise RuntimeError(get_supabase_init_error() or "Supabase client not initialized.")
+    if not rental_rows:
+        return {}
+
+    rows_by_key = {row['idempotency_key']: row for row in rental_rows}
+    response = backend_write("rental_batch.commit", client.rpc("commit_rental_batch", {"p_rentals": rental_rows}))
+    outcomes: Dict[str, Tuple[str, str]] = {}
+    for result in (response.data or []):
+        key = result['idempotency_key']
+        row = rows_by_key.get(key)
+        if not row:
+            continue
+        eq_id = row['equipment_id']
+        equipment_name = result.get('equipment_name') or eq_id
+        outcome = result['outcome']
+        if outcome == "duplicate":
+            outcomes[key] = ("committed", "성공: 대여 신청이 이미 처리되었습니다.")
+        elif outcome == "committed":
+            outcomes[key] = ("committed", f"성공: 장비 '{equipment_name}' 대여 신청 완료. ({row['start_date']} ~ {row['end_date']})")
+        elif outcome == "missing":
+            outcomes[key] = ("rejected", f"오류: 장비 ID '{eq_id}' 정보를 찾을 수 없습니다.")
+        else:
+            outcomes[key] = ("rejected", f"오류: 선택한 장비 '{equipment_name}'는 해당 기간 ({row['start_date']} ~ {row['end_date']})에 이미 대여 중입니다.")
+    return outcomes
 
+def fetch_schedule_inputs(min_start: str, max_end: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Loads every equipment and the active rentals (with unit_no) overlapping [min_start, max_end] for batch_scheduler. Raises on errors."""
+    client = get_supabase_client()
+    if not client:
+        raise RuntimeError(get_supabase_init_error() or "Supabase client not initialized.")
+    eq_res = backend_read("schedule.equipments", client.table("equipments").select("id, name, department, quantity").order("id", desc=False))
+    booked_res = backend_read("schedule.booked", client.table("rentals").select("equipment_id, start_date, end_date, unit_no") \
+        .in_("status", ACTIVE_RENTAL_STATUSES).lte("start_date", max_end).gte("end_date", min_start))
+    return eq_res.data or [], booked_res.data or []
+
+SCHEDULE_INSERT_DEADLINE = 30.0 # A semester plan can be thousands of rows in one insert
+
+def commit_schedule_plan(
+    accepted_rows: List[Dict[str, Any]], borrower_name: str, purpose_text: str, user_session: Optional[Any]
+) -> Tuple[str, int]:
+    """
+    Inserts an allocated plan (batch_scheduler.allocate_plan 'accepted' rows) as one bulk insert,
+    one 'rentals' row per unit on the unit the allocation picked. available_quantity follows from
+    the database triggers like for every other rental (migrations/0006_rental_capacity.sql).
+    Returns (message, inserted_row_count).
+    """
+    client = get_user_client(user_session)
+    if not client:
+        return get_supabase_init_error() or "Supabase client not initialized.", 0
+    if not user_session or not hasattr(user_session, 'user') or not user_session.user or not hasattr(user_session.user, 'id'):
+        return "오류: 사용자 세션 또는 ID가 없습니다. 다시 로그인 해주세요.", 0
+    if not borrower_name or not purpose_text:
+        return "오류: 대여자명과 사용 목적을 입력해야 합니다.", 0
+    if not accepted_rows:
+        return "오류: 확정할 예약이 없습니다.", 0
+
+    rental_rows = []
+    for row in accepted_rows:
+        for unit_no in row['unit_nos']:
+            rental_rows.append({
+                "equipment_id": row['equipment_id'], "start_date": row['start_date'], "end_date": row['end_date'], "unit_no": unit_no,
+                "borrower_name": borrower_name, "purpose": purpose_text, "user_id": user_session.user.id, "status": "confirmed"
+            })
+    try:
+        insert_res = backend_write("schedule.insert", client.table("rentals").insert(rental_rows), deadline=SCHEDULE_INSERT_DEADLINE)
+        if not (hasattr(insert_res, 'data') and insert_res.data):
+            print(f"Schedule plan insert failed: {insert_res}")
+            return "일괄 예약 저장 실패: 대여 정보 저장 중 알 수 없는 오류.", 0
+        return f"성공: 일괄 예약 {len(insert_res.data)}건이 저장되었습니다.", len(insert_res.data)
+    except ExclusionViolation:
+        return "일괄 예약 저장 실패: 일부 장비가 해당 기간에 이미 대여 중입니다. 미리보기를 다시 실행하세요.", 0
+    except Exception as e:
+        print(f"Error committing schedule plan: {e}")
+        return _failure_message("일괄 예약 처리 중 서버 오류", e), 0
+
+def refresh_available_quantities() -> int:
+    """Recomputes available_quantity for rentals that started or ended with the date change. Returns changed equipments. Raises on errors."""
+    client = get_supabase_admin_client() or get_supabase_client()
+    if not client:
+        raise RuntimeError(get_supabase_init_error() or "Supabase client not initialized.")
+    response = backend_write("available_quantity.refresh", client.rpc("refresh_available_quantities", {}))
+    return int(response.data or 0)
+
+OVERDUE_PAGE_SIZE = 500 # Rows per page when listing newly overdue rentals
+OVERDUE_UPDATE_CHUNK = 200 # IDs per batch status update (keeps the PostgREST URL short)
+
+def fetch_newly_overdue_rentals(after_end_date: Optional[str], before_end_date: str) -> List[Dict[str, Any]]:
+    """
+    Confirmed rentals with after_end_date < end_date < before_end_date (after_end_date None = no lower bound),
+    ordered by end_date. Served by the (status, end_date) index. Raises on backend errors.
+    """
+    client = get_supabase_admin_client() or get_supabase_client() # Every user's rentals, outside any request
+    if not client:
+        raise RuntimeError(get_supabase_init_error() or "Supabase client not initialized.")
+    rows: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        query = client.table("rentals").select("id, equipment_id, user_id, borrower_name, start_date, end_date, equipments(name)") \
+            .eq("status", "confirmed").lt("end_date", before_end_date)
+        if after_end_date:
+            query = query.gt("end_date", after_end_date)
+        response = backend_read("overdue.page", query.order("end_date", desc=False).order("id", desc=False) \
+            .range(offset, offset + OVERDUE_PAGE_SIZE - 1))
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < OVERDUE_PAGE_SIZE:
+            return rows
+        offset += OVERDUE_PAGE_SIZE
+
+def mark_rentals_overdue(rental_ids: List[Any]) -> int:
+    """Flips the given rentals from 'confirmed' to 'overdue' in chunked batch updates. Returns updated row count."""
+    client = get_supabase_admin_client() or get_supabase_client()
+    if not client:
+        raise RuntimeError(get_supabase_init_error() or "Supabase client not initialized.")
+    updated = 0
+    for i in range(0, len(rental_ids), OVERDUE_UPDATE_CHUNK):
+        chunk = rental_ids[i:i + OVERDUE_UPDATE_CHUNK]
+        response = backend_write("overdue.mark", client.table("rentals").update({"status": "overdue"}) \
+            .in_("id", chunk).eq("status", "confirmed"))
+        updated += len(response.data or [])
+    return updated
+
+def count_overdue_rentals() -> Tuple[Optional[int], str]:
+    client = get_supabase_client()
+    if not client:
+        return None, get_supabase_init_error() or "Supabase client not initialized."
+    try:
+        response = backend_read("overdue.count", client.table("rentals").select("id", count="exact").eq("status", "overdue").limit(1))
+        return response.count or 0, "연체 대여 건수를 불러왔습니다."
+    except Exception as e:
+        print(f"Error counting overdue rentals: {e}")
+        return None, _failure_message("연체 대여 건수 조회 중 오류 발생", e)
+
+@profiled
 def fetch_all_equipments_admin() -> Tuple[pd.DataFrame, str]:
     client = get_supabase_client()
     empty_df_cols = ['ID', '장비명', '부서', '총량', '가용량']
@@ -156,7 +412,7 @@ def fetch_all_equipments_admin() -> Tuple[pd.DataFrame, str]:
     if not client:
         return empty_df, get_supabase_init_error() or "Supabase client not initialized."
     try:
-        response = client.table("equipments").select("id, name, department, quantity, available_quantity").order("id", desc=False).execute()
+        response = backend_read("admin.equipments", client.table("equipments").select("id, name, department, quantity, available_quantity").order("id", desc=False))
         if response.data:
             df = pd.DataFrame(response.data)
             expected_cols_map = {'id':'ID', 'name':'장비명', 'department':'부서', 'quantity':'총량', 'available_quantity':'가용량'}
@@ -170,12 +426,12 @@ def fetch_all_equipments_admin() -> Tuple[pd.DataFrame, str]:
             return empty_df, "등록된 장비가 없습니다."
     except Exception as e:
         print(f"Error in fetch_all_equipments_admin: {e}")
-        return empty_df, f"관리자 장비 조회 오류: {str(e)}"
+        return empty_df, _failure_message("관리자 장비 조회 오류", e)
 
 def add_equipment_admin(
-    eq_id: str, name: str, dept: str, qty_str: str
+    eq_id: str, name: str, dept: str, qty_str: str, user_session: Optional[Any] = None
 ) -> Tuple[str, Optional[str], Optional[str], Optional[str], Optional[str]]:
-    client = get_supabase_client()
+    client = get_user_client(user_session)
     if not client:
         return get_supabase_init_error() or "Supabase client not initialized.", eq_id, name, dept, qty_str
 
@@ -193,12 +449,12 @@ def add_equipment_admin(
         return "ID는 공백일 수 없습니다.", processed_eq_id, name, dept, qty_str
 
     try:
-        existing_eq = client.table("equipments").select("id", count="exact").eq("id", processed_eq_id).execute()
+        existing_eq = backend_read("admin.equipment_exists", client.table("equipments").select("id", count="exact").eq("id", processed_eq_id))
         if existing_eq.count > 0:
             return f"오류: 장비 ID '{processed_eq_id}'는 이미 존재합니다.", processed_eq_id, name, dept, qty_str
 
         data = {"id": processed_eq_id, "name": name, "department": dept, "quantity": qty, "available_quantity": qty}
-        insert_res = client.table("equipments").insert(data).execute()
+        insert_res = backend_write("admin.equipment_insert", client.table("equipments").insert(data))
 
         if not (hasattr(insert_res, 'data') and insert_res.data and len(insert_res.data) > 0):
             error_detail = "장비 추가 DB 저장 중 알 수 없는 오류."
@@ -208,15 +464,17 @@ def add_equipment_admin(
             return f"장비 추가 DB 오류: {error_detail}", processed_eq_id, name, dept, qty_str
 
         return f"성공: 장비 '{name}' (ID: {processed_eq_id}) 추가 완료.", None, None, None, None
+    except UniqueViolation:
+        return f"오류: 장비 ID '{processed_eq_id}'는 이미 존재합니다.", processed_eq_id, name, dept, qty_str
     except Exception as e:
         print(f"Error in add_equipment_admin: {e}")
-        return f"장비 추가 처리 중 서버 오류: {str(e)}", processed_eq_id, name, dept, qty_str
+        return _failure_message("장비 추가 처리 중 서버 오류", e), processed_eq_id, name, dept, qty_str
 
 def update_equipment_admin(
     original_item_state: Optional[Dict[str, Any]], new_id_str: str, name: str,
-    dept: str, new_qty_str: str
+    dept: str, new_qty_str: str, user_session: Optional[Any] = None
 ) -> Tuple[str, Optional[Dict[str, Any]], Optional[str], Optional[str], Optional[str], Optional[str]]:
-    client = get_supabase_client()
+    client = get_user_client(user_session)
     if not client:
         return get_supabase_init_error() or "Supabase client not initialized.", original_item_state, new_id_str, name, dept, new_qty_str
 
@@ -240,26 +498,15 @@ def update_equipment_admin(
         return "ID는 공백일 수 없습니다.", original_item_state, processed_new_id, name, dept, new_qty_str
 
     try:
-        current_eq_data_res = client.table("equipments").select("quantity, available_quantity").eq("id", original_id).single().execute()
-        if not hasattr(current_eq_data_res, 'data') or not current_eq_data_res.data:
-            return f"오류: 원본 장비 ID '{original_id}'를 찾을 수 없습니다.", original_item_state, processed_new_id, name, dept, new_qty_str
-        current_eq_data = current_eq_data_res.data
-
-        rented_qty = current_eq_data.get('quantity', 0) - current_eq_data.get('available_quantity', 0)
-        new_available_qty = new_qty - rented_qty
-
-        if new_available_qty < 0:
-            return f"오류: 새 총 수량({new_qty})은 현재 대여된 수량({rented_qty})보다 적을 수 없습니다. 최소 {rented_qty} 이상이어야 합니다.", original_item_state, processed_new_id, name, dept, new_qty_str
-
-        update_payload: Dict[str, Any] = {
-            "name": name, "department": dept, "quantity": new_qty, "available_quantity": new_available_qty
-        }
+        # available_quantity is derived by the database, which also rejects a quantity below the units held
+        # by current and future rentals (migrations/0006_rental_capacity.sql).
+        update_payload: Dict[str, Any] = {"name": name, "department": dept, "quantity": new_qty}
 
         # Handle ID change. This is complex.
         # If processed_new_id is different from original_id, it means user wants to change the ID.
         if processed_new_id != original_id:
             # Check if new ID already exists
-            existing_check = client.table("equipments").select("id", count="exact").eq("id", processed_new_id).execute()
+            existing_check = backend_read("admin.equipment_exists", client.table("equipments").select("id", count="exact").eq("id", processed_new_id))
             if existing_check.count > 0:
                 return f"오류: 변경하려는 새 ID '{processed_new_id}'가 이미 다른 장비에 사용 중입니다.", original_item_state, processed_new_id, name, dept, new_qty_str
 
@@ -273,24 +520,35 @@ def update_equipment_admin(
             print(f"Attempting to change equipment ID from {original_id} to {processed_new_id}")
 
 
-        update_response = client.table("equipments").update(update_payload).eq("id", original_id).execute()
+        update_response = backend_write("admin.equipment_update", client.table("equipments").update(update_payload).eq("id", original_id))
 
         if not (hasattr(update_response, 'data') and update_response.data and len(update_response.data) > 0):
-            error_detail = "장비 정보 업데이트 DB 저장 중 알 수 없는 오류."
-            if hasattr(update_response, 'error') and update_response.error and hasattr(update_response.error, 'message'):
-                 error_detail = update_response.error.message
-
-            if processed_new_id != original_id and ("primary key" in error_detail.lower() or "constraint" in error_detail.lower()):
-                 error_detail = f"장비 ID(PK)는 직접 변경할 수 없습니다. 새 ID로 장비를 추가하고 기존 장비를 삭제하는 방식을 사용해야 합니다. ({error_detail})"
-            print(f"Update equipment failed: {error_detail} (Response: {update_response})")
-            return f"장비 정보 업데이트 실패: {error_detail}", original_item_state, processed_new_id, name, dept, new_qty_str
+            # Backend errors are raised as typed exceptions (handled below); no rows means nothing matched original_id.
+            return f"오류: 원본 장비 ID '{original_id}'를 찾을 수 없습니다.", original_item_state, processed_new_id, name, dept, new_qty_str
 
         final_id = processed_new_id if processed_new_id != original_id else original_id
         return f"성공: 장비 ID '{original_id}' 정보가 '{final_id}'로 업데이트되었습니다.", None, None, None, None, None
+    except NotFound:
+        return f"오류: 원본 장비 ID '{original_id}'를 찾을 수 없습니다.", original_item_state, processed_new_id, name, dept, new_qty_str
+    except UniqueViolation:
+        return f"오류: 변경하려는 새 ID '{processed_new_id}'가 이미 다른 장비에 사용 중입니다.", original_item_state, processed_new_id, name, dept, new_qty_str
+    except CheckViolation as e:
+        if e.constraint == "equipments_quantity_covers_bookings":
+            return f"오류: 새 총 수량({new_qty})보다 높은 번호의 장비 단위에 진행 중이거나 예정된 대여가 있습니다. 해당 대여를 정리하거나 수량을 늘리세요.", original_item_state, processed_new_id, name, dept, new_qty_str
+        if e.constraint == "equipments_available_quantity_check":
+            return "오류: DB 제약 조건 위반(수량). 동시 요청일 수 있습니다. 새로고침 후 다시 시도하세요.", original_item_state, processed_new_id, name, dept, new_qty_str
+        return f"장비 수정 처리 중 서버 오류: {e.message}", original_item_state, processed_new_id, name, dept, new_qty_str
+    except ConstraintViolation as e:
+        if processed_new_id != original_id: # Rentals still reference the old ID
+            return f"장비 정보 업데이트 실패: 장비 ID(PK)는 직접 변경할 수 없습니다. 새 ID로 장비를 추가하고 기존 장비를 삭제하는 방식을 사용해야 합니다. ({e.message})", original_item_state, processed_new_id, name, dept, new_qty_str
+        return f"장비 수정 처리 중 서버 오류: {e.message}", original_item_state, processed_new_id, name, dept, new_qty_str
     except Exception as e:
         print(f"Error in update_equipment_admin: {e}, {type(e)}")
-        return f"장비 수정 처리 중 서버 오류: {str(e)}", original_item_state, processed_new_id, name, dept, new_qty_str
+        return _failure_message("장비 수정 처리 중 서버 오류", e), original_item_state, processed_new_id, name, dept, new_qty_str
+
+ALL_RENTALS_READ_DEADLINE = 15.0 # Unpaginated full-table read
 
+@profiled
 def fetch_all_rental_details() -> Tuple[pd.DataFrame, str]:
     client = get_supabase_client()
     # Define column names for the DataFrame
@@ -304,9 +562,9 @@ def fetch_all_rental_details() -> Tuple[pd.DataFrame, str]:
         # Query rentals and join with equipments to get equipment name.
         # Assumes 'rentals' has 'equipment_id', 'borrower_name', 'quantity', 'start_date', 'end_date', 'status'.
         # Assumes 'equipments' has 'id' (matching 'equipment_id') and 'name'.
-        response = client.table("rentals").select(
+        response = backend_read("rentals.all", client.table("rentals").select(
             "borrower_name, start_date, end_date, quantity, status, equipments!inner(name)"
-        ).order("start_date", desc=True).execute()
+        ).order("start_date", desc=True), deadline=ALL_RENTALS_READ_DEADLINE)
 
         if response.data:
             data_for_df = []
@@ -344,21 +602,7 @@ def fetch_all_rental_details() -> Tuple[pd.DataFrame, str]:
             return empty_df, "대여 현황 데이터가 없습니다." # Or "response.error.message" if available
 
     except Exception as e:
-        error_message = str(e)
-        # Attempt to parse PostgREST error for more specific messages
-        try:
-            import json
-            error_payload = json.loads(error_message)
-            if isinstance(error_payload, dict) and "message" in error_payload:
-                error_message = error_payload["message"]
-        except:
-            pass # Keep original error_message if it's not JSON
-
-        print(f"Error fetching all rental details: {error_message}")
-
-        if "column" in error_message.lower() and "does not exist" in error_message.lower():
-             if 'quantity' in error_message.lower() and 'rentals' in error_message.lower(): # Make check case-insensitive
-                 return empty_df, f"데이터베이스 오류: 'rentals' 테이블에 'quantity' 컬럼이 없는 것 같습니다. ({error_message})"
-
-        # General error message
-        return empty_df, f"전체 대여 현황 조회 중 오류 발생: {error_message}"
+        print(f"Error fetching all rental details: {e}")
+        if isinstance(e, BackendError) and e.code == "42703": # undefined_column
+            return empty_df, f"데이터베이스 오류: 'rentals' 또는 'equipments' 테이블에 필요한 컬럼이 없습니다. 마이그레이션을 확인하세요. ({e.message})"
+        return empty_df, _failure_message("전체 대여 현황 조회 중 오류 발생", e)
@@ -0,0 +1,219 @@
+import copy
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+from backend_calls import backend_read, backend_write
+
+# Append-only log of equipment/rental mutations with periodic state snapshots.
+# Database triggers record a typed event for every insert, update and delete on equipments and
+# rentals; the tables stay the current-state view. A background job (see app.start_background_services)
+# saves the state folded from the log as a snapshot once SNAPSHOT_EVERY events have accumulated, so
+# reconstructing the state at any moment loads the nearest earlier snapshot and replays about
+# SNAPSHOT_EVERY events instead of the whole history.
+# Schema and triggers: migrations/0004_event_log.sql.
+
+DEFAULT_SNAPSHOT_EVERY = 500
+EVENT_PAGE_SIZE = 1000
+# occurred_at is assigned by the database at insert, so it can trail seq order slightly between
+# concurrent writers; the replay window starts this much before the snapshot's last event.
+ORDERING_SLACK = timedelta(seconds=60)
+
+EVENT_EQUIPMENT_ADDED = "equipment_added"
+EVENT_EQUIPMENT_UPDATED = "equipment_updated"
+EVENT_EQUIPMENT_REMOVED = "equipment_removed"
+EVENT_RENTAL_CREATED = "rental_created"
+EVENT_RENTAL_UPDATED = "rental_updated"
+EVENT_RENTAL_STATUS_CHANGED = "rental_status_changed"
+EVENT_RENTAL_REMOVED = "rental_removed"
+
+# Payload fields per event type, as written by the triggers; make_event rejects events that do not match.
+EVENT_FIELDS: Dict[str, tuple] = {
+    EVENT_EQUIPMENT_ADDED: ("equipment_id", "name", "department", "quantity", "available_quantity"),
+    EVENT_EQUIPMENT_UPDATED: ("equipment_id", "previous_id", "name", "department", "quantity", "available_quantity",
+                              "previous_quantity", "previous_available_quantity"),
+    EVENT_EQUIPMENT_REMOVED: ("equipment_id",),
+    EVENT_RENTAL_CREATED: ("rental_id", "equipment_id", "start_date", "end_date", "status"),
+    EVENT_RENTAL_UPDATED: ("rental_id", "equipment_id", "start_date", "end_date", "status"),
+    EVENT_RENTAL_STATUS_CHANGED: ("rental_id", "status"),
+    EVENT_RENTAL_REMOVED: ("rental_id",),
+}
+# Optional fields kept when present
+RENTAL_OPTIONAL_FIELDS = ("quantity", "user_id", "borrower_name")
+EVENT_OPTIONAL_FIELDS: Dict[str, tuple] = {
+    EVENT_RENTAL_CREATED: RENTAL_OPTIONAL_FIELDS,
+    EVENT_RENTAL_UPDATED: RENTAL_OPTIONAL_FIELDS,
+    EVENT_RENTAL_STATUS_CHANGED: ("equipment_id", "previous_status"),
+    EVENT_RENTAL_REMOVED: ("equipment_id",),
+}
+
+ON_LOAN_STATUSES = ("confirmed", "overdue")
+
+def make_event(event_type: str, actor: Optional[str] = None, **fields: Any) -> Dict[str, Any]:
+    """
+    Builds a log row {event_type, equipment_id, actor, payload} shaped like the triggers' rows.
+    Raises ValueError for unknown types or missing fields.
+    """
+    if event_type not in EVENT_FIELDS:
+        raise ValueError(f"Unknown event type: {event_type}")
+    missing = [name for name in EVENT_FIELDS[event_type] if name not in fields]
+    if missing:
+        raise ValueError(f"{event_type} event missing fields: {', '.join(missing)}")
+    allowed = EVENT_FIELDS[event_type] + EVENT_OPTIONAL_FIELDS.get(event_type, ())
+    payload = {name: fields[name] for name in allowed if name in fields}
+    return {"event_type": event_type, "equipment_id": payload.get("equipment_id"), "actor": actor, "payload": payload}
+
+def empty_state() -> Dict[str, Any]:
+    return {"equipments": {}, "rentals": {}}
+
+def apply_event(state: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """Folds one event into state in place (and returns it)."""
+    event_type, payload = event["event_type"], event["payload"]
+    equipments, rentals = state["equipments"], state["rentals"]
+    if event_type == EVENT_EQUIPMENT_ADDED:
+        equipments[payload["equipment_id"]] = {
+            "name": payload["name"], "department": payload["department"],
+            "quantity": payload["quantity"], "available_quantity": payload["available_quantity"],
+        }
+    elif event_type == EVENT_EQUIPMENT_UPDATED:
+        previous_id, new_id = payload["previous_id"], payload["equipment_id"]
+        equipments.pop(previous_id, None)
+        equipments[new_id] = {
+            "name": payload["name"], "department": payload["department"],
+            "quantity": payload["quantity"], "available_quantity": payload["available_quantity"],
+        }
+        if previous_id != new_id:
+            for rental in rentals.values():
+                if rental["equipment_id"] == previous_id:
+                    rental["equipment_id"] = new_id
+    elif event_type == EVENT_EQUIPMENT_REMOVED:
+        equipments.pop(payload["equipment_id"], None)
+    elif event_type in (EVENT_RENTAL_CREATED, EVENT_RENTAL_UPDATED):
+        rentals[str(payload["rental_id"])] = {
+            "equipment_id": payload["equipment_id"], "start_date": payload["start_date"], "end_date": payload["end_date"],
+            "status": payload["status"], "quantity": payload.get("quantity", 1),
+            "user_id": payload.get("user_id"), "borrower_name": payload.get("borrower_name"),
+        }
+    elif event_type == EVENT_RENTAL_STATUS_CHANGED:
+        rental = rentals.get(str(payload["rental_id"]))
+        if rental is not None:
+            rental["status"] = payload["status"]
+    elif event_type == EVENT_RENTAL_REMOVED:
+        rentals.pop(str(payload["rental_id"]), None)
+    return state
+
+def rentals_on_loan(state: Dict[str, Any], day: str) -> List[Dict[str, Any]]:
+    """Rentals in state whose period covers day (ISO date), sorted by equipment and start."""
+    on_loan = []
+    for rental_id, rental in state["rentals"].items():
+        if rental["status"] in ON_LOAN_STATUSES and rental["start_date"] <= day <= rental["end_date"]:
+            equipment = state["equipments"].get(rental["equipment_id"], {})
+            on_loan.append(dict(rental, rental_id=rental_id, equipment_name=equipment.get("name")))
+    return sorted(on_loan, key=lambda r: (r["equipment_id"], r["start_date"], r["rental_id"]))
+
+class SupabaseEventStore:
+    """Event and snapshot storage in the equipment_events / equipment_state_snapshots tables."""
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    def latest_seq(self) -> int:
+        response = backend_read("event_log.latest_seq", self.client.table("equipment_events").select("seq").order("seq", desc=True).limit(1))
+        return response.data[0]["seq"] if response.data else 0
+
+    def committed_seq(self) -> int:
+        """Highest seq at or below which every event is committed (event_log_committed_seq in 0004)."""
+        response = backend_read("event_log.committed_seq", self.client.rpc("event_log_committed_seq", {}))
+        return int(response.data or 0)
+
+    def latest_snapshot(self, at: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        query = self.client.table("equipment_state_snapshots").select("last_seq, last_occurred_at, state")
+        if at is not None:
+            query = query.lte("last_occurred_at", at)
+        response = backend_read("event_log.latest_snapshot", query.order("last_seq", desc=True).limit(1))
+        return response.data[0] if response.data else None
+
+    def events_after(self, seq: int, since: Optional[str] = None, at: Optional[str] = None,
+                     up_to_seq: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Events with seq > seq (and <= up_to_seq), in seq order, fetched page by page. since/at bound
+        occurred_at so the (occurred_at, seq) index limits the scan to the window after the snapshot.
+        """
+        while True:
+            query = self.client.table("equipment_events").select("seq, event_type, equipment_id, actor, payload, occurred_at").gt("seq", seq)
+            if up_to_seq is not None:
+                query = query.lte("seq", up_to_seq)
+            if since is not None:
+                query = query.gte("occurred_at", since)
+            if at is not None:
+                query = query.lte("occurred_at", at)
+            page = backend_read("event_log.events", query.order("seq", desc=False).limit(EVENT_PAGE_SIZE)).data or []
+            yield from page
+            if len(page) < EVENT_PAGE_SIZE:
+                return
+            seq = page[-1]["seq"]
+
+    def save_snapshot(self, last_seq: int, last_occurred_at: str, state: Dict[str, Any]) -> None:
+        # Two workers may snapshot the same position; the unique last_seq keeps one.
+        backend_write("event_log.save_snapshot", self.client.table("equipment_state_snapshots").upsert(
+            {"last_seq": last_seq, "last_occurred_at": last_occurred_at, "state": state},
+            on_conflict="last_seq", ignore_duplicates=True,
+        ))
+
+    def equipment_events(self, equipment_id: str, limit: int) -> List[Dict[str, Any]]:
+        response = backend_read("event_log.equipment_history", self.client.table("equipment_events").select("seq, event_type, equipment_id, actor, payload, occurred_at") \
+            .eq("equipment_id", equipment_id).order("seq", desc=True).limit(limit))
+        return response.data or []
+
+class EventLog:
+    def __init__(self, store: Any, snapshot_every: int = DEFAULT_SNAPSHOT_EVERY):
+        self.store = store
+        self.snapshot_every = snapshot_every
+
+    def snapshot_if_due(self) -> Optional[int]:
+        """
+        Takes a snapshot once snapshot_every events were logged after the latest one (by seq distance:
+        sequence values can have gaps). Returns the sequence number it covers, or None if not due.
+        """
+        snapshot = self.store.latest_snapshot() # Possibly taken by another process
+        if self.store.latest_seq() - (snapshot["last_seq"] if snapshot else 0) < self.snapshot_every:
+            return None
+        return self.take_snapshot()
+
+    def _fold(self, at: Optional[str], up_to_seq: Optional[int] = None) -> tuple:
+        """Returns (state, last_seq, last_occurred_at) as of at (None = now), folding no event past up_to_seq."""
+        snapshot = self.store.latest_snapshot(at)
+        since = None
+        if snapshot:
+            state = copy.deepcopy(snapshot["state"])
+            last_seq, last_occurred_at = snapshot["last_seq"], snapshot["last_occurred_at"]
+            since = (datetime.fromisoformat(last_occurred_at) - ORDERING_SLACK).isoformat()
+        else:
+            state, last_seq, last_occurred_at = empty_state(), 0, None
+        for event in self.store.events_after(last_seq, since, at, up_to_seq):
+            apply_event(state, event)
+            last_seq, last_occurred_at = event["seq"], event["occurred_at"]
+        return state, last_seq, last_occurred_at
+
+    def take_snapshot(self) -> Optional[int]:
+        """
+        Saves the current folded state. Returns the sequence number it covers (None if the log is empty).
+        Sequence values become visible in commit order, not in number order: an event still being
+        committed can hold a lower seq than one already visible, and later folds only replay past a
+        snapshot's last_seq. The snapshot therefore stops at the committed horizon.
+        """
+        state, last_seq, last_occurred_at = self._fold(None, self.store.committed_seq())
+        if not last_seq:
+            return None
+        self.store.save_snapshot(last_seq, last_occurred_at, state)
+        return last_seq
+
+    def state_at(self, at: str) -> Dict[str, Any]:
+        """Equipment and rental state as of the ISO timestamp at."""
+        return self._fold(at)[0]
+
+    def on_loan_at(self, day: str) -> List[Dict[str, Any]]:
+        """What was on loan on day (YYYY-MM-DD), as the log knew it at the end of that day (UTC)."""
+        return rentals_on_loan(self.state_at(f"{day}T23:59:59.999999+00:00"), day)
+
+    def equipment_history(self, equipment_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest events for one equipment (who changed what and when), newest first."""
+        return self.store.equipment_events(equipment_id, limit)
@@ -0,0 +1,238 @@
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+# On-demand sampling profiler for Gradio event handlers.
+# Handlers decorated with @profiled run untouched unless profiling is enabled and the invocation
+# is sampled (sample_rate). A sampled invocation registers its thread with one background sampler
+# that records the call stack every few milliseconds. Each sample is attributed to a phase by the
+# frames on the stack: network wait (HTTP client / socket / ssl), DataFrame build (pandas / numpy)
+# or other Python. Gradio serializes outputs after the handler returns, so serialization is
+# measured by encoding the returned DataFrames the same way (to_dict(orient="split") + JSON).
+# Output per handler and process: <output_dir>/<handler>.<pid>.folded (collapsed stacks, usable with
+# flamegraph.pl or speedscope) and one JSON line per sampled invocation in summary.<pid>.jsonl.
+
+DEFAULT_OUTPUT_DIR = "profiles"
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_SAMPLE_INTERVAL = 0.005 # seconds between stack samples
+DEFAULT_CONFIG_REFRESH_SECONDS = 5.0
+MAX_STACK_DEPTH = 64
+
+PHASE_NETWORK = "network"
+PHASE_DATAFRAME = "dataframe"
+PHASE_SERIALIZATION = "serialization"
+PHASE_OTHER = "other"
+
+# backend_calls.py: the handler thread waits there while the request runs on the backend-call pool
+_NETWORK_MARKERS = ("/httpx/", "/httpcore/", "/h2/", "/urllib3/", "/requests/", "socket.py", "ssl.py", "selectors.py", "/backend_calls.py")
+_DATAFRAME_MARKERS = ("/pandas/", "/numpy/")
+
+def classify_stack(filenames: List[str]) -> str:
+    """Phase of one sample; network wins over DataFrame when both appear (e.g. a fetch inside a pandas call)."""
+    if any(marker in name for name in filenames for marker in _NETWORK_MARKERS):
+        return PHASE_NETWORK
+    if any(marker in name for name in filenames for marker in _DATAFRAME_MARKERS):
+        return PHASE_DATAFRAME
+    return PHASE_OTHER
+
+def estimate_serialization_seconds(result: Any) -> float:
+    """Time to encode the DataFrames in a handler result the way gr.DataFrame sends them."""
+    outputs = result if isinstance(result, tuple) else (result,)
+    started = time.perf_counter()
+    for value in outputs:
+        if isinstance(value, pd.DataFrame):
+            json.dumps(value.to_dict(orient="split"), default=str, ensure_ascii=False)
+    return time.perf_counter() - started
+
+class _Capture:
+    """Samples collected for one handler invocation."""
+
+    def __init__(self, root_frame: Any):
+        self.root_frame = root_frame
+        self.stacks: Counter = Counter()
+        self.phases: Counter = Counter()
+
+    def add(self, frame: Any) -> None:
+        names, filenames = [], []
+        while frame is not None and frame is not self.root_frame and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            filenames.append(code.co_filename.replace("\\", "/"))
+            frame = frame.f_back
+        phase = classify_stack(filenames)
+        self.phases[phase] += 1
+        self.stacks[(phase,) + tuple(reversed(names))] += 1
+
+class _StackSampler:
+    """One daemon thread sampling every registered thread; it sleeps on an event while nothing is profiled."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._targets: Dict[int, _Capture] = {}
+        self._active = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, thread_id: int, capture: _Capture) -> None:
+        with self._lock:
+            self._targets[thread_id] = capture
+            self._active.set()
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="handler-profiler", daemon=True)
+                self._thread.start()
+
+    def is_registered(self, thread_id: int) -> bool:
+        with self._lock:
+            return thread_id in self._targets
+
+    def unregister(self, thread_id: int) -> None:
+        with self._lock:
+            self._targets.pop(thread_id, None)
+            if not self._targets:
+                self._active.clear()
+
+    def _run(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                targets = list(self._targets.items())
+            for thread_id, capture in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    capture.add(frame)
+
+class HandlerProfiler:
+    def __init__(
+        self,
+        output_dir: str = DEFAULT_OUTPUT_DIR,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        self.output_dir = output_dir
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.sample_interval = sample_interval
+        self.config_loader: Optional[Callable[[], Optional[Dict[str, Any]]]] = None
+        self.config_refresh_seconds = DEFAULT_CONFIG_REFRESH_SECONDS
+        self._next_config_check = 0.0
+        self._sampler = _StackSampler(sample_interval)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def configure(
+        self,
+        output_dir: Optional[str] = None,
+        config_loader: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+        config_refresh_seconds: Optional[float] = None,
+    ) -> None:
+        """config_loader returns {"enabled", "sample_rate"} from shared storage so every worker follows the admin toggle."""
+        if output_dir is not None:
+            self.output_dir = output_dir
+        if config_loader is not None:
+            self.config_loader = config_loader
+            self._next_config_check = 0.0
+        if config_refresh_seconds is not None:
+            self.config_refresh_seconds = config_refresh_seconds
+
+    def set_enabled(self, enabled: bool, sample_rate: Optional[float] = None) -> None:
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        self.enabled = bool(enabled)
+
+    def should_sample(self) -> bool:
+        if self.config_loader is not None:
+            now = time.monotonic()
+            if now >= self._next_config_check:
+                self._next_config_check = now + self.config_refresh_seconds
+                try:
+                    config = self.config_loader() or {}
+                    self.set_enabled(config.get("enabled", False), config.get("sample_rate"))
+                except Exception as e:
+                    print(f"Profiler config refresh failed: {e}")
+        return self.enabled and random.random() < self.sample_rate
+
+    def run(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs fn under the sampler and records the invocation."""
+        thread_id = threading.get_ident()
+        if self._sampler.is_registered(thread_id): # Nested profiled call; the outer invocation already covers it
+            return fn(*args, **kwargs)
+        capture = _Capture(sys._getframe())
+        started = time.perf_counter()
+        self._sampler.register(thread_id, capture)
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            self._sampler.unregister(thread_id)
+            wall = time.perf_counter() - started
+        try:
+            serialization = estimate_serialization_seconds(result)
+            self._record(name, capture, wall, serialization)
+        except Exception as e:
+            print(f"Profiler failed to record {name}: {e}")
+        return result
+
+    def _record(self, name: str, capture: _Capture, wall: float, serialization: float) -> None:
+        sampled = sum(capture.phases.values())
+        # Samples give each phase's share of the handler's wall time.
+        phase_ms = {phase: round(wall * 1000 * capture.phases[phase] / sampled, 2) if sampled else 0.0
+                    for phase in (PHASE_NETWORK, PHASE_DATAFRAME, PHASE_OTHER)}
+        if not sampled:
+            phase_ms[PHASE_OTHER] = round(wall * 1000, 2) # Finished within one sample interval
+        entry = {"handler": name, "at": time.time(), "wall_ms": round(wall * 1000, 2), "samples": sampled,
+                 **{f"{phase}_ms": ms for phase, ms in phase_ms.items()},
+                 f"{PHASE_SERIALIZATION}_ms": round(serialization * 1000, 2)}
+
+        serialization_samples = int(round(serialization / self.sample_interval))
+        lines = [f"{name};[{stack[0]}];{';'.join(stack[1:])} {count}" if len(stack) > 1 else f"{name};[{stack[0]}] {count}"
+                 for stack, count in capture.stacks.items()]
+        if serialization_samples:
+            lines.append(f"{name};[{PHASE_SERIALIZATION}] {serialization_samples}")
+
+        with self._lock:
+            os.makedirs(self.output_dir, exist_ok=True)
+            pid = os.getpid()
+            if lines:
+                with open(os.path.join(self.output_dir, f"{name}.{pid}.folded"), "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            with open(os.path.join(self.output_dir, f"summary.{pid}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            stats = self._stats.setdefault(name, {"count": 0, "wall_ms": 0.0, "network_ms": 0.0, "dataframe_ms": 0.0, "serialization_ms": 0.0, "other_ms": 0.0})
+            stats["count"] += 1
+            for key in ("wall_ms", "network_ms", "dataframe_ms", "serialization_ms", "other_ms"):
+                stats[key] += entry[key]
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-handler averages (ms) of the invocations sampled by this process."""
+        with self._lock:
+            rows = []
+            for name, stats in sorted(self._stats.items()):
+                count = stats["count"]
+                rows.append({"handler": name, "count": count, **{key: round(stats[key] / count, 2) for key in stats if key != "count"}})
+            return rows
+
+_handler_profiler = HandlerProfiler()
+
+def get_handler_profiler() -> HandlerProfiler:
+    return _handler_profiler
+
+def profiled(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorator for event handlers. functools.wraps keeps the signature Gradio inspects (gr.Request, gr.SelectData)."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = _handler_profiler
+        if not profiler.should_sample():
+            return fn(*args, **kwargs)
+        return profiler.run(name, fn, *args, **kwargs)
+    return wrapper
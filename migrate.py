@@ -0,0 +1,87 @@
+import argparse
+import os
+import re
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Minimal versioned migration runner for the SQL files in migrations/.
+# Files are named NNNN_description.sql and applied in order, each in its own transaction;
+# applied versions are recorded in schema_migrations.
+# Usage: python migrate.py [--database-url URL] [--target 0002] [--status]
+# DATABASE_URL is the Postgres connection string (Supabase: Project Settings > Database).
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d{4})_[\w-]+\.sql$")
+
+def list_migrations(migrations_dir: str = MIGRATIONS_DIR) -> List[Tuple[str, str]]:
+    """Returns [(version, path)] sorted by version."""
+    migrations = []
+    for name in os.listdir(migrations_dir):
+        match = MIGRATION_FILE_PATTERN.match(name)
+        if match:
+            migrations.append((match.group(1), os.path.join(migrations_dir, name)))
+    migrations.sort()
+    versions = [version for version, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {migrations_dir}: {versions}")
+    return migrations
+
+def _ensure_migrations_table(conn) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "create table if not exists schema_migrations ("
+            " version text primary key,"
+            " name text not null,"
+            " applied_at timestamptz not null default now())"
+        )
+
+def applied_versions(conn) -> List[str]:
+    _ensure_migrations_table(conn)
+    with conn, conn.cursor() as cur:
+        cur.execute("select version from schema_migrations order by version")
+        return [row[0] for row in cur.fetchall()]
+
+def apply_migrations(conn, target: Optional[str] = None, migrations_dir: str = MIGRATIONS_DIR) -> List[str]:
+    """Applies pending migrations up to and including target (all when None). Returns applied versions."""
+    done = set(applied_versions(conn))
+    newly_applied = []
+    for version, path in list_migrations(migrations_dir):
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            sql = f.read()
+        with conn, conn.cursor() as cur: # One transaction per migration; rolled back on error
+            cur.execute(sql)
+            cur.execute("insert into schema_migrations (version, name) values (%s, %s)", (version, os.path.basename(path)))
+        print(f"Applied migration {os.path.basename(path)}")
+        newly_applied.append(version)
+    return newly_applied
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Apply versioned SQL migrations.")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--target", help="Stop after this version (e.g. 0002).")
+    parser.add_argument("--status", action="store_true", help="Only list applied and pending migrations.")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("DATABASE_URL not set. Pass --database-url or add it to .env.")
+
+    import psycopg2
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.status:
+            done = set(applied_versions(conn))
+            for version, path in list_migrations():
+                print(f"{'applied' if version in done else 'pending':8} {os.path.basename(path)}")
+            return
+        applied = apply_migrations(conn, target=args.target)
+        print(f"{len(applied)} migration(s) applied." if applied else "Database schema is up to date.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+-- Baseline schema for the tables used by db_utils.
+-- Uses IF NOT EXISTS so it can be recorded against a project whose tables were created in the dashboard.
+-- Row Level Security policies are project specific (admin email, auth.uid()) and stay in the Supabase dashboard.
+
+create table if not exists equipments (
+    id text primary key,
+    name text not null,
+    department text not null,
+    quantity integer not null check (quantity >= 0),
+    available_quantity integer not null constraint equipments_available_quantity_check check (available_quantity >= 0)
+);
+
+create table if not exists rentals (
+    id bigint generated by default as identity primary key,
+    equipment_id text not null references equipments (id) on update cascade,
+    start_date date not null,
+    end_date date not null,
+    borrower_name text,
+    purpose text,
+    user_id uuid,
+    quantity integer not null default 1,
+    status text not null default 'confirmed',
+    created_at timestamptz not null default now(),
+    constraint rentals_date_order_check check (end_date >= start_date)
+);
+
+-- Used by the rental journal (rental_journal.py) so replayed batches never double-book.
+alter table rentals add column if not exists idempotency_key text;
+create unique index if not exists rentals_idempotency_key_key on rentals (idempotency_key);
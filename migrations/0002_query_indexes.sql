@@ -0,0 +1,15 @@
+-- Composite indexes matching the predicates db_utils actually issues.
+
+-- process_rental_request / commit_rental_batch / fetch_booked_intervals:
+--   equipment_id = ? and status = 'confirmed' and start_date <= ? and end_date >= ?
+create index if not exists rentals_equipment_status_dates_idx
+    on rentals (equipment_id, status, start_date, end_date);
+
+-- fetch_all_rental_details: order by start_date desc
+create index if not exists rentals_start_date_idx on rentals (start_date desc);
+
+-- fetch_newly_overdue_rentals / count_overdue_rentals: status = ? and end_date range, order by end_date
+create index if not exists rentals_status_end_date_idx on rentals (status, end_date);
+
+-- fetch_equipments: department = ?; fetch_all_equipments_admin: order by id
+create index if not exists equipments_department_id_idx on equipments (department, id);
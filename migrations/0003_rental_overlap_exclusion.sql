@@ -0,0 +1,72 @@
+-- Enforce "no overlapping active rentals per equipment unit" in the database.
+-- Each rental occupies one unit (unit_no 1..equipments.quantity). A trigger assigns the lowest free
+-- unit when unit_no is not given, and a GiST exclusion constraint rejects any overlap on the same
+-- unit, so concurrent inserts can no longer double-book between the conflict check and the insert.
+
+create extension if not exists btree_gist;
+
+alter table rentals add column if not exists unit_no integer;
+
+create or replace function pick_rental_unit(p_equipment_id text, p_start date, p_end date, p_exclude_id bigint default null)
+returns integer language sql stable as $$
+    select u
+    from generate_series(1, greatest((select quantity from equipments where id = p_equipment_id), 1)) as u
+    where not exists (
+        select 1 from rentals r
+        where r.equipment_id = p_equipment_id
+          and r.unit_no = u
+          and r.status in ('confirmed', 'overdue')
+          and (p_exclude_id is null or r.id <> p_exclude_id)
+          and daterange(r.start_date, r.end_date, '[]') && daterange(p_start, p_end, '[]')
+    )
+    order by u
+    limit 1
+$$;
+
+-- Backfill: everything starts on unit 1; only rows overlapping an earlier active rental are re-assigned.
+update rentals set unit_no = 1 where unit_no is null;
+do $$
+declare
+    rec record;
+begin
+    for rec in
+        select r.id, r.equipment_id, r.start_date, r.end_date
+        from rentals r
+        where r.status in ('confirmed', 'overdue')
+          and exists (
+              select 1 from rentals o
+              where o.equipment_id = r.equipment_id and o.id < r.id
+                and o.status in ('confirmed', 'overdue')
+                and o.start_date <= r.end_date and o.end_date >= r.start_date
+          )
+        order by r.id
+    loop
+        update rentals
+        set unit_no = coalesce(pick_rental_unit(rec.equipment_id, rec.start_date, rec.end_date, rec.id), 1)
+        where id = rec.id;
+    end loop;
+end $$;
+
+alter table rentals alter column unit_no set not null;
+
+create or replace function assign_rental_unit() returns trigger language plpgsql as $$
+begin
+    if new.unit_no is null then
+        -- No free unit: keep 1 and let the exclusion constraint reject the row.
+        new.unit_no := coalesce(pick_rental_unit(new.equipment_id, new.start_date, new.end_date, new.id), 1);
+    end if;
+    return new;
+end $$;
+
+drop trigger if exists rentals_assign_unit on rentals;
+create trigger rentals_assign_unit before insert on rentals
+    for each row execute function assign_rental_unit();
+
+-- Fails if existing data already holds more overlapping active rentals than an equipment's quantity;
+-- resolve those rows first, then re-run the migration.
+alter table rentals drop constraint if exists rentals_no_overlap;
+alter table rentals add constraint rentals_no_overlap exclude using gist (
+    equipment_id with =,
+    unit_no with =,
+    daterange(start_date, end_date, '[]') with &&
+) where (status in ('confirmed', 'overdue'));
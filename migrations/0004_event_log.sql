@@ -0,0 +1,160 @@
+-- Append-only log of equipment/rental mutations and periodic state snapshots used for point-in-time
+-- reconstruction (event_log.EventLog). Events are written by triggers on equipments and rentals in the
+-- same transaction as the change, so every write is logged whoever makes it: db_utils, the
+-- commit_rental_batch RPC, dashboard edits, later migrations. Snapshots are taken by the app.
+
+create table if not exists equipment_events (
+    seq bigserial primary key,
+    event_type text not null check (event_type in (
+        'equipment_added', 'equipment_updated', 'equipment_removed',
+        'rental_created', 'rental_updated', 'rental_status_changed', 'rental_removed'
+    )),
+    equipment_id text,
+    actor text,
+    payload jsonb not null,
+    occurred_at timestamptz not null default now()
+);
+
+-- EventLog.state_at: the time window between a snapshot and the requested moment
+-- (the nearest snapshot is found through the unique index on last_seq)
+create index if not exists equipment_events_occurred_at_idx on equipment_events (occurred_at, seq);
+-- EventLog.equipment_history: latest events of one equipment
+create index if not exists equipment_events_equipment_seq_idx on equipment_events (equipment_id, seq desc);
+
+-- Append-only: history rows can be inserted but never changed or removed.
+create or replace function reject_event_log_change() returns trigger language plpgsql as $$
+begin
+    raise exception 'equipment_events is append-only';
+end
+$$;
+
+drop trigger if exists equipment_events_append_only on equipment_events;
+create trigger equipment_events_append_only
+    before update or delete on equipment_events
+    for each row execute function reject_event_log_change();
+
+create table if not exists equipment_state_snapshots (
+    id bigserial primary key,
+    last_seq bigint not null unique,            -- last event folded into state
+    last_occurred_at timestamptz not null,      -- occurred_at of that event
+    state jsonb not null,
+    taken_at timestamptz not null default now()
+);
+
+-- Snapshot horizon (EventLog.take_snapshot). seq values become visible in commit order, so a
+-- transaction still open can hold a lower seq than events already visible; a snapshot past it would
+-- leave that event out of every later replay. SHARE mode waits for every transaction that has
+-- inserted into equipment_events (ROW EXCLUSIVE) to finish, after which all seq up to max(seq) are
+-- committed or rolled back; new events get higher values.
+create or replace function event_log_committed_seq() returns bigint language plpgsql security definer set search_path = public as $$
+begin
+    lock table equipment_events in share mode;
+    return coalesce((select max(seq) from equipment_events), 0);
+end $$;
+
+-- API clients (anon, authenticated) can neither read the log, which holds borrower history, nor write
+-- events or snapshots: RLS is on without any policy for them, and their table privileges are revoked.
+-- Events come only from the security definer triggers below (owned by the table owner, which RLS does
+-- not restrict); the app reads history and saves snapshots with the service role, which bypasses RLS.
+alter table equipment_events enable row level security;
+alter table equipment_state_snapshots enable row level security;
+revoke execute on function event_log_committed_seq() from public;
+
+do $$
+declare
+    client_role text;
+begin
+    for client_role in select rolname from pg_roles where rolname in ('anon', 'authenticated') loop
+        execute format('revoke all on equipment_events, equipment_state_snapshots from %I', client_role);
+        execute format('revoke all on sequence equipment_events_seq_seq, equipment_state_snapshots_id_seq from %I', client_role);
+        execute format('revoke execute on function event_log_committed_seq() from %I', client_role);
+    end loop;
+end $$;
+
+-- Who made the change: the signed-in user's email for requests through PostgREST, otherwise the
+-- request's role (anon, service_role) or the database user (dashboard, psql, migrations).
+create or replace function event_actor() returns text language sql stable as $$
+    select coalesce(
+        nullif(current_setting('request.jwt.claims', true), '')::jsonb ->> 'email',
+        nullif(current_setting('request.jwt.claims', true), '')::jsonb ->> 'role',
+        session_user::text
+    )
+$$;
+
+create or replace function equipment_event_fields(e equipments) returns jsonb language sql immutable as $$
+    select jsonb_build_object('equipment_id', e.id, 'name', e.name, 'department', e.department,
+                              'quantity', e.quantity, 'available_quantity', e.available_quantity)
+$$;
+
+create or replace function rental_event_fields(r rentals) returns jsonb language sql immutable as $$
+    select jsonb_build_object('rental_id', r.id, 'equipment_id', r.equipment_id, 'start_date', r.start_date,
+                              'end_date', r.end_date, 'status', r.status, 'quantity', coalesce(r.quantity, 1),
+                              'user_id', r.user_id, 'borrower_name', r.borrower_name)
+$$;
+
+-- security definer: clients need no insert privilege on equipment_events, so they cannot write
+-- events of their own.
+create or replace function log_equipment_change() returns trigger language plpgsql security definer set search_path = public as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        values ('equipment_added', new.id, event_actor(), equipment_event_fields(new));
+    elsif tg_op = 'UPDATE' then
+        if equipment_event_fields(new) = equipment_event_fields(old) then
+            return null;
+        end if;
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        values ('equipment_updated', new.id, event_actor(), equipment_event_fields(new) || jsonb_build_object(
+            'previous_id', old.id, 'previous_quantity', old.quantity, 'previous_available_quantity', old.available_quantity));
+    else
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        values ('equipment_removed', old.id, event_actor(), jsonb_build_object('equipment_id', old.id));
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists equipments_audit_log on equipments;
+create trigger equipments_audit_log after insert or update or delete on equipments
+    for each row execute function log_equipment_change();
+
+create or replace function log_rental_change() returns trigger language plpgsql security definer set search_path = public as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        values ('rental_created', new.equipment_id, event_actor(), rental_event_fields(new));
+    elsif tg_op = 'UPDATE' then
+        if rental_event_fields(new) = rental_event_fields(old) then
+            return null; -- e.g. only unit_no or idempotency_key changed
+        end if;
+        if rental_event_fields(new) - 'status' = rental_event_fields(old) - 'status' then
+            insert into equipment_events (event_type, equipment_id, actor, payload)
+            values ('rental_status_changed', new.equipment_id, event_actor(), jsonb_build_object(
+                'rental_id', new.id, 'equipment_id', new.equipment_id, 'status', new.status, 'previous_status', old.status));
+        else
+            insert into equipment_events (event_type, equipment_id, actor, payload)
+            values ('rental_updated', new.equipment_id, event_actor(), rental_event_fields(new));
+        end if;
+    else
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        values ('rental_removed', old.equipment_id, event_actor(), jsonb_build_object('rental_id', old.id, 'equipment_id', old.equipment_id));
+    end if;
+    return null;
+end $$;
+
+-- Named to fire before rentals_available_quantity (0006; same-event triggers run in name order), so a
+-- rental's event precedes the equipment_updated event for the availability it changes.
+drop trigger if exists rentals_audit_log on rentals;
+create trigger rentals_audit_log after insert or update or delete on rentals
+    for each row execute function log_rental_change();
+
+-- Rows written before the triggers existed (including the 0003 unit backfill) enter the log once,
+-- as their current state, so replays start from the real tables.
+do $$
+begin
+    if not exists (select 1 from equipment_events) then
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        select 'equipment_added', e.id, event_actor(), equipment_event_fields(e) from equipments e order by e.id;
+        insert into equipment_events (event_type, equipment_id, actor, payload)
+        select 'rental_created', r.equipment_id, event_actor(), rental_event_fields(r) from rentals r order by r.id;
+    end if;
+end $$;
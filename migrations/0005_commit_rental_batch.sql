@@ -0,0 +1,71 @@
+-- Atomic batch commit for the rental journal (rental_journal.py -> db_utils.commit_rental_batch).
+-- Every journaled rental is checked, inserted and counted against equipments.available_quantity in
+-- one transaction, so a crash or a deadline after the call can no longer leave rentals inserted
+-- without the matching decrement. A replayed batch finds its idempotency keys and changes nothing.
+-- The equipments of the batch are locked in id order (concurrent batches cannot deadlock).
+-- Returns one row per input rental: outcome is 'committed', 'duplicate' (already committed by an
+-- earlier replay), 'missing' (unknown equipment), 'unavailable' or 'conflict'.
+
+create or replace function commit_rental_batch(p_rentals jsonb)
+returns table (idempotency_key text, outcome text, rental_id bigint, equipment_name text, available_quantity integer)
+language plpgsql as $$
+#variable_conflict use_column
+declare
+    item jsonb;
+    v_key text;
+    v_start date;
+    v_end date;
+    v_equipment equipments%rowtype;
+    v_rental_id bigint;
+    v_available integer;
+begin
+    perform 1 from equipments e
+    where e.id in (select distinct value->>'equipment_id' from jsonb_array_elements(p_rentals))
+    order by e.id
+    for update;
+
+    for item in select value from jsonb_array_elements(p_rentals) loop
+        v_key := item->>'idempotency_key';
+        v_start := (item->>'start_date')::date;
+        v_end := (item->>'end_date')::date;
+
+        select r.id into v_rental_id from rentals r where r.idempotency_key = v_key;
+        if found then
+            return query select v_key, 'duplicate'::text, v_rental_id, null::text, null::integer;
+            continue;
+        end if;
+
+        select * into v_equipment from equipments e where e.id = item->>'equipment_id';
+        if not found then
+            return query select v_key, 'missing'::text, null::bigint, null::text, null::integer;
+            continue;
+        end if;
+        if v_equipment.available_quantity < 1 then
+            return query select v_key, 'unavailable'::text, null::bigint, v_equipment.name, v_equipment.available_quantity;
+            continue;
+        end if;
+        if exists (
+            select 1 from rentals r
+            where r.equipment_id = v_equipment.id and r.status = 'confirmed'
+              and r.start_date <= v_end and r.end_date >= v_start
+        ) then
+            return query select v_key, 'conflict'::text, null::bigint, v_equipment.name, v_equipment.available_quantity;
+            continue;
+        end if;
+
+        begin
+            insert into rentals (equipment_id, start_date, end_date, borrower_name, purpose, user_id, status, idempotency_key)
+            values (v_equipment.id, v_start, v_end, item->>'borrower_name', item->>'purpose', (item->>'user_id')::uuid,
+                    coalesce(item->>'status', 'confirmed'), v_key)
+            returning id into v_rental_id;
+        exception when exclusion_violation then
+            return query select v_key, 'conflict'::text, null::bigint, v_equipment.name, v_equipment.available_quantity;
+            continue;
+        end;
+
+        update equipments e set available_quantity = e.available_quantity - 1
+        where e.id = v_equipment.id
+        returning e.available_quantity into v_available;
+        return query select v_key, 'committed'::text, v_rental_id, v_equipment.name, v_available;
+    end loop;
+end $$;
@@ -0,0 +1,171 @@
+-- One capacity model for every write path (process_rental_request, the journal's commit_rental_batch,
+-- the semester schedule insert, dashboard edits): an equipment has 'quantity' units, every active
+-- (confirmed/overdue) rental holds one unit for its whole date range, and a rental fits only if some
+-- unit is free for the whole range. The per-unit exclusion constraint from 0003 stays the final check.
+-- equipments.available_quantity is derived from the same data -- quantity minus the units in use today
+-- (confirmed rentals covering today plus overdue ones) -- and maintained here instead of by the clients.
+-- Rentals starting or ending with the date change are picked up by refresh_available_quantities(),
+-- which the app calls periodically (see start_background_services in app.py).
+-- The functions that maintain available_quantity are security definer: they run inside writes made
+-- with the signed-in user's token, and under RLS that user can neither update equipments nor see
+-- other users' rentals, so the update would fail or silently match no row.
+
+-- Only units 1..quantity are offered; an equipment with quantity 0 used to admit one rental on unit 1.
+create or replace function pick_rental_unit(p_equipment_id text, p_start date, p_end date, p_exclude_id bigint default null)
+returns integer language sql stable as $$
+    select u
+    from generate_series(1, (select quantity from equipments where id = p_equipment_id)) as u
+    where not exists (
+        select 1 from rentals r
+        where r.equipment_id = p_equipment_id
+          and r.unit_no = u
+          and r.status in ('confirmed', 'overdue')
+          and (p_exclude_id is null or r.id <> p_exclude_id)
+          and daterange(r.start_date, r.end_date, '[]') && daterange(p_start, p_end, '[]')
+    )
+    order by u
+    limit 1
+$$;
+
+create or replace function assign_rental_unit() returns trigger language plpgsql as $$
+begin
+    if new.unit_no is null then
+        new.unit_no := pick_rental_unit(new.equipment_id, new.start_date, new.end_date, new.id);
+        if new.unit_no is null and new.status in ('confirmed', 'overdue') then
+            raise exception 'conflicting key value violates exclusion constraint "rentals_no_overlap"'
+                using errcode = 'exclusion_violation', constraint = 'rentals_no_overlap',
+                      detail = format('No free unit of %s for %s ~ %s.', new.equipment_id, new.start_date, new.end_date);
+        end if;
+        new.unit_no := coalesce(new.unit_no, 1); -- Inactive rows never conflict
+    end if;
+    return new;
+end $$;
+
+create or replace function rental_units_in_use(p_equipment_id text) returns integer language sql stable as $$
+    select count(*)::integer
+    from rentals r
+    where r.equipment_id = p_equipment_id
+      and (r.status = 'overdue' or (r.status = 'confirmed' and current_date between r.start_date and r.end_date))
+$$;
+
+create or replace function refresh_available_quantity(p_equipment_id text) returns void language sql security definer set search_path = public as $$
+    update equipments e set available_quantity = greatest(e.quantity - rental_units_in_use(e.id), 0)
+    where e.id = p_equipment_id
+      and e.available_quantity <> greatest(e.quantity - rental_units_in_use(e.id), 0)
+$$;
+
+-- Returns how many equipments changed.
+create or replace function refresh_available_quantities() returns integer language plpgsql security definer set search_path = public as $$
+declare
+    changed integer;
+begin
+    with usage as (
+        select eq.id, greatest(eq.quantity - count(r.id), 0)::integer as available
+        from equipments eq
+        left join rentals r on r.equipment_id = eq.id
+            and (r.status = 'overdue' or (r.status = 'confirmed' and current_date between r.start_date and r.end_date))
+        group by eq.id
+    )
+    update equipments e set available_quantity = usage.available
+    from usage
+    where usage.id = e.id and e.available_quantity <> usage.available;
+    get diagnostics changed = row_count;
+    return changed;
+end $$;
+
+-- Writes to quantity or available_quantity (admin form, dashboard) get the derived value.
+-- On an id change the rentals still reference the old id until the cascade runs.
+-- quantity cannot drop below the highest unit held by an overdue, current or future rental: that
+-- booking would be left on a unit that no longer exists.
+create or replace function equipments_derive_available_quantity() returns trigger language plpgsql security definer set search_path = public as $$
+declare
+    booked_unit integer;
+begin
+    if tg_op = 'UPDATE' and new.quantity < old.quantity then
+        select max(r.unit_no) into booked_unit
+        from rentals r
+        where r.equipment_id = old.id
+          and (r.status = 'overdue' or (r.status = 'confirmed' and r.end_date >= current_date));
+        if booked_unit > new.quantity then
+            raise exception 'new row for relation "equipments" violates check constraint "equipments_quantity_covers_bookings"'
+                using errcode = 'check_violation', constraint = 'equipments_quantity_covers_bookings',
+                      detail = format('Unit %s of %s has a current or upcoming rental; quantity must be at least %s.', booked_unit, old.id, booked_unit);
+        end if;
+    end if;
+    new.available_quantity := greatest(new.quantity - rental_units_in_use(case when tg_op = 'UPDATE' then old.id else new.id end), 0);
+    return new;
+end $$;
+
+drop trigger if exists equipments_available_quantity on equipments;
+create trigger equipments_available_quantity before insert or update of quantity, available_quantity on equipments
+    for each row execute function equipments_derive_available_quantity();
+
+create or replace function rentals_refresh_available_quantity() returns trigger language plpgsql security definer set search_path = public as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform refresh_available_quantity(old.equipment_id);
+    end if;
+    if tg_op = 'INSERT' or (tg_op = 'UPDATE' and new.equipment_id <> old.equipment_id) then
+        perform refresh_available_quantity(new.equipment_id);
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists rentals_available_quantity on rentals;
+create trigger rentals_available_quantity after insert or delete or update of status, start_date, end_date, equipment_id on rentals
+    for each row execute function rentals_refresh_available_quantity();
+
+-- Same model for journal batches (replaces the version from 0005): no separate "available today" check
+-- and no manual decrement; the triggers above keep available_quantity.
+-- outcome is 'committed', 'duplicate', 'missing' or 'conflict' (no unit free for the whole range).
+create or replace function commit_rental_batch(p_rentals jsonb)
+returns table (idempotency_key text, outcome text, rental_id bigint, equipment_name text, available_quantity integer)
+language plpgsql as $$
+#variable_conflict use_column
+declare
+    item jsonb;
+    v_key text;
+    v_start date;
+    v_end date;
+    v_equipment equipments%rowtype;
+    v_rental_id bigint;
+    v_available integer;
+begin
+    perform 1 from equipments e
+    where e.id in (select distinct value->>'equipment_id' from jsonb_array_elements(p_rentals))
+    order by e.id
+    for update;
+
+    for item in select value from jsonb_array_elements(p_rentals) loop
+        v_key := item->>'idempotency_key';
+        v_start := (item->>'start_date')::date;
+        v_end := (item->>'end_date')::date;
+
+        select r.id into v_rental_id from rentals r where r.idempotency_key = v_key;
+        if found then
+            return query select v_key, 'duplicate'::text, v_rental_id, null::text, null::integer;
+            continue;
+        end if;
+
+        select * into v_equipment from equipments e where e.id = item->>'equipment_id';
+        if not found then
+            return query select v_key, 'missing'::text, null::bigint, null::text, null::integer;
+            continue;
+        end if;
+
+        begin
+            insert into rentals (equipment_id, start_date, end_date, borrower_name, purpose, user_id, status, idempotency_key)
+            values (v_equipment.id, v_start, v_end, item->>'borrower_name', item->>'purpose', (item->>'user_id')::uuid,
+                    coalesce(item->>'status', 'confirmed'), v_key)
+            returning id into v_rental_id;
+        exception when exclusion_violation then
+            return query select v_key, 'conflict'::text, null::bigint, v_equipment.name, v_equipment.available_quantity;
+            continue;
+        end;
+
+        select e.available_quantity into v_available from equipments e where e.id = v_equipment.id;
+        return query select v_key, 'committed'::text, v_rental_id, v_equipment.name, v_available;
+    end loop;
+end $$;
+
+select refresh_available_quantities();
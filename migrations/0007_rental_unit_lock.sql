@@ -0,0 +1,29 @@
+-- Serializes unit picks per equipment. pick_rental_unit() cannot see rentals inserted by transactions
+-- that have not committed yet, so two concurrent inserts for the same equipment and period both got
+-- unit 1 and the exclusion constraint rejected the second one although unit 2 was free.
+-- The trigger now locks the equipment row before picking; the second insert waits for the first to
+-- commit or roll back and then picks from what is actually taken. FOR NO KEY UPDATE does not block
+-- the foreign key checks of other rentals, and commit_rental_batch already holds the stronger
+-- FOR UPDATE lock on its equipments, so it takes no new lock order.
+-- Rows that arrive with a unit_no (the semester schedule plan) are not locked; the exclusion
+-- constraint stays the final check for them.
+-- security definer: the function runs inside inserts made with the signed-in user's token, and under
+-- RLS that user cannot lock (or even see) the equipment row, so the lock would silently not be taken.
+-- It also lets pick_rental_unit see the units held by other users' rentals.
+
+create or replace function assign_rental_unit() returns trigger language plpgsql security definer set search_path = public as $$
+begin
+    if new.unit_no is null then
+        -- The per-equipment lock is what keeps concurrent picks apart; rentals_no_overlap only rejects
+        -- a pick that went wrong anyway, it does not make the second insert choose another unit.
+        perform 1 from equipments where id = new.equipment_id for no key update;
+        new.unit_no := pick_rental_unit(new.equipment_id, new.start_date, new.end_date, new.id);
+        if new.unit_no is null and new.status in ('confirmed', 'overdue') then
+            raise exception 'conflicting key value violates exclusion constraint "rentals_no_overlap"'
+                using errcode = 'exclusion_violation', constraint = 'rentals_no_overlap',
+                      detail = format('No free unit of %s for %s ~ %s.', new.equipment_id, new.start_date, new.end_date);
+        end if;
+        new.unit_no := coalesce(new.unit_no, 1); -- Inactive rows never conflict
+    end if;
+    return new;
+end $$;
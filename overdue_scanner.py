@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+# Incremental overdue-rental scanner.
+# Each run asks for confirmed rentals whose end_date passed since the previous run (a
+# high-water mark on end_date persisted to a small JSON file) plus a rescan window behind
+# it, then works through them in chunks: reminders for a chunk are sent first, then the
+# chunk is flipped to 'overdue'. A rental only leaves 'confirmed' after its reminder went out,
+# so a run that fails partway is picked up by the next one (at-least-once reminders).
+# The window catches rentals committed late with an end_date already behind the mark, e.g.
+# journal entries (rental_journal.py) replayed after a backend outage.
+# Reminded rentals (id and end_date) are kept in the state file while they are inside the window, so
+# a rental the update missed (changed concurrently, or a partial failure) is marked on a later run
+# without a second reminder.
+
+DEFAULT_REMINDER_BATCH_SIZE = 50
+DEFAULT_SCAN_INTERVAL_SECONDS = 3600
+DEFAULT_RESCAN_DAYS = 7
+
+FetchOverdueFn = Callable[[Optional[str], str], List[Dict[str, Any]]]
+MarkOverdueFn = Callable[[List[Any]], int]
+
+class ConsoleReminderSender:
+    """Prints reminders; useful for local testing."""
+
+    def send_batch(self, notices: List[Dict[str, Any]]) -> None:
+        for notice in notices:
+            print(f"[연체 알림] {notice['borrower_name']}님, '{notice['equipment_name']}' 반납 기한({notice['end_date']})이 지났습니다.")
+
+class FileReminderSender:
+    """Appends reminders as JSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send_batch(self, notices: List[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for notice in notices:
+                f.write(json.dumps(notice, ensure_ascii=False) + "\n")
+
+def build_reminder_notice(rental: Dict[str, Any]) -> Dict[str, Any]:
+    equipment = rental.get('equipments')
+    equipment_name = equipment.get('name') if isinstance(equipment, dict) and equipment.get('name') else rental.get('equipment_id')
+    return {
+        "rental_id": rental.get('id'),
+        "user_id": rental.get('user_id'),
+        "borrower_name": rental.get('borrower_name'),
+        "equipment_id": rental.get('equipment_id'),
+        "equipment_name": equipment_name,
+        "end_date": rental.get('end_date'),
+    }
+
+class OverdueScanner:
+    def __init__(
+        self,
+        fetch_newly_overdue: FetchOverdueFn,
+        mark_overdue: MarkOverdueFn,
+        sender: Any,
+        state_path: str,
+        reminder_batch_size: int = DEFAULT_REMINDER_BATCH_SIZE,
+        rescan_days: int = DEFAULT_RESCAN_DAYS,
+        today_fn: Callable[[], date] = date.today,
+    ):
+        self.fetch_newly_overdue = fetch_newly_overdue
+        self.mark_overdue = mark_overdue
+        self.sender = sender
+        self.state_path = state_path
+        self.reminder_batch_size = reminder_batch_size
+        self.rescan_days = rescan_days
+        self.today_fn = today_fn
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load_high_water_mark(self) -> Optional[str]:
+        return self._load_state().get("high_water_mark")
+
+    def _save_state(self, mark: Optional[str], reminded: Dict[str, str]) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"high_water_mark": mark, "reminded": reminded, "updated_at": datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Scans end_date in (high-water mark - rescan_days, today). Per chunk of reminder_batch_size
+        rentals, sends the reminders not sent before for that end_date, records them, and then marks
+        the chunk overdue. The mark only advances once every chunk went through; a failure stops the
+        run and the next run retries what is left.
+        """
+        with self._run_lock:
+            today = self.today_fn()
+            state = self._load_state()
+            mark = state.get("high_water_mark")
+            after = (date.fromisoformat(mark) - timedelta(days=self.rescan_days)).isoformat() if mark else None
+            new_mark = (today - timedelta(days=1)).isoformat()
+            reminded: Dict[str, str] = state.get("reminded", {})
+
+            rentals = self.fetch_newly_overdue(after, today.isoformat())
+            marked = reminders = 0
+            for i in range(0, len(rentals), self.reminder_batch_size):
+                chunk = rentals[i:i + self.reminder_batch_size]
+                # A rental whose end_date moved since its reminder (extended, then overdue again) gets a new one
+                due = [r for r in chunk if reminded.get(str(r['id'])) != r['end_date']]
+                if due:
+                    self.sender.send_batch([build_reminder_notice(r) for r in due])
+                    reminders += len(due)
+                    reminded.update({str(r['id']): r['end_date'] for r in due})
+                    self._save_state(mark, reminded)
+                marked += self.mark_overdue([r['id'] for r in chunk])
+            if not mark or mark < new_mark:
+                mark = new_mark
+            # Rentals that ended at or before the next window start are never fetched again
+            next_after = (date.fromisoformat(mark) - timedelta(days=self.rescan_days)).isoformat()
+            self._save_state(mark, {rental_id: end_date for rental_id, end_date in reminded.items() if end_date > next_after})
+            self.last_run = {"scanned_after": after, "found": len(rentals), "marked": marked, "reminders": reminders}
+            return self.last_run
+
+    def start(self, interval_seconds: float = DEFAULT_SCAN_INTERVAL_SECONDS) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval_seconds,), name="overdue-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self, interval_seconds: float) -> None:
+        while not self._stop_event.is_set():
+            try:
+                result = self.run_once()
+                if result["found"]:
+                    print(f"Overdue scan: {result['marked']} rentals marked overdue, {result['reminders']} reminders queued.")
+            except Exception as e:
+                print(f"Overdue scan failed: {e}")
+            self._stop_event.wait(interval_seconds)
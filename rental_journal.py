@@ -0,0 +1,305 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend_calls import BackendError, BackendUnavailable, AuthenticationError
+from batch_scheduler import free_unit_numbers
+
+# Local write-behind journal for rental submissions.
+# A rental is validated against the in-process availability view (the unit model of
+# batch_scheduler: some unit must be free for the whole period), appended to an
+# fsync'd SQLite (WAL) journal and acknowledged immediately. A background committer
+# flushes pending entries to the backend in batches; every entry carries an
+# idempotency key (one per submission) so replays after a crash or a failed batch
+# never double-book. A batch the backend refuses outright (not an outage) is retried
+# entry by entry, and an entry that keeps failing is rejected after MAX_ATTEMPTS.
+
+STATUS_PENDING = "pending"
+STATUS_COMMITTED = "committed"
+STATUS_REJECTED = "rejected"
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 1.0 # seconds between committer runs
+DEFAULT_MAX_BACKOFF = 60.0 # seconds, upper bound while the backend is failing
+DEFAULT_BOOKED_CACHE_TTL = 30.0 # seconds to reuse booked units fetched from the backend
+MAX_ATTEMPTS = 3 # non-transient commit failures before an entry is rejected
+
+CommitBatchFn = Callable[[List[Dict[str, Any]]], Dict[str, Tuple[str, str]]]
+BookedUnitsFn = Callable[[str], Tuple[Optional[int], List[Tuple[str, str, int]]]] # equipment_id -> (quantity, [(start, end, unit_no)])
+
+def make_idempotency_key() -> str:
+    """A new key per submission, so a rejected or cancelled rental can be requested again for the same period."""
+    return uuid.uuid4().hex
+
+def _counts_as_attempt(error: Exception) -> bool:
+    # The backend refused the batch itself (bad row, constraint, policy); retrying it as is will fail again.
+    # Outages, timeouts, the open circuit breaker and expired credentials leave entries pending without counting.
+    return isinstance(error, BackendError) and not error.transient and not isinstance(error, (BackendUnavailable, AuthenticationError))
+
+class RentalJournal:
+    def __init__(
+        self,
+        path: str,
+        commit_batch: CommitBatchFn,
+        booked_units_loader: Optional[BookedUnitsFn] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        booked_cache_ttl: float = DEFAULT_BOOKED_CACHE_TTL,
+        cache_version: Optional[Callable[[], int]] = None,
+        on_committed: Optional[Callable[[], None]] = None,
+    ):
+        """
+        booked_units_loader returns an equipment's quantity and booked units (db_utils.fetch_booked_units);
+        without it, or while it fails with nothing cached, the committer does the only check.
+        cache_version returns a counter shared with other processes (see session_store); cached
+        booked units are dropped when it changes. on_committed runs after a batch commits rentals.
+        """
+        self.path = path
+        self.commit_batch = commit_batch
+        self.booked_units_loader = booked_units_loader
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.booked_cache_ttl = booked_cache_ttl
+        self.cache_version = cache_version
+        self.on_committed = on_committed
+
+        self._lock = threading.Lock()
+        self._booked_cache: Dict[str, Tuple[float, int, Tuple[Optional[int], List[Tuple[str, str, int]]]]] = {}
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._backoff = 0.0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL") # fsync every commit before acknowledging
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS rental_journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                equipment_id TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                message TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rental_journal_status_seq ON rental_journal (status, seq)")
+
+    # --- Submission (request path) ---
+
+    def submit(self, rental_data: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """
+        Validates rental_data against the local availability view and journals it.
+        Returns (idempotency_key, message); the key is None when the request was refused locally.
+        rental_data may carry a client-side 'idempotency_key' (nonce) to make a resubmission of the
+        same form safe; otherwise an identical request still pending is returned instead of a new entry.
+        """
+        key = rental_data.get("idempotency_key") or make_idempotency_key()
+        booked = self._booked_units(rental_data["equipment_id"])
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the check-then-insert below is also
+            # atomic against other worker processes sharing the journal file.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                return self._submit_locked(key, rental_data, booked)
+            finally:
+                self._conn.execute("COMMIT")
+
+    def _submit_locked(self, key: str, rental_data: Dict[str, Any],
+                       booked: Tuple[Optional[int], List[Tuple[str, str, int]]]) -> Tuple[Optional[str], str]:
+        equipment_id = rental_data["equipment_id"]
+        start_date, end_date = rental_data["start_date"], rental_data["end_date"]
+        existing = self._conn.execute(
+            "SELECT status, message FROM rental_journal WHERE idempotency_key = ?", (key,)
+        ).fetchone()
+        if existing:
+            status, message = existing
+            if status == STATUS_PENDING:
+                return key, "접수됨: 동일한 대여 신청이 이미 처리 대기 중입니다."
+            return key, message or "동일한 대여 신청이 이미 처리되었습니다."
+        duplicate = self._conn.execute(
+            "SELECT idempotency_key FROM rental_journal WHERE equipment_id = ? AND start_date = ? AND end_date = ? "
+            "AND status = ? AND json_extract(payload, '$.user_id') IS ?",
+            (equipment_id, start_date, end_date, STATUS_PENDING, rental_data.get("user_id")),
+        ).fetchone()
+        if duplicate:
+            return duplicate[0], "접수됨: 동일한 대여 신청이 이미 처리 대기 중입니다."
+
+        capacity, bookings = booked
+        if capacity is not None:
+            # Pending entries will take the lowest free unit in journal order, as the committer's RPC does.
+            bookings = list(bookings)
+            pending = self._conn.execute(
+                "SELECT start_date, end_date FROM rental_journal WHERE equipment_id = ? AND status = ? ORDER BY seq",
+                (equipment_id, STATUS_PENDING),
+            ).fetchall()
+            for other_start, other_end in pending:
+                free = free_unit_numbers(capacity, bookings, other_start, other_end)
+                if free:
+                    bookings.append((other_start, other_end, free[0]))
+            if not free_unit_numbers(capacity, bookings, start_date, end_date):
+                return None, f"오류: 선택한 장비는 해당 기간 ({start_date} ~ {end_date})에 이미 대여 중이거나 신청 대기 중입니다."
+
+        now = time.time()
+        payload = dict(rental_data, idempotency_key=key)
+        self._conn.execute(
+            "INSERT INTO rental_journal (idempotency_key, equipment_id, start_date, end_date, payload, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, equipment_id, start_date, end_date, json.dumps(payload, ensure_ascii=False), STATUS_PENDING, now, now),
+        )
+        self._wake_event.set()
+        return key, f"접수됨: 대여 신청이 저장되었습니다. 처리 결과가 곧 표시됩니다. ({start_date} ~ {end_date})"
+
+    def get_outcome(self, key: str) -> Tuple[str, str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, message FROM rental_journal WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return STATUS_REJECTED, "오류: 대여 신청 기록을 찾을 수 없습니다."
+        status, message = row
+        return status, message or ""
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM rental_journal WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()[0]
+
+    def _booked_units(self, equipment_id: str) -> Tuple[Optional[int], List[Tuple[str, str, int]]]:
+        """Cached backend view of active rentals. If the backend is unreachable the committer does the final check."""
+        if not self.booked_units_loader:
+            return None, []
+        version = self._current_cache_version()
+        cached = self._booked_cache.get(equipment_id)
+        if cached and cached[1] == version and time.monotonic() - cached[0] < self.booked_cache_ttl:
+            return cached[2]
+        try:
+            booked = self.booked_units_loader(equipment_id)
+        except Exception as e:
+            print(f"Rental journal: booked unit lookup failed for {equipment_id}, leaving the check to the committer: {e}")
+            return cached[2] if cached else (None, [])
+        self._booked_cache[equipment_id] = (time.monotonic(), version, booked)
+        return booked
+
+    def _current_cache_version(self) -> int:
+        if not self.cache_version:
+            return 0
+        try:
+            return self.cache_version()
+        except Exception as e:
+            print(f"Rental journal: cache version lookup failed: {e}")
+            return -1 # Never matches a cached entry
+
+    # --- Background committer ---
+
+    def flush_once(self) -> int:
+        """
+        Commits one batch of pending entries. Returns how many entries reached a final status.
+        Entries that were part of a refused batch are committed one at a time, so a single bad
+        entry is rejected after MAX_ATTEMPTS without holding back the others.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idempotency_key, payload, attempts FROM rental_journal WHERE status = ? ORDER BY seq LIMIT ?",
+                (STATUS_PENDING, self.batch_size),
+            ).fetchall()
+        if not rows:
+            return 0
+        if rows[0][2] > 0:
+            rows = rows[:1]
+
+        try:
+            outcomes = self.commit_batch([json.loads(payload) for _, payload, _ in rows])
+        except Exception as e:
+            if not _counts_as_attempt(e):
+                raise
+            print(f"Rental journal: backend refused a batch of {len(rows)}: {e}")
+            return self._record_failed_attempt([key for key, _, _ in rows], e)
+
+        finished = 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for key, (status, message) in outcomes.items():
+                if status not in (STATUS_COMMITTED, STATUS_REJECTED):
+                    continue
+                self._conn.execute(
+                    "UPDATE rental_journal SET status = ?, message = ?, updated_at = ? WHERE idempotency_key = ? AND status = ?",
+                    (status, message, now, key, STATUS_PENDING),
+                )
+                finished += 1
+            self._conn.execute("COMMIT")
+        for _, payload, _ in rows:
+            self._booked_cache.pop(json.loads(payload)["equipment_id"], None)
+        if self.on_committed and any(status == STATUS_COMMITTED for status, _ in outcomes.values()):
+            try:
+                self.on_committed()
+            except Exception as e:
+                print(f"Rental journal: on_committed callback failed: {e}")
+        return finished
+
+    def _record_failed_attempt(self, keys: List[str], error: Exception) -> int:
+        message = f"오류: 대여 신청을 처리할 수 없습니다. ({getattr(error, 'message', None) or error})"
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                f"UPDATE rental_journal SET attempts = attempts + 1, updated_at = ? WHERE idempotency_key IN ({placeholders})",
+                [time.time()] + keys,
+            )
+            rejected = self._conn.execute(
+                f"UPDATE rental_journal SET status = ?, message = ? WHERE idempotency_key IN ({placeholders}) "
+                "AND status = ? AND attempts >= ?",
+                [STATUS_REJECTED, message] + keys + [STATUS_PENDING, MAX_ATTEMPTS],
+            ).rowcount
+            self._conn.execute("COMMIT")
+        return rejected
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="rental-journal-committer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def close(self) -> None:
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            if self._backoff:
+                self._stop_event.wait(self._backoff) # new submissions don't cut a backoff short
+            else:
+                self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                while self.flush_once() >= self.batch_size:
+                    pass
+                self._backoff = 0.0
+            except Exception as e:
+                # Entries stay pending; retry with jittered exponential backoff.
+                self._backoff = min(self.max_backoff, max(self.flush_interval, self._backoff * 2))
+                self._backoff *= random.uniform(0.8, 1.2)
+                print(f"Rental journal commit failed, retrying in {self._backoff:.1f}s: {e}")
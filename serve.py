@@ -0,0 +1,85 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+
+# Production launcher: runs several app workers (one Gradio server per port) behind a load balancer.
+# Session state and cache versions are shared through SESSION_STORE_URL (SQLite file by default),
+# so a session can continue on any worker; only worker 0 runs the background services (rental journal
+# committer, overdue scanner, availability refresh, event log snapshots). Debug mode is off and the
+# Gradio queue is sized per worker.
+# Usage: python serve.py --workers 4 --base-port 7860   (workers listen on 7860..7863)
+
+DEFAULT_WORKERS = 2
+DEFAULT_BASE_PORT = 7860
+DEFAULT_CONCURRENCY_LIMIT = 8 # Events run concurrently per worker; handlers mostly wait on Supabase
+DEFAULT_QUEUE_MAX_SIZE = 64 # Queued events per worker before new ones are refused
+DEFAULT_MAX_THREADS = 40
+DEFAULT_SESSION_STORE_URL = "sqlite:///sessions.db"
+RESTART_DELAY_SECONDS = 2.0
+
+def _run_worker(index: int, host: str, port: int, concurrency_limit: int, queue_max_size: int, max_threads: int) -> None:
+    import app # Imported in the child so each worker builds its own clients and caches
+    demo = app.build_demo()
+    if index == 0 and app.supabase_client:
+        app.start_background_services()
+    demo.queue(default_concurrency_limit=concurrency_limit, max_size=queue_max_size)
+    print(f"Worker {index} listening on {host}:{port}")
+    demo.launch(server_name=host, server_port=port, debug=False, share=False, max_threads=max_threads)
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the rental app with multiple workers.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", DEFAULT_WORKERS)))
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--base-port", type=int, default=int(os.environ.get("PORT", DEFAULT_BASE_PORT)))
+    parser.add_argument("--concurrency-limit", type=int, default=int(os.environ.get("GRADIO_CONCURRENCY_LIMIT", DEFAULT_CONCURRENCY_LIMIT)))
+    parser.add_argument("--queue-max-size", type=int, default=int(os.environ.get("GRADIO_QUEUE_MAX_SIZE", DEFAULT_QUEUE_MAX_SIZE)))
+    parser.add_argument("--max-threads", type=int, default=int(os.environ.get("GRADIO_MAX_THREADS", DEFAULT_MAX_THREADS)))
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
+
+    store_url = os.environ.get("SESSION_STORE_URL")
+    if args.workers > 1 and (not store_url or store_url == "memory://"):
+        # Workers inherit the environment, so they all open the same shared store.
+        os.environ["SESSION_STORE_URL"] = DEFAULT_SESSION_STORE_URL
+        print(f"SESSION_STORE_URL not shared; using {DEFAULT_SESSION_STORE_URL} for {args.workers} workers.")
+
+    ctx = multiprocessing.get_context("spawn")
+    worker_args = [(i, args.host, args.base_port + i, args.concurrency_limit, args.queue_max_size, args.max_threads) for i in range(args.workers)]
+    processes = {}
+    stopping = False
+
+    def start(index: int) -> None:
+        process = ctx.Process(target=_run_worker, args=worker_args[index], name=f"app-worker-{index}", daemon=False)
+        process.start()
+        processes[index] = process
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for i in range(args.workers):
+        start(i)
+    try:
+        while not stopping:
+            time.sleep(1.0)
+            for index, process in list(processes.items()):
+                if not process.is_alive() and not stopping:
+                    print(f"Worker {index} exited with code {process.exitcode}; restarting in {RESTART_DELAY_SECONDS}s.")
+                    time.sleep(RESTART_DELAY_SECONDS)
+                    start(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+# Externalized per-session state so any worker process can serve any browser session.
+# Values are stored per (session_id, key) as JSON, so concurrent events of one session that
+# touch different keys never overwrite each other. The same store keeps version counters per
+# topic ("equipments", "rentals") that workers use to invalidate their local caches.
+# Application settings (e.g. the profiling config) are kept apart from sessions and never expire.
+# SESSION_STORE_URL selects the backend: "memory://" (single process, default) or "sqlite:///path".
+
+DEFAULT_SESSION_TTL_SECONDS = 12 * 3600
+PURGE_EVERY_N_WRITES = 500
+# Session keys holding credentials (serialized Supabase session with access and refresh tokens).
+# SQLiteSessionStore encrypts their values at rest.
+ENCRYPTED_KEYS = frozenset({"user_session"})
+
+def _to_json(value: Any) -> str:
+    def default(obj):
+        if hasattr(obj, "item"): # numpy / pandas scalars
+            return obj.item()
+        if hasattr(obj, "isoformat"):
+            return obj.isoformat()
+        return str(obj)
+    return json.dumps(value, ensure_ascii=False, default=default)
+
+class SessionStore(abc.ABC):
+    """Interface for session state backends."""
+
+    @abc.abstractmethod
+    def get(self, session_id: str, key: str, default: Any = None) -> Any:
+        ...
+
+    @abc.abstractmethod
+    def set(self, session_id: str, **values: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete_session(self, session_id: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get_setting(self, name: str, default: Any = None) -> Any:
+        ...
+
+    @abc.abstractmethod
+    def set_setting(self, name: str, value: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    def bump_version(self, topic: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    def get_version(self, topic: str) -> int:
+        ...
+
+class MemorySessionStore(SessionStore):
+    """In-process store; only valid for a single worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[str, str]] = {}
+        self._settings: Dict[str, str] = {}
+        self._versions: Dict[str, int] = {}
+
+    def get(self, session_id: str, key: str, default: Any = None) -> Any:
+        with self._lock:
+            raw = self._values.get(session_id, {}).get(key)
+        return default if raw is None else json.loads(raw)
+
+    def set(self, session_id: str, **values: Any) -> None:
+        with self._lock:
+            session = self._values.setdefault(session_id, {})
+            for key, value in values.items():
+                session[key] = _to_json(value)
+
+    def delete_session(self, session_id: str) -> None:
+        with self._lock:
+            self._values.pop(session_id, None)
+
+    def get_setting(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            raw = self._settings.get(name)
+        return default if raw is None else json.loads(raw)
+
+    def set_setting(self, name: str, value: Any) -> None:
+        with self._lock:
+            self._settings[name] = _to_json(value)
+
+    def bump_version(self, topic: str) -> int:
+        with self._lock:
+            self._versions[topic] = self._versions.get(topic, 0) + 1
+            return self._versions[topic]
+
+    def get_version(self, topic: str) -> int:
+        with self._lock:
+            return self._versions.get(topic, 0)
+
+def _load_or_create_key(path: str) -> bytes:
+    """Reads the Fernet key file, creating it (mode 0600) if no worker has yet."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    key = Fernet.generate_key()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store shared by all worker processes on one host through a WAL-mode SQLite file.
+    Values of ENCRYPTED_KEYS are encrypted with encryption_key (a Fernet key); without one, a key file
+    next to the database ("<path>.key") is created on first use and shared by the workers.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS, encryption_key: Optional[str] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._fernet = Fernet(encryption_key or _load_or_create_key(path + ".key"))
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_values ("
+            " session_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_session_values_updated_at ON session_values (updated_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_versions (topic TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; Gradio runs handlers on a thread pool.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _encode(self, key: str, value: Any) -> str:
+        raw = _to_json(value)
+        return self._fernet.encrypt(raw.encode()).decode() if key in ENCRYPTED_KEYS else raw
+
+    def _decode(self, key: str, raw: str) -> Any:
+        if key in ENCRYPTED_KEYS:
+            try:
+                raw = self._fernet.decrypt(raw.encode()).decode()
+            except InvalidToken: # Written under another key (rotated); the session signs in again
+                return None
+        return json.loads(raw)
+
+    def get(self, session_id: str, key: str, default: Any = None) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM session_values WHERE session_id = ? AND key = ?", (session_id, key)
+        ).fetchone()
+        value = None if row is None else self._decode(key, row[0])
+        return default if value is None else value
+
+    def set(self, session_id: str, **values: Any) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            "INSERT INTO session_values (session_id, key, value, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (session_id, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            [(session_id, key, self._encode(key, value), now) for key, value in values.items()],
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY_N_WRITES == 0:
+            conn.execute("DELETE FROM session_values WHERE updated_at < ?", (now - self.ttl_seconds,))
+
+    def delete_session(self, session_id: str) -> None:
+        self._conn().execute("DELETE FROM session_values WHERE session_id = ?", (session_id,))
+
+    def get_setting(self, name: str, default: Any = None) -> Any:
+        row = self._conn().execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_setting(self, name: str, value: Any) -> None:
+        self._conn().execute(
+            "INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, _to_json(value)),
+        )
+
+    def bump_version(self, topic: str) -> int:
+        return self._conn().execute(
+            "INSERT INTO cache_versions (topic, version) VALUES (?, 1) "
+            "ON CONFLICT (topic) DO UPDATE SET version = version + 1 RETURNING version",
+            (topic,),
+        ).fetchone()[0]
+
+    def get_version(self, topic: str) -> int:
+        row = self._conn().execute("SELECT version FROM cache_versions WHERE topic = ?", (topic,)).fetchone()
+        return row[0] if row else 0
+
+def create_session_store(url: Optional[str], encryption_key: Optional[str] = None) -> SessionStore:
+    if not url or url == "memory://":
+        return MemorySessionStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):], encryption_key=encryption_key)
+    raise ValueError(f"Unsupported SESSION_STORE_URL: {url}")
+
+class SharedCache:
+    """
+    Process-local cache whose entries are invalidated across workers: each entry remembers the
+    topic version it was loaded at and is reloaded once any worker bumps that topic.
+    """
+
+    def __init__(self, store: SessionStore, ttl_seconds: float = 300.0):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, Any], Tuple[int, float, Any]] = {}
+
+    def get_or_load(self, topic: str, key: Any, loader: Callable[[], Any], cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Returns the cached value for (topic, key), calling loader on a miss. cache_if can reject error results."""
+        version = self.store.get_version(topic)
+        with self._lock:
+            entry = self._entries.get((topic, key))
+        if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl_seconds:
+            return entry[2]
+        value = loader()
+        if cache_if is not None and not cache_if(value):
+            return value
+        with self._lock:
+            self._entries[(topic, key)] = (version, time.monotonic(), value)
+        return value
+
+    def invalidate(self, *topics: str) -> None:
+        for topic in topics:
+            self.store.bump_version(topic)
+
+# --- Supabase session (de)serialization ---
+
+def serialize_user_session(session: Optional[Any]) -> Optional[Dict[str, Any]]:
+    """Keeps only the fields the app reads (user id/email, tokens, expiry)."""
+    if not session or not getattr(session, "user", None):
+        return None
+    return {
+        "access_token": getattr(session, "access_token", None),
+        "refresh_token": getattr(session, "refresh_token", None),
+        "expires_at": getattr(session, "expires_at", None),
+        "user": {"id": str(session.user.id), "email": getattr(session.user, "email", None)},
+    }
+
+def deserialize_user_session(data: Optional[Dict[str, Any]]) -> Optional[Any]:
+    """Rebuilds an object with the same attribute access (session.user.id, session.user.email, session.expires_at)."""
+    if not data or not data.get("user"):
+        return None
+    return SimpleNamespace(
+        access_token=data.get("access_token"),
+        refresh_token=data.get("refresh_token"),
+        expires_at=data.get("expires_at"),
+        user=SimpleNamespace(**data["user"]),
+    )
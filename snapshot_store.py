@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+# Shared, read-only copies of query results. Every session that ran the same query
+# points at the same DataFrame instead of holding its own copy in gr.State; the
+# session itself only keeps a small reference dict (snapshot ID + view parameters).
+# Snapshot IDs are derived from the content, so a reference written by one worker
+# process names the same snapshot in every other worker (see resolve_snapshot_ref).
+# Sessions may live on any worker, so nothing is reference counted: snapshots are kept
+# in a bounded LRU with an idle TTL, and a reference whose snapshot is gone is rebuilt
+# on demand by resolve_snapshot_ref.
+
+DEFAULT_MAX_SNAPSHOTS = 256
+DEFAULT_IDLE_TTL_SECONDS = 30 * 60 # Snapshots nobody read for this long are dropped
+CATEGORY_MAX_RATIO = 0.5 # Convert object columns to 'category' when unique values <= 50% of rows
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a copy of df using smaller dtypes:
+    low-cardinality text columns become 'category', integer columns are downcast.
+    Columns containing missing values are left as they are.
+    """
+    compact = df.copy()
+    for col in compact.columns:
+        series = compact[col]
+        if series.empty or series.isna().any():
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            compact[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if series.nunique() <= max(1, int(len(series) * CATEGORY_MAX_RATIO)):
+                compact[col] = series.astype("category")
+    return compact
+
+def _content_hash(namespace: str, df: pd.DataFrame) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(namespace.encode("utf-8"))
+    hasher.update("\x1f".join(str(c) for c in df.columns).encode("utf-8"))
+    if not df.empty:
+        hasher.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    return hasher.hexdigest()
+
+class SnapshotStore:
+    """
+    Content-addressed store of immutable DataFrame snapshots shared by all sessions.
+
+    Identical results (same namespace and content) are stored once. The store is a plain LRU:
+    beyond max_snapshots the least recently used snapshot is evicted, and snapshots not read
+    for idle_ttl seconds are dropped on the next put. Callers must treat returned DataFrames as
+    read-only and be prepared for get() to return None (see resolve_snapshot_ref).
+    """
+
+    def __init__(self, max_snapshots: int = DEFAULT_MAX_SNAPSHOTS, idle_ttl: float = DEFAULT_IDLE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_snapshots = max_snapshots
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+
+    def put(self, namespace: str, df: pd.DataFrame) -> str:
+        """Stores df (or reuses an identical snapshot) and returns its ID."""
+        snapshot_id = f"{namespace}-{_content_hash(namespace, df)}"
+        with self._lock:
+            if snapshot_id not in self._frames:
+                self._frames[snapshot_id] = compact_dtypes(df)
+            self._touch_locked(snapshot_id)
+            self._evict_locked()
+            return snapshot_id
+
+    def get(self, snapshot_id: Optional[str]) -> Optional[pd.DataFrame]:
+        if not snapshot_id:
+            return None
+        with self._lock:
+            df = self._frames.get(snapshot_id)
+            if df is not None:
+                self._touch_locked(snapshot_id)
+            return df
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._frames)
+
+    def _touch_locked(self, snapshot_id: str) -> None:
+        self._frames.move_to_end(snapshot_id)
+        self._last_used[snapshot_id] = self._clock()
+
+    def _evict_locked(self) -> None:
+        expired_before = self._clock() - self.idle_ttl
+        while self._frames:
+            oldest = next(iter(self._frames))
+            if len(self._frames) <= self.max_snapshots and self._last_used[oldest] >= expired_before:
+                break
+            self._drop_locked(oldest)
+
+    def _drop_locked(self, snapshot_id: str) -> None:
+        self._frames.pop(snapshot_id, None)
+        self._last_used.pop(snapshot_id, None)
+
+_snapshot_store = SnapshotStore()
+
+def get_snapshot_store() -> SnapshotStore:
+    return _snapshot_store
+
+# --- Session references ---
+# A session reference is a plain JSON-safe dict kept in session state:
+# {"namespace": str, "snapshot_id": str, "view": dict}.
+
+def make_snapshot_ref(namespace: str, df: pd.DataFrame, **view: Any) -> Dict[str, Any]:
+    """Stores df in the shared store and returns the new session reference."""
+    snapshot_id = get_snapshot_store().put(namespace, df)
+    return {"namespace": namespace, "snapshot_id": snapshot_id, "view": dict(view)}
+
+def resolve_snapshot_ref(
+    ref: Optional[Dict[str, Any]],
+    reload: Optional[Callable[[Dict[str, Any]], pd.DataFrame]] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Returns the snapshot ref points at. When this process does not hold it (the ref was made
+    by another worker, or the snapshot was evicted), reload(view) re-runs the query; the result
+    is used only if its content matches the snapshot ID, i.e. row positions still line up.
+    """
+    if not ref or not isinstance(ref, dict):
+        return None
+    store = get_snapshot_store()
+    snapshot_id = ref.get("snapshot_id")
+    df = store.get(snapshot_id)
+    if df is not None or reload is None or not ref.get("namespace"):
+        return df
+    try:
+        reloaded = reload(ref.get("view") or {})
+    except Exception as e:
+        print(f"Snapshot reload failed for {snapshot_id}: {e}")
+        return None
+    if reloaded is None:
+        return None
+    if store.put(ref["namespace"], reloaded) != snapshot_id:
+        return None
+    return store.get(snapshot_id)
@@ -0,0 +1,280 @@
+import json
+import threading
+import time
+import unittest
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from supabase import create_client, ClientOptions
+import db_utils
+from auth_utils import login_user, refresh_user_session
+from backend_calls import (
+    BackendCaller,
+    CircuitBreaker,
+    get_backend_caller,
+    BackendTimeout,
+    BackendTransientError,
+    BackendUnavailable,
+    AuthenticationError,
+    PermissionDenied,
+    NotFound,
+    ExclusionViolation,
+)
+
+class StandInBackend:
+    """
+    Local HTTP server answering like PostgREST (/rest/v1) and GoTrue (/auth/v1) for a few fixed rows.
+    POST /rest/v1/rpc/<name> answers with rpc[name](body); a refresh token in refresh_tokens is exchanged
+    for a new session. The Authorization header of every request is kept in authorizations.
+    Each request first takes the next entry of faults, if any: {"delay": s}, {"status": code},
+    {"error": {code, message, details}} (a Postgres error, HTTP 400) or {"drop": True} (close the socket).
+    """
+
+    def __init__(self):
+        self.tables = {"equipments": [{"id": "EQ-1", "name": "오실로스코프", "department": "IT과", "quantity": 2, "available_quantity": 2}], "rentals": []}
+        self.rpc = {}
+        self.refresh_tokens = {}
+        self.faults = []
+        self.requests = []
+        self.authorizations = []
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                backend._handle(self)
+
+            def do_POST(self):
+                backend._handle(self)
+
+            def do_PATCH(self):
+                backend._handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _send(self, handler, status, body, headers=None):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handle(self, handler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = json.loads(handler.rfile.read(length)) if length else None
+        self.requests.append((handler.command, handler.path))
+        self.authorizations.append(handler.headers.get("Authorization"))
+        fault = self.faults.pop(0) if self.faults else {}
+        if fault.get("delay"):
+            time.sleep(fault["delay"])
+        if fault.get("drop"):
+            handler.close_connection = True
+            handler.connection.shutdown(2)
+            return
+        if fault.get("status"):
+            return self._send(handler, fault["status"], {"message": "stand-in fault"})
+        if fault.get("error"):
+            return self._send(handler, 400, dict({"hint": None, "details": None}, **fault["error"]))
+        if handler.path.startswith("/auth/v1/token?grant_type=refresh_token") and body["refresh_token"] in self.refresh_tokens:
+            user = {"id": "user-1", "email": "student@example.com", "aud": "authenticated", "created_at": "2026-01-01T00:00:00Z",
+                    "app_metadata": {}, "user_metadata": {}}
+            return self._send(handler, 200, {"access_token": self.refresh_tokens.pop(body["refresh_token"]), "refresh_token": "refresh-2",
+                                             "token_type": "bearer", "expires_in": 3600, "expires_at": int(time.time()) + 3600, "user": user})
+        if handler.path.startswith("/auth/v1/token"):
+            return self._send(handler, 400, {"code": "invalid_credentials", "msg": "Invalid login credentials"}, {"X-Supabase-Api-Version": "2024-01-01"})
+        table = handler.path.split("/rest/v1/", 1)[1].split("?", 1)[0]
+        if table.startswith("rpc/"):
+            return self._send(handler, 200, self.rpc[table[4:]](body))
+        if handler.command == "GET":
+            rows = self.tables[table]
+            if "vnd.pgrst.object" in (handler.headers.get("Accept") or ""):
+                if len(rows) != 1:
+                    return self._send(handler, 406, {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned", "details": None, "hint": None})
+                return self._send(handler, 200, rows[0])
+            return self._send(handler, 200, rows, {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{len(rows)}"})
+        rows = body if isinstance(body, list) else [body]
+        if handler.command == "POST":
+            rows = [dict(row, id=len(self.tables[table]) + i + 1) for i, row in enumerate(rows)]
+            self.tables[table].extend(rows)
+            return self._send(handler, 201, rows)
+        return self._send(handler, 200, [dict(self.tables[table][0], **body)])
+
+EXCLUSION_ERROR = {"code": "23P01", "message": 'conflicting key value violates exclusion constraint "rentals_no_overlap"'}
+
+class TestBackendCaller(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = StandInBackend()
+        self.client = create_client(self.backend.url, "stand-in-key")
+        self.now = [0.0]
+        self.caller = BackendCaller(CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=lambda: self.now[0]),
+                                    read_deadline=2, write_deadline=2, retry_base_delay=0.01)
+
+    def tearDown(self):
+        self.backend.close()
+
+    def _read(self, deadline=None):
+        query = self.client.table("equipments").select("*").retry(False) # As backend_read does
+        return self.caller.call("equipments", query.execute, idempotent=True, deadline=deadline)
+
+    def test_idempotent_read_is_retried_on_transient_failures(self):
+        self.backend.faults = [{"status": 503}, {"drop": True}]
+        self.assertEqual(self._read().data[0]["id"], "EQ-1")
+        self.assertEqual(len(self.backend.requests), 3)
+        self.assertEqual(self.caller.breaker.state, "closed")
+
+    def test_write_is_not_retried(self):
+        self.backend.faults = [{"status": 503}]
+        with self.assertRaises(BackendTransientError):
+            self.caller.call("insert", self.client.table("rentals").insert({"equipment_id": "EQ-1"}).execute)
+        self.assertEqual(len(self.backend.requests), 1)
+        self.assertEqual(self.backend.tables["rentals"], [])
+
+    def test_deadline_bounds_a_slow_backend(self):
+        self.backend.faults = [{"delay": 1.5}] * 5
+        started = time.monotonic()
+        with self.assertRaises(BackendTimeout):
+            self._read(deadline=0.3)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_errors_are_typed(self):
+        self.backend.faults = [{"error": EXCLUSION_ERROR}]
+        with self.assertRaises(ExclusionViolation) as ctx:
+            self.caller.call("insert", self.client.table("rentals").insert({"equipment_id": "EQ-1"}).execute)
+        self.assertEqual(ctx.exception.constraint, "rentals_no_overlap")
+        self.backend.faults = [{"error": {"code": "42501", "message": 'new row violates row-level security policy for table "rentals"'}}]
+        with self.assertRaises(PermissionDenied):
+            self.caller.call("insert", self.client.table("rentals").insert({"equipment_id": "EQ-1"}).execute)
+        self.backend.faults = [{"error": {"code": "PGRST301", "message": "JWT expired"}}]
+        with self.assertRaises(AuthenticationError):
+            self._read()
+        with self.assertRaises(NotFound):
+            self.caller.call("single", self.client.table("rentals").select("*").single().execute, idempotent=True)
+        self.assertEqual(len(self.backend.requests), 4) # None of these were retried
+        self.assertEqual(self.caller.breaker.state, "closed") # Nor did they count as backend failures
+
+    def test_retries_of_one_call_count_as_one_breaker_failure(self):
+        self.backend.faults = [{"status": 503}] * 8
+        for _ in range(2):
+            with self.assertRaises(BackendTransientError):
+                self._read()
+        self.assertEqual(len(self.backend.requests), 8) # Every attempt of both calls reached the backend
+        self.assertEqual(self.caller.breaker.state, "closed") # Two failed calls, threshold 3
+
+    def test_circuit_breaker_fails_fast_and_recovers(self):
+        self.caller.max_retries = 0
+        self.backend.faults = [{"status": 503}] * 3
+        for _ in range(3):
+            with self.assertRaises(BackendTransientError):
+                self._read()
+        with self.assertRaises(BackendUnavailable) as ctx:
+            self._read()
+        self.assertIn("다시 시도해주세요", ctx.exception.message)
+        self.assertEqual(len(self.backend.requests), 3) # Rejected without a request
+        self.now[0] += 31
+        self.assertEqual(self.caller.breaker.state, "half_open")
+        self.assertEqual(self._read().data[0]["id"], "EQ-1")
+        self.assertEqual(self.caller.breaker.state, "closed")
+
+class TestBackendCallsInHandlers(unittest.TestCase):
+    """db_utils/auth_utils against the stand-in backend through the shared caller."""
+
+    def setUp(self):
+        self.backend = StandInBackend()
+        self.client = create_client(self.backend.url, "stand-in-key")
+        self.saved_client, db_utils._supabase_client = db_utils._supabase_client, self.client
+        self.caller = get_backend_caller()
+        self.saved_breaker, self.caller.breaker = self.caller.breaker, CircuitBreaker(failure_threshold=2)
+        self.session = SimpleNamespace(user=SimpleNamespace(id="user-1", email="student@example.com"))
+        self.start = (date.today() + timedelta(days=1)).isoformat()
+        self.end = (date.today() + timedelta(days=3)).isoformat()
+
+    def tearDown(self):
+        db_utils._supabase_client = self.saved_client
+        self.caller.breaker = self.saved_breaker
+        self.backend.close()
+
+    def _rent(self):
+        return db_utils.process_rental_request(["EQ-1"], self.start, self.end, "김철수", "실험", self.session)
+
+    def test_rental_success_and_overlap_rejection(self):
+        msg, remaining = self._rent()
+        self.assertTrue(msg.startswith("성공"), msg)
+        self.assertEqual(remaining, [])
+        self.backend.tables["rentals"] = [] # Conflict pre-check passes; the exclusion constraint rejects the insert
+        self.backend.faults = [{}, {}, {"error": EXCLUSION_ERROR}]
+        msg, remaining = self._rent()
+        self.assertIn("이미 대여 중", msg)
+        self.assertEqual(remaining, ["EQ-1"])
+
+    def test_rental_fits_while_a_unit_is_free(self):
+        self.backend.tables["rentals"] = [{"start_date": self.start, "end_date": self.end, "unit_no": 1}]
+        msg, _ = self._rent()
+        self.assertTrue(msg.startswith("성공"), msg) # Quantity 2: unit 2 is still free
+        self.backend.tables["rentals"] = [{"start_date": self.start, "end_date": self.end, "unit_no": unit} for unit in (1, 2)]
+        msg, remaining = self._rent()
+        self.assertIn("이미 대여 중", msg)
+        self.assertEqual(remaining, ["EQ-1"])
+        self.assertNotIn("PATCH", [method for method, _ in self.backend.requests], "available_quantity is kept by the database")
+
+    def test_writes_carry_the_session_token(self):
+        self.session.access_token = "token-of-user-1"
+        msg, _ = self._rent()
+        self.assertTrue(msg.startswith("성공"), msg)
+        self.assertEqual(set(self.backend.authorizations), {"Bearer token-of-user-1"})
+        self.assertEqual(self.client.options.headers["Authorization"], "Bearer stand-in-key") # The shared client is untouched
+
+    def test_session_refreshed_with_refresh_token(self):
+        self.backend.refresh_tokens = {"refresh-1": "token-2"}
+        auth_client = create_client(self.backend.url, "stand-in-key", options=ClientOptions(auto_refresh_token=False, persist_session=False))
+        self.session.refresh_token = "refresh-1"
+        refreshed, _ = refresh_user_session(auth_client, self.session)
+        self.assertEqual((refreshed.access_token, refreshed.refresh_token), ("token-2", "refresh-2"))
+        expired, msg = refresh_user_session(auth_client, self.session) # refresh-1 was used up
+        self.assertIsNone(expired)
+        self.assertIn("Session expired", msg)
+
+    def test_rental_batch_committed_in_one_rpc(self):
+        def commit_rental_batch(body):
+            outcomes = {"k1": ("committed", 7, 1), "k2": ("conflict", None, 1), "k3": ("duplicate", 5, None)}
+            return [{"idempotency_key": row["idempotency_key"], "outcome": outcomes[row["idempotency_key"]][0],
+                     "rental_id": outcomes[row["idempotency_key"]][1], "equipment_name": "오실로스코프",
+                     "available_quantity": outcomes[row["idempotency_key"]][2]} for row in body["p_rentals"]]
+        self.backend.rpc["commit_rental_batch"] = commit_rental_batch
+        rows = [{"idempotency_key": key, "equipment_id": "EQ-1", "start_date": self.start, "end_date": self.end, "user_id": "user-1"}
+                for key in ("k1", "k2", "k3")]
+        outcomes = db_utils.commit_rental_batch(rows)
+        self.assertEqual({key: status for key, (status, _) in outcomes.items()}, {"k1": "committed", "k2": "rejected", "k3": "committed"})
+        self.assertIn("이미 대여 중", outcomes["k2"][1])
+        self.assertEqual(self.backend.requests, [("POST", "/rest/v1/rpc/commit_rental_batch")])
+
+    def test_handlers_fail_fast_while_backend_is_down(self):
+        self.caller.breaker.record_failure()
+        self.caller.breaker.record_failure()
+        df, msg = db_utils.fetch_equipments("전체", "")
+        self.assertTrue(df.empty)
+        self.assertIn("서버(Supabase) 응답이 불안정", msg)
+        self.assertEqual(self.backend.requests, [])
+        session, msg = login_user(self.client, "student@example.com", "secret123")
+        self.assertIsNone(session)
+        self.assertIn("서버(Supabase) 응답이 불안정", msg)
+
+    def test_login_rejection_is_typed(self):
+        session, msg = login_user(self.client, "student@example.com", "wrong-password")
+        self.assertIsNone(session)
+        self.assertEqual(msg, "Login failed: Invalid login credentials")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from datetime import date
+from batch_scheduler import allocate_plan, parse_plan_text
+
+EQUIPMENTS = [
+    {'id': 'EQP-001', 'name': '오실로스코프', 'department': '물리과', 'quantity': 2},
+    {'id': 'EQP-002', 'name': '오실로스코프 B', 'department': '물리과', 'quantity': 1},
+    {'id': 'EQP-100', 'name': '비커', 'department': '화학과', 'quantity': 5},
+]
+
+class TestAllocatePlan(unittest.TestCase):
+
+    def test_fits_within_capacity(self):
+        plan = [{'equipment_id': 'EQP-001', 'quantity': 2, 'priority': 0, 'ranges': [('2030-03-04', '2030-03-04'), ('2030-03-11', '2030-03-11')]}]
+        result = allocate_plan(plan, EQUIPMENTS, [])
+        self.assertEqual(len(result['accepted']), 2)
+        self.assertFalse(result['rejected'])
+        self.assertFalse(any(row['substitute'] for row in result['accepted']))
+
+    def test_substitute_from_same_department(self):
+        booked = [{'equipment_id': 'EQP-001', 'start_date': '2030-03-04', 'end_date': '2030-03-05'}]
+        plan = [{'equipment_id': 'EQP-001', 'quantity': 2, 'priority': 0, 'ranges': [('2030-03-05', '2030-03-05')]}]
+        result = allocate_plan(plan, EQUIPMENTS, booked)
+        self.assertEqual({(r['equipment_id'], r['units'], r['substitute']) for r in result['accepted']},
+                         {('EQP-001', 1, False), ('EQP-002', 1, True)})
+
+    def test_a_unit_must_be_free_for_the_whole_range(self):
+        # Peak usage is 1 of 2 on every day, but neither unit is free from the 4th to the 8th
+        booked = [{'equipment_id': 'EQP-001', 'start_date': '2030-03-04', 'end_date': '2030-03-05', 'unit_no': 1},
+                  {'equipment_id': 'EQP-001', 'start_date': '2030-03-07', 'end_date': '2030-03-08', 'unit_no': 2}]
+        plan = [{'equipment_id': 'EQP-001', 'quantity': 1, 'priority': 0, 'ranges': [('2030-03-04', '2030-03-08'), ('2030-03-06', '2030-03-06')]}]
+        result = allocate_plan(plan, [EQUIPMENTS[0]], booked)
+        self.assertEqual([(r['start_date'], r['unit_nos']) for r in result['accepted']], [('2030-03-06', [1])])
+        self.assertEqual(len(result['rejected']), 1)
+
+    def test_priority_wins_and_items_are_all_or_nothing(self):
+        plan = [
+            {'department': '물리과', 'quantity': 2, 'priority': 0, 'ranges': [('2030-03-04', '2030-03-04')]},
+            {'department': '물리과', 'quantity': 3, 'priority': 5, 'ranges': [('2030-03-04', '2030-03-04')]},
+        ]
+        result = allocate_plan(plan, EQUIPMENTS, [])
+        self.assertEqual(sum(r['units'] for r in result['accepted']), 3)
+        self.assertTrue(all(r['request_index'] == 1 for r in result['accepted']))
+        self.assertEqual(len(result['rejected']), 1)
+        self.assertEqual(result['rejected'][0]['request_index'], 0)
+
+    def test_unknown_equipment_rejected(self):
+        plan = [{'equipment_id': 'NOPE', 'quantity': 1, 'priority': 0, 'ranges': [('2030-03-04', '2030-03-04')]}]
+        result = allocate_plan(plan, EQUIPMENTS, [])
+        self.assertEqual(len(result['rejected']), 1)
+
+class TestParsePlanText(unittest.TestCase):
+
+    def test_parses_departments_ids_and_ranges(self):
+        plan, errors = parse_plan_text("eqp-001, 2, 1, 2030-03-04 2030-03-05~2030-03-06\n# comment\n물리과, 1, 0, 2030-03-07", ["물리과"])
+        self.assertEqual(errors, [])
+        self.assertEqual(plan[0]['equipment_id'], 'EQP-001')
+        self.assertEqual(plan[0]['ranges'], [(date(2030, 3, 4), date(2030, 3, 4)), (date(2030, 3, 5), date(2030, 3, 6))])
+        self.assertEqual(plan[1]['department'], '물리과')
+
+    def test_reports_bad_lines(self):
+        plan, errors = parse_plan_text("EQP-001, two, 1, 2030-03-04\nEQP-001, 1, 0, 2030/03/04", [])
+        self.assertEqual(plan, [])
+        self.assertEqual(len(errors), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import threading
+import unittest
+from supabase_auth.errors import AuthApiError, AuthRetryableError
+import bulk_provisioning
+from backend_calls import CircuitBreaker, get_backend_caller
+from bulk_provisioning import (
+    parse_provisioning_csv, provision_users,
+    STATUS_CREATED, STATUS_INVITED, STATUS_EXISTS, STATUS_INVALID, STATUS_DUPLICATE, STATUS_FAILED
+)
+
+class FakeAdminApi:
+    def __init__(self, existing=(), transient_failures=0, network_failures=0):
+        self.existing = set(existing)
+        self.transient_failures = transient_failures
+        self.network_failures = network_failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _handle(self, email):
+        with self._lock:
+            self.calls += 1
+            if self.network_failures > 0:
+                self.network_failures -= 1
+                raise AuthRetryableError("Connection reset by peer", 0)
+            if self.transient_failures > 0:
+                self.transient_failures -= 1
+                raise AuthApiError("upstream timeout", 503, None)
+            if email in self.existing:
+                raise AuthApiError("A user with this email address has already been registered", 422, "email_exists")
+            if email.startswith("weak"):
+                raise AuthApiError("Password is already known to be weak", 422, "weak_password")
+            self.existing.add(email)
+
+    def create_user(self, attributes):
+        self._handle(attributes["email"])
+
+    def invite_user_by_email(self, email, options=None):
+        self._handle(email)
+
+class FakeAdminClient:
+    def __init__(self, api):
+        self.auth = type("Auth", (), {"admin": api})()
+
+class TestBulkProvisioning(unittest.TestCase):
+
+    def setUp(self):
+        self._delay = bulk_provisioning.RETRY_BASE_DELAY
+        bulk_provisioning.RETRY_BASE_DELAY = 0
+        self.caller = get_backend_caller()
+        self.saved_breaker, self.caller.breaker = self.caller.breaker, CircuitBreaker(failure_threshold=100)
+
+    def tearDown(self):
+        bulk_provisioning.RETRY_BASE_DELAY = self._delay
+        self.caller.breaker = self.saved_breaker
+
+    def test_parse_with_and_without_header(self):
+        with_header = parse_provisioning_csv("name,email,password\nKim,kim@example.com,secret1\n")
+        self.assertEqual(with_header, [{"row": 2, "email": "kim@example.com", "password": "secret1"}])
+        without_header = parse_provisioning_csv("lee@example.com\n\npark@example.com,secret2\n")
+        self.assertEqual([r["email"] for r in without_header], ["lee@example.com", "park@example.com"])
+        self.assertIsNone(without_header[0]["password"])
+
+    def test_report_covers_every_row(self):
+        api = FakeAdminApi(existing={"old@example.com"})
+        csv_text = "email,password\nnew@example.com,secret1\nNEW@example.com,secret1\nbad-email,\nold@example.com,secret1\ninvite@example.com,\n"
+        report, stats = provision_users(FakeAdminClient(api), csv_text, max_workers=4)
+        self.assertEqual([r["status"] for r in report],
+                         [STATUS_CREATED, STATUS_DUPLICATE, STATUS_INVALID, STATUS_EXISTS, STATUS_INVITED])
+        self.assertEqual(stats["total"], 5)
+        self.assertEqual(api.calls, 3, "Invalid and duplicate rows never reach the API")
+
+    def test_transient_errors_retried(self):
+        api = FakeAdminApi(transient_failures=2)
+        report, stats = provision_users(FakeAdminClient(api), "a@example.com,secret1", max_workers=1, max_retries=3)
+        self.assertEqual(report[0]["status"], STATUS_CREATED)
+        self.assertEqual(report[0]["attempts"], 3)
+
+    def test_network_errors_retried(self):
+        api = FakeAdminApi(network_failures=1)
+        report, _ = provision_users(FakeAdminClient(api), "a@example.com,secret1", max_workers=1)
+        self.assertEqual(report[0]["status"], STATUS_CREATED)
+        self.assertEqual(report[0]["attempts"], 2)
+
+    def test_already_registered_matched_by_code_only(self):
+        report, _ = provision_users(FakeAdminClient(FakeAdminApi()), "weak@example.com,secret1", max_workers=1)
+        self.assertEqual(report[0]["status"], STATUS_FAILED, "Message text mentioning 'already' is not a duplicate")
+        self.assertEqual(report[0]["attempts"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        api = FakeAdminApi(transient_failures=10)
+        report, stats = provision_users(FakeAdminClient(api), "a@example.com,secret1", max_workers=1, max_retries=2)
+        self.assertEqual(report[0]["status"], STATUS_FAILED)
+        self.assertEqual(stats[STATUS_FAILED], 1)
+
+    def test_missing_admin_client(self):
+        report, _ = provision_users(None, "a@example.com")
+        self.assertEqual(report[0]["status"], STATUS_FAILED)
+
+if __name__ == '__main__':
+    unittest.main()
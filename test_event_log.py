@@ -0,0 +1,178 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from event_log import (
+    EventLog,
+    make_event,
+    empty_state,
+    apply_event,
+    EVENT_EQUIPMENT_ADDED,
+    EVENT_EQUIPMENT_UPDATED,
+    EVENT_EQUIPMENT_REMOVED,
+    EVENT_RENTAL_CREATED,
+    EVENT_RENTAL_UPDATED,
+    EVENT_RENTAL_STATUS_CHANGED,
+    EVENT_RENTAL_REMOVED,
+)
+
+class FakeEventStore:
+    """
+    In-memory stand-in for SupabaseEventStore. append() plays the database triggers
+    (migrations/0004_event_log.sql), assigning seq and occurred_at like the column defaults.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.snapshots = []
+        self.now = datetime(2024, 3, 1, 9, 0, tzinfo=timezone.utc)
+        self.fetched = 0
+        self.uncommitted = set() # seqs of transactions still open: not visible yet
+
+    def append(self, rows, committed=True):
+        seqs = []
+        for row in rows:
+            self.now += timedelta(minutes=1)
+            event = dict(row, seq=len(self.events) + 1, occurred_at=self.now.isoformat())
+            self.events.append(event)
+            seqs.append(event["seq"])
+            if not committed:
+                self.uncommitted.add(event["seq"])
+        return seqs
+
+    def commit(self, seq):
+        self.uncommitted.discard(seq)
+
+    def _visible(self):
+        return [e for e in self.events if e["seq"] not in self.uncommitted]
+
+    def latest_seq(self):
+        visible = self._visible()
+        return visible[-1]["seq"] if visible else 0
+
+    def committed_seq(self):
+        # The database waits for open transactions instead; the horizon is the same once they finish.
+        return min(self.uncommitted) - 1 if self.uncommitted else len(self.events)
+
+    def latest_snapshot(self, at=None):
+        matching = [s for s in self.snapshots if at is None or s["last_occurred_at"] <= at]
+        return max(matching, key=lambda s: s["last_seq"]) if matching else None
+
+    def events_after(self, seq, since=None, at=None, up_to_seq=None):
+        for event in self._visible():
+            if up_to_seq is not None and event["seq"] > up_to_seq:
+                return
+            if event["seq"] > seq and (since is None or event["occurred_at"] >= since) and (at is None or event["occurred_at"] <= at):
+                self.fetched += 1
+                yield event
+
+    def save_snapshot(self, last_seq, last_occurred_at, state):
+        if not any(s["last_seq"] == last_seq for s in self.snapshots):
+            self.snapshots.append({"last_seq": last_seq, "last_occurred_at": last_occurred_at, "state": state})
+
+    def equipment_events(self, equipment_id, limit):
+        return [e for e in reversed(self.events) if e["equipment_id"] == equipment_id][:limit]
+
+def _log(store, event_type, actor, **fields):
+    return store.append([make_event(event_type, actor, **fields)])[0]
+
+def _rental(store, rental_id, eq_id, start, end, **extra):
+    return _log(store, EVENT_RENTAL_CREATED, "user@example.com", rental_id=rental_id, equipment_id=eq_id,
+                start_date=start, end_date=end, status="confirmed", **extra)
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.store = FakeEventStore()
+        self.log = EventLog(self.store, snapshot_every=10)
+
+    def test_make_event_validates_type_and_fields(self):
+        with self.assertRaises(ValueError):
+            make_event("equipment_deleted", "admin")
+        with self.assertRaises(ValueError):
+            make_event(EVENT_RENTAL_STATUS_CHANGED, "admin", rental_id=1)
+        event = make_event(EVENT_RENTAL_STATUS_CHANGED, "admin", rental_id=1, status="overdue", equipment_id="EQ-1", purpose="ignored")
+        self.assertEqual(event["equipment_id"], "EQ-1")
+        self.assertEqual(event["payload"], {"rental_id": 1, "status": "overdue", "equipment_id": "EQ-1"})
+
+    def test_apply_event_follows_equipment_rename(self):
+        state = empty_state()
+        apply_event(state, make_event(EVENT_EQUIPMENT_ADDED, "admin", equipment_id="EQ-1", name="스코프", department="IT과", quantity=2, available_quantity=2))
+        apply_event(state, make_event(EVENT_RENTAL_CREATED, "u", rental_id=7, equipment_id="EQ-1", start_date="2024-03-01", end_date="2024-03-05", status="confirmed"))
+        apply_event(state, make_event(EVENT_EQUIPMENT_UPDATED, "admin", equipment_id="EQ-2", previous_id="EQ-1", name="스코프", department="IT과",
+                                      quantity=3, available_quantity=2, previous_quantity=2, previous_available_quantity=1))
+        self.assertEqual(list(state["equipments"]), ["EQ-2"])
+        self.assertEqual(state["rentals"]["7"]["equipment_id"], "EQ-2")
+
+    def test_apply_event_updates_and_removals(self):
+        state = empty_state()
+        apply_event(state, make_event(EVENT_EQUIPMENT_ADDED, "admin", equipment_id="EQ-1", name="스코프", department="IT과", quantity=2, available_quantity=2))
+        apply_event(state, make_event(EVENT_RENTAL_CREATED, "u", rental_id=7, equipment_id="EQ-1", start_date="2024-03-01", end_date="2024-03-05", status="confirmed"))
+        apply_event(state, make_event(EVENT_RENTAL_UPDATED, "postgres", rental_id=7, equipment_id="EQ-1", start_date="2024-03-01", end_date="2024-03-09",
+                                      status="confirmed", borrower_name="김철수"))
+        self.assertEqual((state["rentals"]["7"]["end_date"], state["rentals"]["7"]["borrower_name"]), ("2024-03-09", "김철수"))
+        apply_event(state, make_event(EVENT_RENTAL_REMOVED, "postgres", rental_id=7, equipment_id="EQ-1"))
+        apply_event(state, make_event(EVENT_EQUIPMENT_REMOVED, "postgres", equipment_id="EQ-1"))
+        self.assertEqual(state, empty_state())
+
+    def test_state_at_and_on_loan_at(self):
+        _log(self.store, EVENT_EQUIPMENT_ADDED, "admin", equipment_id="EQ-1", name="스코프", department="IT과", quantity=2, available_quantity=2)
+        _rental(self.store, 1, "EQ-1", "2024-03-04", "2024-03-08", borrower_name="김철수")
+        _log(self.store, EVENT_EQUIPMENT_UPDATED, "user@example.com", equipment_id="EQ-1", previous_id="EQ-1", name="스코프", department="IT과",
+             quantity=2, available_quantity=1, previous_quantity=2, previous_available_quantity=2)
+        before_return = self.store.now.isoformat()
+        _log(self.store, EVENT_RENTAL_STATUS_CHANGED, "admin", rental_id=1, status="returned", previous_status="confirmed")
+        self.assertEqual(self.log.state_at(before_return)["rentals"]["1"]["status"], "confirmed")
+        self.assertEqual(self.log.state_at(before_return)["equipments"]["EQ-1"]["available_quantity"], 1)
+        self.assertEqual(self.log.on_loan_at("2024-03-05"), []) # Returned by the end of that day
+        self.store.events.pop() # Without the status change it is on loan
+        on_loan = self.log.on_loan_at("2024-03-05")
+        self.assertEqual([(r["rental_id"], r["equipment_name"], r["borrower_name"]) for r in on_loan], [("1", "스코프", "김철수")])
+        self.assertEqual(self.log.on_loan_at("2024-03-09"), [])
+
+    def test_snapshots_bound_replay(self):
+        _log(self.store, EVENT_EQUIPMENT_ADDED, "admin", equipment_id="EQ-1", name="스코프", department="IT과", quantity=100, available_quantity=100)
+        for rental_id in range(1, 45):
+            _rental(self.store, rental_id, "EQ-1", "2024-03-04", "2024-03-08")
+            self.log.snapshot_if_due() # As the background job would, here after every write
+        self.assertEqual([s["last_seq"] for s in self.store.snapshots], [10, 20, 30, 40])
+        self.store.fetched = 0
+        state = self.log.state_at(self.store.now.isoformat())
+        self.assertEqual(len(state["rentals"]), 44)
+        self.assertLessEqual(self.store.fetched, 10)
+        # A point between snapshots starts from the earlier one and stops at the requested time
+        at = self.store.events[24]["occurred_at"]
+        self.store.fetched = 0
+        self.assertEqual(len(self.log.state_at(at)["rentals"]), 24)
+        self.assertLessEqual(self.store.fetched, 10)
+        # Snapshots are not mutated by replays
+        self.assertEqual(len(self.store.latest_snapshot()["state"]["rentals"]), 39)
+
+    def test_snapshot_only_when_due(self):
+        self.assertIsNone(self.log.snapshot_if_due()) # Empty log
+        for rental_id in range(1, 10):
+            _rental(self.store, rental_id, "EQ-1", "2024-03-04", "2024-03-08")
+        self.assertIsNone(self.log.snapshot_if_due())
+        _rental(self.store, 10, "EQ-1", "2024-03-04", "2024-03-08")
+        self.assertEqual(self.log.snapshot_if_due(), 10)
+        self.assertIsNone(self.log.snapshot_if_due()) # Until another snapshot_every events arrive
+        self.assertEqual(len(self.store.snapshots), 1)
+
+    def test_snapshot_stops_before_uncommitted_event(self):
+        _rental(self.store, 1, "EQ-1", "2024-03-04", "2024-03-08")
+        late_seq = self.store.append([make_event(EVENT_RENTAL_CREATED, "user@example.com", rental_id=2, equipment_id="EQ-1",
+                                                 start_date="2024-03-04", end_date="2024-03-08", status="confirmed")], committed=False)[0]
+        _rental(self.store, 3, "EQ-1", "2024-03-04", "2024-03-08")
+        self.assertEqual(self.log.take_snapshot(), 1) # Seq 3 is visible, seq 2 is still being committed
+        self.store.commit(late_seq)
+        self.assertEqual(sorted(self.log.state_at(self.store.now.isoformat())["rentals"]), ["1", "2", "3"])
+        self.assertEqual(self.log.take_snapshot(), 3)
+        self.assertEqual(sorted(self.store.latest_snapshot()["state"]["rentals"]), ["1", "2", "3"])
+
+    def test_equipment_history_newest_first(self):
+        _log(self.store, EVENT_EQUIPMENT_ADDED, "admin@example.com", equipment_id="EQ-1", name="스코프", department="IT과", quantity=2, available_quantity=2)
+        _rental(self.store, 1, "EQ-1", "2024-03-04", "2024-03-08")
+        history = self.log.equipment_history("EQ-1")
+        self.assertEqual([e["event_type"] for e in history], [EVENT_RENTAL_CREATED, EVENT_EQUIPMENT_ADDED])
+        self.assertEqual(history[1]["actor"], "admin@example.com")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import pandas as pd
+from handler_profiler import (
+    HandlerProfiler,
+    classify_stack,
+    profiled,
+    get_handler_profiler,
+    PHASE_NETWORK,
+    PHASE_DATAFRAME,
+    PHASE_OTHER,
+)
+
+def _build_frames(n: int = 40) -> pd.DataFrame:
+    deadline = time.perf_counter() + 0.05
+    df = pd.DataFrame()
+    while time.perf_counter() < deadline:
+        df = pd.DataFrame({"ID": [f"EQP-{i:03d}" for i in range(n)], "총량": list(range(n))}).sort_values("총량")
+    return df
+
+class TestHandlerProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.profiler = HandlerProfiler(output_dir=self.tmpdir.name, sample_rate=1.0, sample_interval=0.001)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_classify_stack(self):
+        self.assertEqual(classify_stack(["/app/db_utils.py", "/site-packages/httpcore/_sync/connection.py", "/site-packages/pandas/core/frame.py"]), PHASE_NETWORK)
+        self.assertEqual(classify_stack(["/app/db_utils.py", "/site-packages/pandas/core/frame.py"]), PHASE_DATAFRAME)
+        self.assertEqual(classify_stack(["/app/app.py"]), PHASE_OTHER)
+
+    def test_sampled_invocation_writes_folded_stacks_and_summary(self):
+        self.profiler.set_enabled(True)
+        def handle_list(): # Stands in for an event handler returning (DataFrame, message)
+            return _build_frames(), "ok"
+        df, msg = self.profiler.run("handle_list", handle_list)
+        self.assertEqual(msg, "ok")
+        files = os.listdir(self.tmpdir.name)
+        folded = [f for f in files if f.startswith("handle_list.") and f.endswith(".folded")]
+        self.assertEqual(len(folded), 1)
+        with open(os.path.join(self.tmpdir.name, folded[0]), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertTrue(all(line.startswith("handle_list;[") and line.rsplit(" ", 1)[1].isdigit() for line in lines))
+        self.assertTrue(any(line.startswith("handle_list;[dataframe];") for line in lines))
+        summary_file = [f for f in files if f.startswith("summary.")][0]
+        with open(os.path.join(self.tmpdir.name, summary_file), encoding="utf-8") as f:
+            entry = json.loads(f.readline())
+        self.assertGreater(entry["dataframe_ms"], 0)
+        self.assertGreaterEqual(entry["wall_ms"], 50)
+        self.assertEqual(self.profiler.summary()[0]["count"], 1)
+
+    def test_disabled_profiler_is_pass_through(self):
+        profiler = get_handler_profiler()
+        profiler.set_enabled(False)
+        calls = []
+        @profiled
+        def handler(value):
+            calls.append(value)
+            return value * 2
+        self.assertEqual(handler(21), 42)
+        self.assertEqual(calls, [21])
+        self.assertEqual(profiler.summary(), [])
+
+    def test_config_loader_toggles_profiling(self):
+        config = {"enabled": True, "sample_rate": 1.0}
+        self.profiler.set_enabled(False)
+        self.profiler.configure(config_loader=lambda: config, config_refresh_seconds=0)
+        self.assertTrue(self.profiler.should_sample())
+        config["enabled"] = False
+        self.assertFalse(self.profiler.should_sample())
+
+if __name__ == '__main__':
+    unittest.main()
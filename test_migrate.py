@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from migrate import list_migrations, apply_migrations, MIGRATIONS_DIR
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if sql.startswith("insert into schema_migrations"):
+            self.conn.applied.append(params[0])
+        elif sql.startswith("select version from schema_migrations"):
+            self._rows = [(v,) for v in sorted(self.conn.applied)]
+        elif not sql.startswith("create table if not exists schema_migrations"):
+            self.conn.executed.append(sql)
+
+    def fetchall(self):
+        return self._rows
+
+class FakeConnection:
+    def __init__(self, applied=()):
+        self.applied = list(applied)
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+class TestMigrations(unittest.TestCase):
+
+    def test_shipped_migrations_are_ordered(self):
+        versions = [version for version, _ in list_migrations(MIGRATIONS_DIR)]
+        self.assertEqual(versions, sorted(versions))
+        self.assertEqual(versions[0], "0001")
+
+    def test_apply_skips_applied_and_stops_at_target(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("0001_a.sql", "0002_b.sql", "0003_c.sql", "notes.txt"):
+                with open(os.path.join(tmpdir, name), "w") as f:
+                    f.write(f"-- {name}")
+            conn = FakeConnection(applied=["0001"])
+            applied = apply_migrations(conn, target="0002", migrations_dir=tmpdir)
+            self.assertEqual(applied, ["0002"])
+            self.assertEqual(conn.executed, ["-- 0002_b.sql"])
+            self.assertEqual(apply_migrations(conn, migrations_dir=tmpdir), ["0003"])
+
+    def test_duplicate_versions_rejected(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("0001_a.sql", "0001_b.sql"):
+                open(os.path.join(tmpdir, name), "w").close()
+            with self.assertRaises(ValueError):
+                list_migrations(tmpdir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+from overdue_scanner import OverdueScanner, FileReminderSender
+
+class FakeRentals:
+    """In-memory stand-in for the rentals table."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetch_calls = []
+
+    def fetch_newly_overdue(self, after, before):
+        self.fetch_calls.append((after, before))
+        return [r for r in self.rows if r['status'] == 'confirmed' and r['end_date'] < before and (after is None or r['end_date'] > after)]
+
+    def mark_overdue(self, ids):
+        count = 0
+        for r in self.rows:
+            if r['id'] in ids and r['status'] == 'confirmed':
+                r['status'] = 'overdue'
+                count += 1
+        return count
+
+class RecordingSender:
+    def __init__(self):
+        self.batches = []
+
+    def send_batch(self, notices):
+        self.batches.append(list(notices))
+
+def _rental(rental_id, end_date):
+    return {'id': rental_id, 'equipment_id': 'EQP-001', 'user_id': 'u1', 'borrower_name': '홍길동',
+            'end_date': end_date, 'status': 'confirmed', 'equipments': {'name': '현미경'}}
+
+class TestOverdueScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmpdir.name, "state.json")
+        self.today = date(2030, 3, 10)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _scanner(self, rentals, sender, batch_size=50):
+        return OverdueScanner(rentals.fetch_newly_overdue, rentals.mark_overdue, sender, self.state_path,
+                              reminder_batch_size=batch_size, today_fn=lambda: self.today)
+
+    def test_marks_past_due_and_batches_reminders(self):
+        rentals = FakeRentals([_rental(i, "2030-03-0%d" % (i + 1)) for i in range(5)] + [_rental(9, "2030-03-10")])
+        sender = RecordingSender()
+        result = self._scanner(rentals, sender, batch_size=2).run_once()
+        self.assertEqual(result['marked'], 5)
+        self.assertEqual([len(b) for b in sender.batches], [2, 2, 1])
+        self.assertEqual(rentals.rows[-1]['status'], 'confirmed', "Due today is not overdue yet")
+
+    def test_scans_from_high_water_mark_minus_rescan_window(self):
+        rentals = FakeRentals([_rental(1, "2030-03-05")])
+        scanner = self._scanner(rentals, RecordingSender())
+        scanner.run_once()
+        self.assertEqual(scanner.run_once()['found'], 0, "Same day: already marked")
+        self.assertEqual(scanner.load_high_water_mark(), "2030-03-09")
+        self.today = date(2030, 3, 12)
+        rentals.rows.append(_rental(2, "2030-03-10"))
+        self.assertEqual(scanner.run_once()['found'], 1)
+        self.assertEqual(rentals.fetch_calls[-1], ("2030-03-02", "2030-03-12"))
+
+    def test_late_commit_behind_mark_is_caught(self):
+        rentals = FakeRentals([])
+        sender = RecordingSender()
+        scanner = self._scanner(rentals, sender)
+        scanner.run_once()
+        rentals.rows.append(_rental(1, "2030-03-06")) # Journal entry committed after an outage
+        self.assertEqual(scanner.run_once()['marked'], 1)
+        self.assertEqual([n['rental_id'] for b in sender.batches for n in b], [1])
+
+    def test_partial_failure_is_resumed_with_reminders(self):
+        rentals = FakeRentals([_rental(i, "2030-03-05") for i in range(1, 5)])
+        sender = RecordingSender()
+        calls = []
+        def flaky_mark(ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise ConnectionError("backend down")
+            return rentals.mark_overdue(ids)
+        scanner = OverdueScanner(rentals.fetch_newly_overdue, flaky_mark, sender, self.state_path,
+                                 reminder_batch_size=2, today_fn=lambda: self.today)
+        with self.assertRaises(ConnectionError):
+            scanner.run_once()
+        self.assertIsNone(scanner.load_high_water_mark())
+        self.assertEqual(scanner.run_once()['marked'], 2)
+        self.assertEqual([r['status'] for r in rentals.rows], ['overdue'] * 4)
+        reminded = [n['rental_id'] for b in sender.batches for n in b]
+        self.assertEqual(sorted(set(reminded)), [1, 2, 3, 4], "Every overdue rental got a reminder")
+        self.assertEqual(reminded.count(1), 1, "Chunks marked before the failure are not reminded again")
+
+    def test_rentals_the_update_missed_are_not_reminded_twice(self):
+        rentals = FakeRentals([_rental(1, "2030-03-05"), _rental(2, "2030-03-06")])
+        sender = RecordingSender()
+        missed = []
+        def lossy_mark(ids):
+            missed.extend(ids[1:]) # E.g. the row was locked by a concurrent edit
+            return rentals.mark_overdue(ids[:1])
+        scanner = OverdueScanner(rentals.fetch_newly_overdue, lossy_mark, sender, self.state_path,
+                                 today_fn=lambda: self.today)
+        self.assertEqual(scanner.run_once()['marked'], 1)
+        self.assertEqual(scanner.load_high_water_mark(), "2030-03-09")
+        self.today = date(2030, 3, 11)
+        scanner.mark_overdue = rentals.mark_overdue
+        result = scanner.run_once()
+        self.assertEqual((result['marked'], result['reminders']), (1, 0))
+        self.assertEqual([n['rental_id'] for b in sender.batches for n in b], [1, 2])
+        # Extended after its reminder and overdue again: a new reminder for the new end_date
+        rentals.rows[1].update(status='confirmed', end_date="2030-03-10")
+        self.assertEqual(scanner.run_once()['reminders'], 1)
+        self.today = date(2030, 3, 30) # Out of the window: forgotten
+        scanner.run_once()
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)['reminded'], {})
+
+    def test_failed_reminders_leave_rentals_confirmed(self):
+        rentals = FakeRentals([_rental(1, "2030-03-05")])
+        class FailingSender:
+            def send_batch(self, notices):
+                raise OSError("mail relay down")
+        with self.assertRaises(OSError):
+            self._scanner(rentals, FailingSender()).run_once()
+        self.assertEqual(rentals.rows[0]['status'], 'confirmed')
+
+    def test_file_sender_writes_json_lines(self):
+        path = os.path.join(self.tmpdir.name, "reminders.jsonl")
+        self._scanner(FakeRentals([_rental(1, "2030-03-05")]), FileReminderSender(path)).run_once()
+        with open(path, encoding="utf-8") as f:
+            notices = [json.loads(line) for line in f]
+        self.assertEqual(notices[0]['equipment_name'], '현미경')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from backend_calls import CheckViolation
+from rental_journal import RentalJournal, STATUS_COMMITTED, STATUS_PENDING, STATUS_REJECTED, MAX_ATTEMPTS
+
+def _rental(equipment_id="EQP-001", start="2030-03-02", end="2030-03-04", user_id="user-1"):
+    return {"equipment_id": equipment_id, "start_date": start, "end_date": end,
+            "borrower_name": "홍길동", "purpose": "실험", "user_id": user_id, "status": "confirmed"}
+
+class FakeBackend:
+    """Stand-in for commit_rental_batch: stores rows by idempotency key, optionally failing."""
+    def __init__(self):
+        self.rows = {}
+        self.fail = False
+        self.calls = 0
+
+    def commit_batch(self, rows):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("backend unavailable")
+        outcomes = {}
+        for row in rows:
+            self.rows.setdefault(row["idempotency_key"], row)
+            outcomes[row["idempotency_key"]] = (STATUS_COMMITTED, "성공: 대여 신청 완료.")
+        return outcomes
+
+class TestRentalJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "journal.db")
+        self.backend = FakeBackend()
+        self.journal = RentalJournal(self.path, self.backend.commit_batch)
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmpdir.cleanup()
+
+    def test_submit_acknowledges_then_commits(self):
+        key, msg = self.journal.submit(_rental())
+        self.assertIsNotNone(key)
+        self.assertIn("접수됨", msg)
+        self.assertEqual(self.journal.get_outcome(key)[0], STATUS_PENDING)
+        self.assertEqual(self.journal.flush_once(), 1)
+        self.assertEqual(self.journal.get_outcome(key)[0], STATUS_COMMITTED)
+
+    def test_pending_requests_limited_by_quantity(self):
+        journal = RentalJournal(os.path.join(self.tmpdir.name, "quantity.db"), self.backend.commit_batch,
+                                booked_units_loader=lambda eq_id: (2, []))
+        self.assertIsNotNone(journal.submit(_rental(user_id="user-1"))[0])
+        self.assertIsNotNone(journal.submit(_rental(start="2030-03-04", end="2030-03-06", user_id="user-2"))[0])
+        key, msg = journal.submit(_rental(start="2030-03-03", end="2030-03-05", user_id="user-3"))
+        self.assertIsNone(key, "Both units are taken on the 4th")
+        self.assertIn("오류", msg)
+        self.assertIsNotNone(journal.submit(_rental(start="2030-03-05", end="2030-03-06", user_id="user-3"))[0])
+        journal.close()
+
+    def test_booked_units_checked(self):
+        # One unit busy on the 1st-2nd, the other on the 4th: neither is free for the whole 2nd-4th
+        journal = RentalJournal(os.path.join(self.tmpdir.name, "booked.db"), self.backend.commit_batch,
+                                booked_units_loader=lambda eq_id: (2, [("2030-03-01", "2030-03-02", 1), ("2030-03-04", "2030-03-04", 2)]))
+        key, _ = journal.submit(_rental())
+        self.assertIsNone(key)
+        self.assertIsNotNone(journal.submit(_rental(start="2030-03-03", end="2030-03-03"))[0])
+        journal.close()
+
+    def test_booked_cache_invalidated_by_shared_version(self):
+        version = {"rentals": 0}
+        booked = []
+        committed = []
+        journal = RentalJournal(os.path.join(self.tmpdir.name, "versioned.db"), self.backend.commit_batch,
+                                booked_units_loader=lambda eq_id: (1, list(booked)),
+                                cache_version=lambda: version["rentals"], on_committed=lambda: committed.append(1))
+        key, _ = journal.submit(_rental(user_id="user-1"))
+        journal.flush_once()
+        self.assertEqual(committed, [1])
+        booked.append(("2030-04-01", "2030-04-02", 1)) # booked through another worker
+        version["rentals"] += 1
+        key, _ = journal.submit(_rental(start="2030-04-02", end="2030-04-03", user_id="user-2"))
+        self.assertIsNone(key, "Cached intervals must be reloaded after the version bump")
+        journal.close()
+
+    def test_duplicate_submit_journaled_once(self):
+        first_key, _ = self.journal.submit(_rental())
+        second_key, _ = self.journal.submit(_rental())
+        self.assertEqual(first_key, second_key)
+        self.assertEqual(self.journal.pending_count(), 1)
+
+    def test_backend_failure_keeps_entries_pending_and_replay_is_idempotent(self):
+        key, _ = self.journal.submit(_rental())
+        self.backend.fail = True
+        with self.assertRaises(ConnectionError):
+            self.journal.flush_once()
+        self.assertEqual(self.journal.get_outcome(key)[0], STATUS_PENDING)
+        self.backend.fail = False
+        self.journal.flush_once()
+        self.journal.flush_once()
+        self.assertEqual(len(self.backend.rows), 1)
+
+    def test_pending_entries_survive_reopen(self):
+        key, _ = self.journal.submit(_rental())
+        self.journal.close()
+        self.journal = RentalJournal(self.path, self.backend.commit_batch)
+        self.assertEqual(self.journal.pending_count(), 1)
+        self.journal.flush_once()
+        self.assertEqual(self.journal.get_outcome(key)[0], STATUS_COMMITTED)
+
+    def test_rejection_reported(self):
+        journal = RentalJournal(os.path.join(self.tmpdir.name, "reject.db"),
+                                lambda rows: {r["idempotency_key"]: (STATUS_REJECTED, "오류: 수량 없음") for r in rows})
+        key, _ = journal.submit(_rental())
+        journal.flush_once()
+        self.assertEqual(journal.get_outcome(key), (STATUS_REJECTED, "오류: 수량 없음"))
+        retry_key, msg = journal.submit(_rental())
+        self.assertNotEqual(retry_key, key, "A rejected request can be submitted again for the same period")
+        self.assertEqual(journal.get_outcome(retry_key)[0], STATUS_PENDING)
+        journal.close()
+
+    def test_refused_entry_is_isolated_and_rejected_after_max_attempts(self):
+        def commit_batch(rows):
+            if any(row["borrower_name"] == "bad" for row in rows):
+                raise CheckViolation('new row violates check constraint "rentals_dates_check"', "23514")
+            return self.backend.commit_batch(rows)
+        journal = RentalJournal(os.path.join(self.tmpdir.name, "poison.db"), commit_batch)
+        bad_key, _ = journal.submit(dict(_rental(), borrower_name="bad"))
+        good_key, _ = journal.submit(_rental(equipment_id="EQP-002"))
+        journal.flush_once() # The whole batch is refused
+        self.assertEqual(journal.get_outcome(good_key)[0], STATUS_PENDING)
+        for _ in range(MAX_ATTEMPTS - 1):
+            journal.flush_once() # The refused entries now go one at a time
+        self.assertEqual(journal.get_outcome(bad_key)[0], STATUS_REJECTED)
+        journal.flush_once()
+        self.assertEqual(journal.get_outcome(good_key)[0], STATUS_COMMITTED)
+        journal.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import tempfile
+import time
+import threading
+import unittest
+from types import SimpleNamespace
+from cryptography.fernet import Fernet
+from session_store import (
+    SessionStore,
+    MemorySessionStore,
+    SQLiteSessionStore,
+    SharedCache,
+    create_session_store,
+    serialize_user_session,
+    deserialize_user_session,
+)
+
+class TestSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "sessions.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_values_visible_to_other_worker(self):
+        worker_a = SQLiteSessionStore(self.path)
+        worker_b = SQLiteSessionStore(self.path) # Separate connection, as in another process
+        worker_a.set("sess-1", selected_equipment_ids=["EQP-001"], search_ref={"snapshot_id": "search-abc", "view": {}})
+        self.assertEqual(worker_b.get("sess-1", "selected_equipment_ids"), ["EQP-001"])
+        self.assertEqual(worker_b.get("sess-1", "missing", []), [])
+        worker_b.delete_session("sess-1")
+        self.assertIsNone(worker_a.get("sess-1", "search_ref"))
+
+    def test_keys_updated_independently(self):
+        store = SQLiteSessionStore(self.path)
+        store.set("sess-1", pending_rental_keys=["k1"])
+        store.set("sess-1", selected_equipment_ids=[])
+        self.assertEqual(store.get("sess-1", "pending_rental_keys"), ["k1"], "Writing one key must not drop others")
+
+    def test_tokens_encrypted_at_rest(self):
+        session = SimpleNamespace(access_token="access-secret", refresh_token="refresh-secret", expires_at=1700000000,
+                                  user=SimpleNamespace(id="uuid-1", email="user@example.com"))
+        key = Fernet.generate_key().decode()
+        SQLiteSessionStore(self.path, encryption_key=key).set("sess-1", user_session=serialize_user_session(session), selected_equipment_ids=["EQP-001"])
+        with sqlite3.connect(self.path) as conn:
+            raw = dict(conn.execute("SELECT key, value FROM session_values").fetchall())
+        self.assertNotIn("refresh-secret", raw["user_session"])
+        self.assertEqual(raw["selected_equipment_ids"], '["EQP-001"]')
+        restored = deserialize_user_session(SQLiteSessionStore(self.path, encryption_key=key).get("sess-1", "user_session"))
+        self.assertEqual(restored.refresh_token, "refresh-secret")
+        other_key = Fernet.generate_key().decode()
+        self.assertIsNone(SQLiteSessionStore(self.path, encryption_key=other_key).get("sess-1", "user_session"), "Unreadable tokens mean signed out")
+
+    def test_workers_share_generated_key(self):
+        worker_a = SQLiteSessionStore(self.path)
+        worker_a.set("sess-1", user_session={"user": {"id": "uuid-1"}, "refresh_token": "r"})
+        self.assertEqual(SQLiteSessionStore(self.path).get("sess-1", "user_session")["refresh_token"], "r")
+        self.assertEqual(os.stat(self.path + ".key").st_mode & 0o777, 0o600)
+
+    def test_settings_survive_session_purge(self):
+        store = SQLiteSessionStore(self.path, ttl_seconds=0)
+        store.set_setting("profiling", {"enabled": True, "sample_rate": 0.5})
+        store.set("sess-1", selected_equipment_ids=[])
+        time.sleep(0.01)
+        for _ in range(500): # Purges expired session values on the 500th write
+            store.set("sess-2", selected_equipment_ids=[])
+        self.assertIsNone(store.get("sess-1", "selected_equipment_ids"))
+        self.assertEqual(store.get_setting("profiling"), {"enabled": True, "sample_rate": 0.5})
+        memory = MemorySessionStore()
+        memory.set_setting("profiling", {"enabled": False})
+        self.assertEqual(memory.get_setting("profiling"), {"enabled": False})
+        self.assertIsNone(memory.get_setting("missing"))
+
+    def test_store_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            SessionStore()
+
+    def test_concurrent_version_bumps_are_not_lost(self):
+        store = SQLiteSessionStore(self.path)
+        threads = [threading.Thread(target=lambda: [store.bump_version("rentals") for _ in range(20)]) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(SQLiteSessionStore(self.path).get_version("rentals"), 80)
+
+    def test_shared_cache_invalidated_by_other_worker(self):
+        loads = []
+        def loader():
+            loads.append(1)
+            return len(loads)
+        cache_a = SharedCache(SQLiteSessionStore(self.path))
+        cache_b = SharedCache(SQLiteSessionStore(self.path))
+        self.assertEqual(cache_a.get_or_load("equipments", "detail", loader), 1)
+        self.assertEqual(cache_a.get_or_load("equipments", "detail", loader), 1)
+        cache_b.invalidate("equipments")
+        self.assertEqual(cache_a.get_or_load("equipments", "detail", loader), 2)
+        self.assertEqual(cache_a.get_or_load("other", "x", lambda: None, cache_if=bool), None)
+        self.assertEqual(cache_a.get_or_load("other", "x", lambda: "loaded", cache_if=bool), "loaded", "Rejected results are not cached")
+
+    def test_user_session_round_trip(self):
+        session = SimpleNamespace(access_token="a", refresh_token="r", expires_at=1700000000,
+                                  user=SimpleNamespace(id="uuid-1", email="user@example.com"))
+        store = create_session_store("memory://")
+        self.assertIsInstance(store, MemorySessionStore)
+        store.set("sess-1", user_session=serialize_user_session(session))
+        restored = deserialize_user_session(store.get("sess-1", "user_session"))
+        self.assertEqual((restored.user.id, restored.user.email, restored.expires_at), ("uuid-1", "user@example.com", 1700000000))
+        self.assertIsNone(deserialize_user_session(serialize_user_session(None)))
+        with self.assertRaises(ValueError):
+            create_session_store("redis://localhost")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import pandas as pd
+from snapshot_store import SnapshotStore, compact_dtypes, make_snapshot_ref, resolve_snapshot_ref, get_snapshot_store
+
+def _equipment_df(available: int = 3) -> pd.DataFrame:
+    return pd.DataFrame({
+        'ID': ['EQP-001', 'EQP-002', 'EQP-003', 'EQP-004'],
+        '부서': ['물리과', '물리과', '화학과', '물리과'],
+        '총량': [5, 5, 5, 5],
+        '가용량': [available, 5, 5, 5],
+    })
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def test_identical_results_share_one_snapshot(self):
+        store = SnapshotStore()
+        first = store.put("search", _equipment_df())
+        second = store.put("search", _equipment_df())
+        self.assertEqual(first, second, "Same content should reuse the snapshot")
+        self.assertEqual(len(store), 1)
+
+    def test_different_content_gets_new_id(self):
+        store = SnapshotStore()
+        first = store.put("search", _equipment_df(available=3))
+        second = store.put("search", _equipment_df(available=2))
+        self.assertNotEqual(first, second)
+        self.assertTrue(second.startswith("search-"))
+
+    def test_ids_are_stable_across_processes(self):
+        # Another worker storing the same result must arrive at the same ID
+        self.assertEqual(SnapshotStore().put("search", _equipment_df()), SnapshotStore().put("search", _equipment_df()))
+        self.assertNotEqual(SnapshotStore().put("search", _equipment_df()), SnapshotStore().put("rentals", _equipment_df()))
+
+    def test_least_recently_used_snapshot_evicted_beyond_cap(self):
+        store = SnapshotStore(max_snapshots=2)
+        first = store.put("search", _equipment_df(available=1))
+        second = store.put("search", _equipment_df(available=2))
+        store.get(first) # Reading keeps it recent
+        store.put("search", _equipment_df(available=3))
+        self.assertIsNotNone(store.get(first))
+        self.assertIsNone(store.get(second))
+        self.assertEqual(len(store), 2)
+
+    def test_idle_snapshots_expire(self):
+        now = [0.0]
+        store = SnapshotStore(idle_ttl=60, clock=lambda: now[0])
+        first = store.put("search", _equipment_df(available=1))
+        now[0] += 45
+        second = store.put("search", _equipment_df(available=2))
+        now[0] += 30
+        store.put("search", _equipment_df(available=3))
+        self.assertIsNone(store.get(first), "Not read for longer than the TTL")
+        self.assertIsNotNone(store.get(second))
+
+    def test_resolve_reloads_missing_snapshot_when_content_matches(self):
+        ref = make_snapshot_ref("search", _equipment_df(available=4), department="물리과")
+        get_snapshot_store()._drop_locked(ref["snapshot_id"]) # as if made by another worker
+        views = []
+        def reload(view):
+            views.append(view)
+            return _equipment_df(available=4)
+        self.assertIsNotNone(resolve_snapshot_ref(ref, reload))
+        self.assertEqual(views, [{"department": "물리과"}])
+
+        changed = make_snapshot_ref("search", _equipment_df(available=0))
+        get_snapshot_store()._drop_locked(changed["snapshot_id"])
+        self.assertIsNone(resolve_snapshot_ref(changed, lambda view: _equipment_df(available=1)),
+                          "Rows no longer line up with what the user saw")
+
+    def test_compact_dtypes(self):
+        compact = compact_dtypes(_equipment_df())
+        self.assertEqual(str(compact['부서'].dtype), 'category')
+        self.assertEqual(compact['총량'].dtype.itemsize, 1)
+        self.assertNotEqual(str(compact['ID'].dtype), 'category', "Unique IDs stay as plain strings")
+
+if __name__ == '__main__':
+    unittest.main()